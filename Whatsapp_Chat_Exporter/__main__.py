@@ -1,28 +1,35 @@
 #!/usr/bin/python3
 
-import io
 import os
 import sqlite3
 import shutil
 import json
 import string
 import glob
+import sys
 import logging
 import importlib.metadata
 from Whatsapp_Chat_Exporter import android_crypt, exported_handler, android_handler
 from Whatsapp_Chat_Exporter import ios_handler, ios_media_handler
-from Whatsapp_Chat_Exporter.data_model import ChatCollection, ChatStore, Timing
+from Whatsapp_Chat_Exporter.data_model import ChatCollection, ChatStore, SpillingChatCollection, Timing
 from Whatsapp_Chat_Exporter.utility import APPLE_TIME, CURRENT_TZ_OFFSET, Crypt
 from Whatsapp_Chat_Exporter.utility import readable_to_bytes, safe_name, bytes_to_readable
 from Whatsapp_Chat_Exporter.utility import import_from_json, incremental_merge, check_update
 from Whatsapp_Chat_Exporter.utility import telegram_json_format, convert_time_unit, DbType
-from Whatsapp_Chat_Exporter.utility import get_transcription_selection, check_jid_map
+from Whatsapp_Chat_Exporter.utility import SchemaProfile, decode_text, ExportState, import_previous_export
+from Whatsapp_Chat_Exporter.utility import balance_partitions
 from argparse import ArgumentParser, SUPPRESS
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import Counter
+from contextlib import closing, nullcontext
+from functools import partial, partialmethod
 from datetime import datetime
 from getpass import getpass
+from pathlib import Path
+from tempfile import TemporaryDirectory
 from tqdm import tqdm
 from sys import exit
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 from Whatsapp_Chat_Exporter.vcards_contacts import ContactsFromVCards
 
 
@@ -45,6 +52,8 @@ WTSEXPORTER_BANNER = f"""=======================================================
          WhatsApp Chat Exporter: A customizable Android and iOS/iPadOS WhatsApp database parser
 {f"Version: {__version__}".center(104)}
 ========================================================================================================"""
+# The number of messages extracted and written at a time with --streaming
+STREAM_BATCH_SIZE = 100000
 
 
 def setup_argument_parser() -> ArgumentParser:
@@ -251,6 +260,15 @@ def setup_argument_parser() -> ArgumentParser:
               "This enables chat messages and media to be deleted from the device to free up space, while ensuring they are preserved in the exported backups."
               )
     )
+    inc_merging_group.add_argument(
+        "--delta",
+        dest="delta",
+        default=False,
+        action='store_true',
+        help=("Only extract the messages newer than the last run with the same output and settings, "
+              "and merge them into the chats of its JSON file (requires -j). "
+              "The last message of each chat is recorded in the output directory for the next run.")
+    )
     inc_merging_group.add_argument(
         "--source-dir",
         dest="source_dir",
@@ -288,12 +306,62 @@ def setup_argument_parser() -> ArgumentParser:
     )
     misc_group.add_argument(
         "--decrypt-chunk-size", dest="decrypt_chunk_size", default=1 * 1024 * 1024, type=int,
-        help="Specify the chunk size for decrypting iOS backup, which may affect the decryption speed."
+        help=("Specify the chunk size for decrypting iOS backup and for streaming Android backup "
+              "decryption, which may affect the decryption speed.")
+    )
+    misc_group.add_argument(
+        "--stream-decrypt", dest="stream_decrypt", default=False, action='store_true',
+        help=("Decrypt Android backup chunk by chunk straight to disk, keeping memory usage low "
+              "regardless of the backup size")
     )
     misc_group.add_argument(
         "--max-bruteforce-worker", dest="max_bruteforce_worker", default=4, type=int,
         help="Specify the maximum number of worker for bruteforce decryption."
     )
+    misc_group.add_argument(
+        "--in-memory", dest="in_memory", default=False, action='store_true',
+        help=("Decrypt Android backup into memory and export from there, without writing the "
+              "decrypted databases to disk (requires Python 3.11 or later)")
+    )
+    misc_group.add_argument(
+        "--optimize-db", dest="optimize_db", default=False, action='store_true',
+        help=("Export from a working copy of the Android message database with extra indexes, which is "
+              "faster on large databases. The original database is never modified")
+    )
+    misc_group.add_argument(
+        "--workers", dest="workers", default=1, type=int,
+        help=("Extract the chats with this number of worker processes, each reading a share of the "
+              "message database (default: 1)")
+    )
+    misc_group.add_argument(
+        "--streaming", dest="streaming", default=False, action='store_true',
+        help=("Extract and write the chats in batches, so that only the chats being written are kept "
+              "in memory (cannot be used with --delta or --workers)")
+    )
+    misc_group.add_argument(
+        "--max-chats-in-memory", dest="max_chats_in_memory", default=None, type=int, metavar="CHATS",
+        help=("Keep the messages of at most this number of chats in memory and those of the others "
+              "in a temporary database, for exports larger than the memory (cannot be used with --workers)")
+    )
+    misc_group.add_argument(
+        "--batch-decrypt", dest="batch_decrypt", default=None, metavar="DIR_OR_GLOB",
+        help=("Decrypt all Android backups in a directory or matching a glob pattern into the output "
+              "directory, skipping those already decrypted, then exit")
+    )
+    misc_group.add_argument(
+        "--offset-cache", dest="offset_cache", default=None, metavar="FILE",
+        help=("Path to the cache of crypt14 offsets found by brute force, e.g. one exported from "
+              "another machine (default: in the user cache directory)")
+    )
+    misc_group.add_argument(
+        "--export-offset-cache", dest="export_offset_cache", default=None, metavar="FILE",
+        help="Export the cache of crypt14 offsets to a file after decryption"
+    )
+    misc_group.add_argument(
+        "--no-count", dest="no_count", default=False, action='store_true',
+        help=("Do not estimate the number of rows before processing a database, progress bars are shown "
+              "without total")
+    )
     misc_group.add_argument(
         "--no-banner", dest="no_banner", default=False, action='store_true',
         help="Do not show the banner"
@@ -326,6 +394,36 @@ def validate_args(parser: ArgumentParser, args) -> None:
             "You must specify both --source-dir and --target-dir for incremental merge.")
     if args.android and args.business:
         parser.error("WhatsApp Business is only available on iOS for now.")
+    if args.batch_decrypt is not None and (not args.android or args.key is None):
+        parser.error("--batch-decrypt must be used with -a and -k.")
+    if args.in_memory:
+        if not args.android or args.backup is None:
+            parser.error("--in-memory must be used with -a and -b.")
+        if args.stream_decrypt or args.batch_decrypt is not None:
+            parser.error("--in-memory cannot be used with --stream-decrypt or --batch-decrypt.")
+        if not hasattr(sqlite3.Connection, "deserialize"):
+            parser.error("--in-memory requires Python 3.11 or later.")
+    if args.delta and (not (args.android or args.ios) or args.json is None
+                       or args.json_per_chat or args.telegram or args.incremental_merge):
+        parser.error("--delta must be used with -a or -i and a single JSON file (-j).")
+    if args.optimize_db and not args.android:
+        parser.error("--optimize-db is only available for Android.")
+    if args.workers < 1:
+        parser.error("--workers must be a positive integer.")
+    if args.workers > 1 and args.in_memory:
+        parser.error("--workers cannot be used with --in-memory.")
+    if args.streaming:
+        if not (args.android or args.ios) or args.incremental_merge:
+            parser.error("--streaming must be used with -a or -i.")
+        if args.delta or args.workers > 1:
+            parser.error("--streaming cannot be used with --delta or --workers.")
+    if args.max_chats_in_memory is not None:
+        if args.max_chats_in_memory < 1:
+            parser.error("--max-chats-in-memory must be a positive integer.")
+        if args.workers > 1:
+            parser.error("--max-chats-in-memory cannot be used with --workers.")
+    if args.decrypt_chunk_size <= 0:
+        parser.error("--decrypt-chunk-size must be a positive integer.")
     if "??" not in args.headline:
         parser.error("--headline must contain '??' for replacement.")
 
@@ -440,6 +538,63 @@ def setup_contact_store(args) -> Optional['ContactsFromVCards']:
     return None
 
 
+def read_key(key: str) -> Tuple[bytes, bool]:
+    """Read the key given with -k, either a HEX key or a key file, and whether it is a key stream."""
+    if not os.path.isfile(key) and all(char in string.hexdigits for char in key.replace(" ", "")):
+        return bytes.fromhex(key.replace(" ", "")), False
+    with open(key, "rb") as f:
+        return f.read(), True
+
+
+def batch_decrypt_android_backups(args) -> int:
+    """Decrypt all backups matched by --batch-decrypt into the output directory and return error code."""
+    if os.path.isdir(args.batch_decrypt):
+        backups = glob.glob(os.path.join(args.batch_decrypt, "*.crypt1[245]"))
+    else:
+        backups = glob.glob(args.batch_decrypt)
+    backups = sorted(b for b in backups if os.path.isfile(b))
+    if not backups:
+        logging.error(f"No backup found with {args.batch_decrypt}")
+        return 1
+
+    # Derive the key once for each encryption version present
+    key, keyfile_stream = read_key(args.key)
+    keys = {}
+    for crypt in {android_crypt.detect_crypt(os.path.basename(b)) for b in backups} - {None}:
+        try:
+            keys[crypt] = android_crypt.load_key(
+                key, crypt, keyfile_stream=keyfile_stream, show_crypt15=args.showkey)
+        except android_crypt.InvalidKeyError as e:
+            logging.error(f"The key cannot decrypt {crypt.name.lower()} backups: {e}")
+
+    logging.info(f"Decrypting {len(backups)} backup(s) into {args.output}...")
+    results = android_crypt.decrypt_batch(
+        backups,
+        keys,
+        args.output,
+        offset_cache=args.offset_cache or android_crypt.default_offset_cache_path(),
+        stream=args.stream_decrypt,
+        chunk_size=args.decrypt_chunk_size
+    )
+
+    # Summary table
+    name_width = max(len(os.path.basename(r.source)) for r in results)
+    logging.info(f"{'Backup':<{name_width}}  {'Status':<9}  {'Size':>10}  {'Output':>10}  "
+                 f"{'Time':>8}  {'Throughput':>12}")
+    for r in results:
+        throughput = f"{bytes_to_readable(int(r.size / r.seconds))}/s" if r.seconds else "-"
+        output_size = bytes_to_readable(r.output_size) if r.output_size else "-"
+        time_taken = f"{r.seconds:.2f}s" if r.seconds else "-"
+        logging.info(f"{os.path.basename(r.source):<{name_width}}  {r.status:<9}  "
+                     f"{bytes_to_readable(r.size):>10}  {output_size:>10}  {time_taken:>8}  {throughput:>12}")
+        if r.error:
+            logging.error(f"{os.path.basename(r.source)}: {r.error}")
+
+    failed = sum(r.status == "failed" for r in results)
+    logging.info(f"Batch decryption finished: {len(results) - failed} succeeded, {failed} failed.")
+    return 1 if failed else 0
+
+
 def decrypt_android_backup(args) -> int:
     """Decrypt Android backup files and return error code."""
     if args.key is None or args.backup is None:
@@ -449,57 +604,52 @@ def decrypt_android_backup(args) -> int:
     logging.info(f"Decryption key specified, decrypting WhatsApp backup...")
 
     # Determine crypt type
-    if "crypt12" in args.backup:
-        crypt = Crypt.CRYPT12
-    elif "crypt14" in args.backup:
-        crypt = Crypt.CRYPT14
-    elif "crypt15" in args.backup:
-        crypt = Crypt.CRYPT15
-    else:
+    crypt = android_crypt.detect_crypt(args.backup)
+    if crypt is None:
         logging.error(
             f"Unknown backup format. The backup file must be crypt12, crypt14 or crypt15.")
         return 1
 
-    # Get key
-    keyfile_stream = False
-    if not os.path.isfile(args.key) and all(char in string.hexdigits for char in args.key.replace(" ", "")):
-        key = bytes.fromhex(args.key.replace(" ", ""))
-    else:
-        key = open(args.key, "rb")
-        keyfile_stream = True
-
-    # Read backup
-    db = open(args.backup, "rb").read()
-
-    # Process WAB if provided
-    error_wa = 0
-    if args.wab:
-        wab = open(args.wab, "rb").read()
-        error_wa = android_crypt.decrypt_backup(
-            wab,
-            key,
-            args.wa,
-            crypt,
-            args.showkey,
-            DbType.CONTACT,
-            keyfile_stream=keyfile_stream,
-            max_worker=args.max_bruteforce_worker
-        )
-        if isinstance(key, io.IOBase):
-            key.seek(0)
+    # Get key, parsed once and shared by both backups
+    key, keyfile_stream = read_key(args.key)
+    key = android_crypt.load_key(
+        key, crypt, keyfile_stream=keyfile_stream, show_crypt15=args.showkey)
 
-    # Decrypt message database
-    error_message = android_crypt.decrypt_backup(
-        db,
-        key,
-        args.db,
-        crypt,
-        args.showkey,
-        DbType.MESSAGE,
-        keyfile_stream=keyfile_stream,
-        max_worker=args.max_bruteforce_worker
+    offset_cache = android_crypt.OffsetCache(
+        args.offset_cache or android_crypt.default_offset_cache_path()
     )
 
+    # Backups are passed as paths and memory-mapped. The message database and the
+    # WAB (if provided) are decrypted concurrently, as AES-GCM and zlib release the GIL.
+    decrypt = partial(
+        android_crypt.decrypt_backup,
+        key=key,
+        crypt=crypt,
+        max_worker=args.max_bruteforce_worker,
+        stream=args.stream_decrypt,
+        chunk_size=args.decrypt_chunk_size,
+        offset_cache=offset_cache,
+        in_memory=args.in_memory
+    )
+    # With --in-memory, the decrypted databases are kept for open_database() instead of written
+    output_wa, output_message = (None, None) if args.in_memory else (args.wa, args.db)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        future_wa = None
+        if args.wab:
+            future_wa = executor.submit(decrypt, args.wab, output=output_wa, db_type=DbType.CONTACT)
+        future_message = executor.submit(decrypt, args.backup, output=output_message, db_type=DbType.MESSAGE)
+        error_wa = future_wa.result() if future_wa is not None else 0
+        error_message = future_message.result()
+
+    if args.in_memory:
+        if future_wa is not None:
+            args.wa_image, error_wa = error_wa, 0
+        args.db_image, error_message = error_message, 0
+
+    if args.export_offset_cache:
+        offset_cache.save(args.export_offset_cache)
+        logging.info(f"Offset cache exported to {args.export_offset_cache}")
+
     # Handle errors
     if error_wa != 0:
         return error_wa
@@ -521,25 +671,63 @@ def handle_decrypt_error(error: int) -> None:
         exit(5)
 
 
+def open_database(path: str, image: Optional[bytes] = None, read_only: bool = False) -> sqlite3.Connection:
+    """Open a database from its path, or from its decrypted image if it was kept in memory."""
+    if image is None:
+        if read_only:
+            return sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True)
+        return sqlite3.connect(path)
+    db = sqlite3.connect(":memory:")
+    db.deserialize(image)
+    return db
+
+
 def process_contacts(args, data: ChatCollection) -> None:
     """Process contacts from the database."""
     contact_db = args.wa if args.wa else "wa.db" if args.android else "ContactsV2.sqlite"
+    # The image is copied by SQLite, so release it as soon as it is loaded
+    image, args.wa_image = getattr(args, "wa_image", None), None
 
-    if os.path.isfile(contact_db):
-        with sqlite3.connect(contact_db) as db:
+    if image is not None or os.path.isfile(contact_db):
+        with open_database(contact_db, image) as db:
             db.row_factory = sqlite3.Row
-            db.text_factory = lambda b: b.decode(encoding="utf-8", errors="replace")
+            db.text_factory = decode_text
             if args.android:
                 android_handler.contacts(db, data, args.enrich_from_vcards)
             else:
                 ios_handler.contacts(db, data)
 
 
+def load_export_state(args, data: ChatCollection) -> ExportState:
+    """
+    Load the state of the last delta export and the chats it exported, so that only
+    newer messages are extracted. A new state is returned if a full export is needed.
+    """
+    settings = {
+        "device": "android" if args.android else "ios",
+        "json": os.path.abspath(args.json),
+        "filter_date": args.filter_date,
+        "filter_chat": [args.filter_chat_include, args.filter_chat_exclude],
+        "filter_empty": args.filter_empty
+    }
+    state = ExportState.load(args.output, settings)
+    if state is None or state.message_id is None or not os.path.isfile(args.json):
+        logging.info("No previous delta export found, all messages will be exported.")
+        return ExportState(settings)
+
+    import_previous_export(args.json, data)
+    data.set_system("last_message_id", state.message_id)
+    data.set_system("last_reaction_id", state.reaction_id)
+    logging.info(f"Exporting the messages after {state.message_id}...")
+    return state
+
+
 def process_messages(args, data: ChatCollection) -> None:
     """Process messages, media and vcards from the database."""
     msg_db = args.db if args.db else "msgstore.db" if args.android else args.identifiers.MESSAGE
+    image, args.db_image = getattr(args, "db_image", None), None
 
-    if not os.path.isfile(msg_db):
+    if image is None and not os.path.isfile(msg_db):
         logging.error(
             "The message database does not exist. You may specify the path "
             "to database file with option -d or check your provided path."
@@ -549,38 +737,171 @@ def process_messages(args, data: ChatCollection) -> None:
     filter_chat = (args.filter_chat_include, args.filter_chat_exclude)
     timing = Timing(args.timezone_offset if args.timezone_offset else CURRENT_TZ_OFFSET)
 
-    with sqlite3.connect(msg_db) as db:
+    # With --optimize-db, the original database is only read to make a working copy
+    with open_database(msg_db, image, read_only=args.optimize_db) as db:
+        from_image = image is not None
+        del image
+        if args.android and args.optimize_db:
+            with TemporaryDirectory(prefix="wtsexporter-") as tmp_dir:
+                # A decrypted image is already a private copy, so it is indexed in place
+                copy_path = None if from_image else os.path.join(tmp_dir, "msgstore.db")
+                working_copy = android_handler.optimize_database(db, copy_path)
+                try:
+                    extract_messages(args, working_copy, data, filter_chat, timing, copy_path)
+                finally:
+                    if working_copy is not db:
+                        working_copy.close()
+        else:
+            extract_messages(args, db, data, filter_chat, timing, None if from_image else msg_db)
+
+
+def extract_messages(args, db, data: ChatCollection, filter_chat, timing, path: Optional[str] = None) -> None:
+    """
+    Extract messages, media, vcards and calls from an opened message database. With --workers,
+    the chats are extracted in parallel from path, the file of the database, if there is one.
+    """
+    db.row_factory = sqlite3.Row
+    db.text_factory = decode_text
+    if args.android:
+        data.set_system("schema", SchemaProfile.probe(db))
+
+    if args.streaming:
+        # The chats are written batch by batch, calls included
+        stream_chats(args, db, data, filter_chat, timing)
+        return
+    if args.workers > 1 and path is not None:
+        extract_in_parallel(args, db, path, data, filter_chat, timing)
+    else:
+        extract_chats(args, db, data, filter_chat, timing)
+
+    # Process calls
+    process_calls(args, db, data, filter_chat, timing)
+
+
+def extract_in_parallel(args, db, path: str, data: ChatCollection, filter_chat, timing) -> None:
+    """
+    Extract the chats in partitions of about the same number of messages with worker processes,
+    each with its own read-only connection to the database. The partial collections are merged
+    in the order of the partitions, so the result does not depend on which worker finishes first.
+    """
+    handler = android_handler if args.android else ios_handler
+    partitions = handler.chat_partitions(db, data, args.workers)
+    if len(partitions) < 2:
+        extract_chats(args, db, data, filter_chat, timing)
+        return
+
+    logging.info(f"Extracting chats with {len(partitions)} workers...", extra={"clear": True})
+    seed_sizes = {chat_id: len(chat) for chat_id, chat in data.items()}
+    worker = partial(_extract_partition, args, path, data, filter_chat, timing)
+    with ProcessPoolExecutor(max_workers=len(partitions), initializer=_init_worker) as executor:
+        # data is only changed once every partition has been sent to the workers
+        partials = list(tqdm(executor.map(worker, partitions), total=len(partitions),
+                             desc="Extracting chats", unit="partition", leave=False))
+
+    sources = Counter()
+    for partial_data in partials:
+        for chat_id, chat in partial_data.items():
+            if len(chat) > seed_sizes.get(chat_id, 0):
+                sources[chat_id] += 1
+            if chat_id in data:
+                data[chat_id].merge_with(chat)
+            else:
+                data.add_chat(chat_id, chat)
+    # Chats whose messages come from several partitions, e.g. those mapped from a LID
+    for chat_id, count in sources.items():
+        if count > 1:
+            data[chat_id].sort_messages()
+
+    reaction_ids = [p.get_system("last_reaction_id") for p in partials]
+    reaction_ids = [i for i in reaction_ids if i is not None]
+    if reaction_ids:
+        data.set_system("last_reaction_id", max(reaction_ids))
+    logging.info(f"Merged the chats of {len(partitions)} partitions")
+
+
+def stream_chats(args, db, data: ChatCollection, filter_chat, timing) -> None:
+    """
+    Extract and write the chats in batches of about STREAM_BATCH_SIZE messages. The messages
+    of a chat are released once it is written, so the memory needed is bounded by the largest
+    batch instead of the whole database. Chats without messages and calls are written last.
+    """
+    handler = android_handler if args.android else ios_handler
+    counts = handler.chat_message_counts(db, data)
+    total = sum(count for _, count in counts)
+    batches = balance_partitions(counts, max(1, -(-total // STREAM_BATCH_SIZE)))
+    logging.info(f"Exporting chats in {len(batches)} batches...", extra={"clear": True})
+
+    written = set()
+    with open_json_stream(args) as json_stream:
+        for partition in tqdm(batches, desc="Exporting chats", unit="batch", leave=False):
+            data.set_system("chat_partition", partition)
+            extract_chats(args, db, data, filter_chat, timing)
+            _write_batch(args, data, written, json_stream)
+        data.set_system("chat_partition", None)
+        process_calls(args, db, data, filter_chat, timing)
+        _write_batch(args, data, written, json_stream, remaining=True)
+    logging.info(f"Exported {len(written)} chats in {len(batches)} batches")
+
+
+def _write_batch(args, data: ChatCollection, written: set, json_stream, remaining: bool = False) -> None:
+    """Write the chats extracted since the last batch, or all the remaining chats, then release them."""
+    batch = ChatCollection()
+    for chat_id, chat in data.items():
+        if chat_id not in written and (remaining or len(chat) > 0):
+            batch.add_chat(chat_id, chat)
+    create_output_files(args, batch, json_stream)
+    for chat_id, chat in batch.items():
+        # The chat is kept for the names of group members, but not its messages
+        chat.clear_messages()
+        written.add(chat_id)
+
+
+def _init_worker() -> None:
+    """
+    Keep the progress of the worker processes quiet, it is shown by the main process. Warnings,
+    errors and tracebacks still reach stderr.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    # The progress bars of the handlers are disabled unless they ask otherwise
+    tqdm.__init__ = partialmethod(tqdm.__init__, disable=True)
+
+
+def _extract_partition(args, path: str, data: ChatCollection, filter_chat, timing, partition) -> ChatCollection:
+    """Extract the chats of one partition in a worker process and return its copy of data."""
+    with closing(open_database(path, read_only=True)) as db:
         db.row_factory = sqlite3.Row
-        db.text_factory = lambda b: b.decode(encoding="utf-8", errors="replace")
+        db.text_factory = decode_text
+        data.set_system("chat_partition", partition)
+        extract_chats(args, db, data, filter_chat, timing)
+    return data
 
-        # Process messages
-        if args.android:
-            message_handler = android_handler
-            data.set_system("jid_map_exists", check_jid_map(db))
-            data.set_system("transcription_selection", get_transcription_selection(db))
-        else:
-            message_handler = ios_handler
 
-        message_handler.messages(
+def extract_chats(args, db, data: ChatCollection, filter_chat, timing) -> None:
+    """Extract messages, media and vcards from an opened message database."""
+    if args.android:
+        # Media and vCards are extracted in the same pass as messages
+        android_handler.messages(
+            db, data, args.media, timing, args.filter_date, filter_chat,
+            args.filter_empty, args.no_reply_ios, args.separate_media, args.fix_dot_files
+        )
+    else:
+        ios_handler.messages(
             db, data, args.media, timing, args.filter_date,
             filter_chat, args.filter_empty, args.no_reply_ios
         )
 
         # Process media
-        message_handler.media(
+        ios_handler.media(
             db, data, args.media, args.filter_date,
             filter_chat, args.filter_empty, args.separate_media, args.fix_dot_files
         )
 
         # Process vcards
-        message_handler.vcard(
+        ios_handler.vcard(
             db, data, args.media, args.filter_date,
             filter_chat, args.filter_empty
         )
 
-        # Process calls
-        process_calls(args, db, data, filter_chat, timing)
-
 
 def process_calls(args, db, data: ChatCollection, filter_chat, timing) -> None:
     """Process call history if available."""
@@ -589,7 +910,7 @@ def process_calls(args, db, data: ChatCollection, filter_chat, timing) -> None:
     elif args.ios and args.call_db_ios is not None:
         with sqlite3.connect(args.call_db_ios) as cdb:
             cdb.row_factory = sqlite3.Row
-            cdb.text_factory = lambda b: b.decode(encoding="utf-8", errors="replace")
+            cdb.text_factory = decode_text
             ios_handler.calls(cdb, data, timing, filter_chat)
 
 
@@ -616,8 +937,8 @@ def handle_media_directory(args) -> None:
                 logging.info(f"Media directory has been copied to the output directory")
 
 
-def create_output_files(args, data: ChatCollection) -> None:
-    """Create output files in the specified formats."""
+def create_output_files(args, data: ChatCollection, json_stream: Optional['JsonStream'] = None) -> None:
+    """Create output files in the specified formats, writing the JSON to json_stream if given."""
     # Create HTML files if requested
     if not args.no_html:
         android_handler.create_html(
@@ -639,7 +960,11 @@ def create_output_files(args, data: ChatCollection) -> None:
 
     # Create JSON files if requested
     if args.json and not args.import_json:
-        export_json(args, data)
+        if json_stream is not None:
+            for chat_id, chat in data.items():
+                json_stream.write(chat_id, chat.to_json())
+        else:
+            export_json(args, data)
 
 
 def export_json(args, data: ChatCollection) -> None:
@@ -669,6 +994,56 @@ def export_single_json(args, data: Dict) -> None:
     logging.info(f"JSON file saved...({bytes_to_readable(len(json_data))})")
 
 
+class JsonStream:
+    """
+    Writes chats one by one to a single JSON file, with the same content as export_single_json()
+    but without converting all chats at once.
+    """
+
+    def __init__(self, path: str, ensure_ascii: bool, indent: Optional[int]) -> None:
+        self.file = open(path, "w")
+        self.ensure_ascii = ensure_ascii
+        self.indent = indent
+        self.count = 0
+        self.size = 0
+
+    def __enter__(self) -> 'JsonStream':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _write(self, text: str) -> None:
+        self.file.write(text)
+        self.size += len(text)
+
+    def write(self, chat_id: str, chat: Dict) -> None:
+        """Write a chat, already converted to JSON-serializable dict."""
+        # The chat as the only member of an object, without the braces around it
+        entry = json.dumps({chat_id: chat}, ensure_ascii=self.ensure_ascii, indent=self.indent)[1:-1]
+        if self.indent is None:
+            self._write(", " if self.count else "{")
+        else:
+            self._write(",\n" if self.count else "{\n")
+        self._write(entry.strip("\n"))
+        self.count += 1
+
+    def close(self) -> None:
+        if self.count == 0:
+            self._write("{}")
+        else:
+            self._write("}" if self.indent is None else "\n}")
+        self.file.close()
+        logging.info(f"JSON file saved...({bytes_to_readable(self.size)})")
+
+
+def open_json_stream(args):
+    """Open a JsonStream if a single JSON file is to be written, otherwise a null context."""
+    if args.json and not args.import_json and not args.json_per_chat and not args.telegram:
+        return JsonStream(args.json, not args.avoid_encoding_json, args.pretty_print_json)
+    return nullcontext()
+
+
 def export_multiple_json(args, data: Dict) -> None:
     """Export data to multiple JSON files, one per chat."""
     # Adjust output path if needed
@@ -792,7 +1167,11 @@ def main():
     os.makedirs(args.output, exist_ok=True)
 
     # Initialize data collection
-    data = ChatCollection()
+    if args.max_chats_in_memory is not None:
+        data = SpillingChatCollection(args.max_chats_in_memory)
+    else:
+        data = ChatCollection()
+    data.set_system("no_count", args.no_count)
 
     # Set up contact store for vCard enrichment if needed
     contact_store = setup_contact_store(args)
@@ -827,6 +1206,10 @@ def main():
             if args.wa is None:
                 args.wa = "wa.db"
 
+            # Decrypt a directory of backups and stop there
+            if args.batch_decrypt is not None:
+                exit(batch_decrypt_android_backups(args))
+
             # Decrypt backup if needed
             if args.key is not None:
                 error = decrypt_android_backup(args)
@@ -876,11 +1259,22 @@ def main():
             if args.android and contact_store and not contact_store.is_empty():
                 contact_store.enrich_from_vcards(data)
 
+            # Continue from the last delta export if possible
+            state = load_export_state(args, data) if args.delta else None
+
             # Process messages, media, and calls
             process_messages(args, data)
 
-            # Create output files
-            create_output_files(args, data)
+            # Create output files, unless they were written while streaming. Spilled chats are
+            # written to a single JSON file one by one rather than converted all at once.
+            if not args.streaming:
+                with open_json_stream(args) if args.max_chats_in_memory else nullcontext() as json_stream:
+                    create_output_files(args, data, json_stream)
+
+            # Record the last messages for the next delta export
+            if state is not None:
+                state.update(data)
+                state.save(args.output)
 
             # Handle media directory
             handle_media_directory(args)
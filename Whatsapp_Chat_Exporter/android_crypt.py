@@ -1,16 +1,21 @@
 import hmac
 import io
+import os
+import sys
+import json
+import time
+import mmap
 import logging
+import threading
 import zlib
 import concurrent.futures
 from tqdm import tqdm
-from typing import Tuple, Union
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
 from hashlib import sha256
 from functools import partial
-from Whatsapp_Chat_Exporter.utility import CRYPT14_OFFSETS, Crypt, DbType
+from Whatsapp_Chat_Exporter.utility import CRYPT14_OFFSETS, Crypt, DbType, write_json_atomic
 
 try:
-    import zlib
     from Crypto.Cipher import AES
 except ModuleNotFoundError:
     support_backup = False
@@ -25,8 +30,6 @@ else:
     support_crypt15 = True
 
 
-
-
 class DecryptionError(Exception):
     """Base class for decryption-related exceptions."""
     pass
@@ -47,6 +50,171 @@ class OffsetNotFoundError(DecryptionError):
     pass
 
 
+BackupData = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+# The backup seen by brute-force worker processes, set once by _init_worker()
+_worker_database = None
+
+
+def _map_backup(path: Union[str, os.PathLike]) -> BackupData:
+    """
+    Map a backup file into memory read-only, so that it is paged in on demand
+    and can be sliced without copying.
+
+    Args:
+        path (str or os.PathLike): The path to the backup file.
+
+    Returns:
+        BackupData: The memory-mapped file, or empty bytes for an empty file.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _close_backup(database: Optional[BackupData]) -> None:
+    """Close a backup mapped by _map_backup(). Nothing is done for any other input."""
+    if isinstance(database, mmap.mmap):
+        try:
+            database.close()
+        except BufferError:
+            # A slice is still referenced, e.g. by the traceback of an exception being raised;
+            # the mapping is then closed when that is released
+            pass
+
+
+def _init_worker(source: Union[str, bytes]) -> None:
+    """
+    Process pool initializer for brute-force workers. The backup is handed over once
+    per worker (re-mapped from its path if available) instead of being pickled with
+    every task.
+
+    Args:
+        source (str or bytes): The path to the backup file or the backup itself.
+    """
+    global _worker_database
+    if isinstance(source, str):
+        source = _map_backup(source)
+    _worker_database = memoryview(source)
+
+
+def default_offset_cache_path() -> str:
+    """Get the path of the crypt14 offset cache in the user cache directory."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "whatsapp-chat-exporter", "crypt14_offsets.json")
+
+
+class OffsetCache:
+    """
+    A JSON file remembering the crypt14 offsets found by brute force, so that later
+    backups from the same device can be decrypted without searching again.
+
+    Entries are keyed by a fingerprint of the backup header up to and including the
+    key signature, and use the same {"iv": ..., "db": ...} form as CRYPT14_OFFSETS.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str, autosave: bool = True) -> None:
+        """
+        Load the cache, starting empty if the file is missing or unreadable.
+
+        Args:
+            path (str): The path to the cache file.
+            autosave (bool, optional): Whether recording offsets saves the file. Worker processes
+                of decrypt_batch() leave saving to the parent. Defaults to True.
+        """
+        self.path = path
+        self.autosave = autosave
+        self.offsets: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable offset cache {path}: {e}")
+            return
+        if isinstance(data, dict) and data.get("version") == self.VERSION:
+            for fingerprint, entry in data.get("offsets", {}).items():
+                if isinstance(entry, dict) and isinstance(entry.get("iv"), int) \
+                        and isinstance(entry.get("db"), int):
+                    self.offsets[fingerprint] = {"iv": entry["iv"], "db": entry["db"]}
+
+    @staticmethod
+    def fingerprint(database: BackupData) -> str:
+        """
+        Fingerprint a crypt14 backup by its header and key signature (bytes 15 to 47,
+        which equal key[30:62] once the signature check has passed).
+        """
+        return sha256(database[:47]).hexdigest()
+
+    def candidates(self, fingerprint: str) -> List[Tuple[int, int, int]]:
+        """
+        Get the cached offsets to try, the ones recorded for this fingerprint first.
+
+        Args:
+            fingerprint (str): The fingerprint of the backup.
+
+        Returns:
+            List[Tuple[int, int, int]]: Start of IV, end of IV and start of database.
+        """
+        entries = list(self.offsets.values())
+        if fingerprint in self.offsets:
+            entries.insert(0, self.offsets[fingerprint])
+        candidates = []
+        for entry in entries:
+            offset_tuple = (entry["iv"], entry["iv"] + 16, entry["db"])
+            if offset_tuple not in candidates:
+                candidates.append(offset_tuple)
+        return candidates
+
+    def add(self, fingerprint: str, iv: int, db: int) -> None:
+        """Record the offsets of a backup and save the cache."""
+        self.update({fingerprint: {"iv": iv, "db": db}})
+
+    def update(self, offsets: Dict[str, Dict[str, int]]) -> None:
+        """
+        Record the offsets of several backups, e.g. found by worker processes, and save the cache once.
+
+        Args:
+            offsets (Dict[str, Dict[str, int]]): The offsets keyed by the fingerprint of each backup.
+        """
+        with self._lock:
+            changed = {k: v for k, v in offsets.items() if self.offsets.get(k) != v}
+            if not changed:
+                return
+            self.offsets.update(changed)
+            if not self.autosave:
+                return
+            try:
+                self._save(self.path)
+            except OSError as e:
+                logging.warning(f"Could not save the offset cache {self.path}: {e}")
+
+    def save(self, path: Optional[str] = None) -> None:
+        """
+        Write the cache atomically.
+
+        Args:
+            path (str, optional): Where to write the cache. Defaults to the path it was loaded from.
+        """
+        with self._lock:
+            self._save(path or self.path)
+
+    def _save(self, path: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        write_json_atomic(path, {"version": self.VERSION, "offsets": self.offsets})
+
+
 def _derive_main_enc_key(key_stream: bytes) -> Tuple[bytes, bytes]:
     """
     Derive the main encryption key for the given key stream.
@@ -95,11 +263,46 @@ def brute_force_offset(max_iv: int = 200, max_db: int = 200):
             yield iv, iv + 16, db
 
 
-def _decrypt_database(db_ciphertext: bytes, main_key: bytes, iv: bytes) -> bytes:
+def _is_zlib_header(header: bytes) -> bool:
+    """Check whether the data starts with a zlib header (deflate, 32K window, valid FCHECK).
+
+    Args:
+        header (bytes): At least the first two bytes of the decrypted stream.
+
+    Returns:
+        bool: True if the bytes form a plausible zlib header.
+    """
+    return len(header) >= 2 and header[0] == 0x78 and ((header[0] << 8) | header[1]) % 31 == 0
+
+
+def _check_header(offset_tuple, database, main_key) -> bool:
+    """Decrypt only the first block at the given offsets and check for a zlib header.
+
+    This is orders of magnitude cheaper than a full GCM decrypt-and-verify and
+    rejects almost all wrong offsets, so it is used to filter brute-force candidates.
+
+    Args:
+        offset_tuple (tuple): Start of IV, end of IV and start of database.
+        database (bytes): The encrypted database.
+        main_key (bytes): The decryption key.
+
+    Returns:
+        bool: True if the offsets are worth a full decryption attempt.
+    """
+    start_iv, end_iv, start_db = offset_tuple
+    iv = database[start_iv:end_iv]
+    first_block = database[start_db:start_db + 16]
+    if len(iv) != 16 or len(first_block) < 2:
+        return False
+    cipher = AES.new(main_key, AES.MODE_GCM, iv)
+    return _is_zlib_header(cipher.decrypt(first_block))
+
+
+def _decrypt_database(db_ciphertext: BackupData, main_key: bytes, iv: bytes) -> bytes:
     """Decrypt and decompress a database chunk.
 
         Args:
-            db_ciphertext (bytes): The encrypted chunk of the database.
+            db_ciphertext (BackupData): The encrypted chunk of the database.
             main_key (bytes): The main decryption key.
             iv (bytes): The initialization vector.
 
@@ -124,7 +327,7 @@ def _decrypt_database(db_ciphertext: bytes, main_key: bytes, iv: bytes) -> bytes
         # This could be key, IV, or tag is wrong, but likely the key is wrong.
         raise ValueError("Decryption/Authentication failed. Ensure you are using the correct key.")
 
-    if len(db_compressed) < 2 or db_compressed[0] != 0x78:
+    if not _is_zlib_header(db_compressed):
         logging.debug(f"Data passes GCM but is not Zlib. Header: {db_compressed[:2].hex()}")
         raise ValueError(
             "Key is correct, but decrypted data is not a valid compressed stream. "
@@ -143,13 +346,114 @@ def _decrypt_database(db_ciphertext: bytes, main_key: bytes, iv: bytes) -> bytes
     return db
 
 
-def _decrypt_crypt14(database: bytes, main_key: bytes, max_worker: int = 10) -> bytes:
+def _decrypt_database_stream(
+    db_ciphertext: BackupData,
+    main_key: bytes,
+    iv: bytes,
+    output: io.IOBase,
+    chunk_size: int = 1 * 1024 * 1024
+) -> int:
+    """Decrypt and decompress a database chunk by chunk, writing it to the output as it goes.
+
+    Only a few chunks are held in memory at any time. The GCM tag is verified after
+    the whole stream has been written, so the caller must discard the output on failure.
+
+        Args:
+            db_ciphertext (BackupData): The encrypted chunk of the database.
+            main_key (bytes): The main decryption key.
+            iv (bytes): The initialization vector.
+            output (io.IOBase): A binary file object receiving the decrypted database.
+            chunk_size (int, optional): The number of bytes processed at once. Defaults to 1MB.
+
+        Returns:
+            int: The size of the decrypted database.
+
+        Raises:
+            zlib.error: If decompression fails.
+            ValueError: If authentication fails or the plaintext is not a SQLite database.
+    """
+    FOOTER_SIZE = 32
+    if len(db_ciphertext) <= FOOTER_SIZE:
+        raise ValueError("Input data too short to contain a valid GCM tag.")
+    if chunk_size <= 0:
+        raise ValueError("The chunk size must be a positive integer.")
+
+    db_ciphertext = memoryview(db_ciphertext)
+    if isinstance(db_ciphertext.obj, mmap.mmap) and hasattr(mmap, "MADV_SEQUENTIAL"):
+        db_ciphertext.obj.madvise(mmap.MADV_SEQUENTIAL)
+    actual_ciphertext = db_ciphertext[:-FOOTER_SIZE]
+    tag = db_ciphertext[-FOOTER_SIZE: -FOOTER_SIZE + 16]
+
+    cipher = AES.new(main_key, AES.MODE_GCM, iv)
+    decompressor = zlib.decompressobj()
+    header = b""
+    written = 0
+
+    def inflate(data):
+        nonlocal header, written
+        while data:
+            # Bound the inflated size so that highly compressible pages don't pile up
+            db = decompressor.decompress(data, chunk_size)
+            data = decompressor.unconsumed_tail
+            if len(header) < 6:
+                header += db[:6]
+                if len(header) >= 6 and not header.startswith(b"SQLite"):
+                    raise ValueError(
+                        "Data is valid and decompressed, but it is not a SQLite database. "
+                        "Is this even a valid WhatsApp database backup?")
+            output.write(db)
+            written += len(db)
+            if decompressor.eof:
+                break
+
+    for start in range(0, len(actual_ciphertext), chunk_size):
+        db_compressed = cipher.decrypt(actual_ciphertext[start:start + chunk_size])
+        if start == 0 and not _is_zlib_header(db_compressed):
+            logging.debug(f"Data is not Zlib. Header: {db_compressed[:2].hex()}")
+            raise ValueError(
+                "Decrypted data is not a valid compressed stream. "
+                "Ensure you are using the correct key."
+            )
+        try:
+            inflate(db_compressed)
+        except zlib.error as e:
+            raise zlib.error(f"Decompression failed (The backup file likely corrupted at source): {e}")
+
+    try:
+        cipher.verify(tag)
+    except ValueError:
+        raise ValueError("Decryption/Authentication failed. Ensure you are using the correct key.")
+
+    tail = decompressor.flush()
+    output.write(tail)
+    written += len(tail)
+    if not decompressor.eof:
+        raise zlib.error(
+            "Decompression failed (The backup file likely corrupted at source): incomplete stream")
+    if len(header) < 6:
+        raise ValueError(
+            "Data is valid and decompressed, but it is not a SQLite database. "
+            "Is this even a valid WhatsApp database backup?")
+    return written
+
+
+def _decrypt_crypt14(
+    database: BackupData,
+    main_key: bytes,
+    max_worker: int = 10,
+    source: Optional[str] = None,
+    offset_cache: Optional[OffsetCache] = None
+) -> bytes:
     """Decrypt a crypt14 database using multithreading for brute-force offset detection.
 
     Args:
-        database (bytes): The encrypted database.
+        database (BackupData): The encrypted database.
         main_key (bytes): The decryption key.
         max_worker (int, optional): The maximum number of threads to use for brute force. Defaults to 10.
+        source (str, optional): The path of the backup file, which lets brute-force workers
+            map the file themselves instead of receiving a copy. Defaults to None.
+        offset_cache (OffsetCache, optional): Offsets found before, tried after the known
+            offsets and updated when brute force succeeds. Defaults to None.
 
     Returns:
         bytes: The decrypted database.
@@ -161,59 +465,221 @@ def _decrypt_crypt14(database: bytes, main_key: bytes, max_worker: int = 10) ->
     if len(database) < 191:
         raise InvalidFileFormatError("The crypt14 file must be at least 191 bytes")
 
-    # Attempt known offsets first
-    for offsets in CRYPT14_OFFSETS:
-        iv = offsets["iv"]
-        db = offsets["db"]
-        try:
-            decrypted_db = _attempt_decrypt_task((iv, iv + 16, db), database, main_key)
-        except (zlib.error, ValueError):
+    # Attempt known and cached offsets first
+    fingerprint = OffsetCache.fingerprint(database)
+    for iv, _, db in _known_offsets(fingerprint, offset_cache):
+        if not _check_header((iv, iv + 16, db), database, main_key):
             continue
-        else:
-            logging.debug(
-                f"Decryption successful with known offsets: IV {iv}, DB {db}"
-            )
-            return decrypted_db  # Successful decryption
+        decrypted_db = _attempt_decrypt_task((iv, iv + 16, db), database, main_key)
+        if decrypted_db is None:
+            continue
+        logging.debug(
+            f"Decryption successful with known offsets: IV {iv}, DB {db}"
+        )
+        if offset_cache is not None and {"iv": iv, "db": db} not in CRYPT14_OFFSETS:
+            offset_cache.add(fingerprint, iv, db)
+        return decrypted_db  # Successful decryption
 
     logging.info(f"Common offsets failed. Will attempt to brute-force")
     offset_max = 200
-    workers = max_worker
-    check_offset = partial(_attempt_decrypt_task, database=database, main_key=main_key)
-    all_offsets = list(brute_force_offset(offset_max, offset_max))
-    executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    all_offsets = _filter_offsets(database, main_key, brute_force_offset(offset_max, offset_max))
+    if not all_offsets:
+        raise OffsetNotFoundError("Could not find the correct offsets for decryption.")
+    logging.debug(f"{len(all_offsets)} offset candidate(s) passed the header check")
+
+    if source is None or max_worker <= 1:
+        # Without a path, every worker would need its own copy of the backup. With a single
+        # worker (e.g. inside a batch worker process), there is nothing to gain from a pool.
+        found = _search_offsets(all_offsets, database, main_key)
+    else:
+        found = _search_offsets_parallel(all_offsets, source, main_key, max_worker)
+    if found is None:
+        raise OffsetNotFoundError("Could not find the correct offsets for decryption.")
+
+    (start_iv, _, start_db), result = found
+    if offset_cache is not None:
+        offset_cache.add(fingerprint, start_iv, start_db)
+    logging.info(
+        f"The offsets of your IV and database are {start_iv} and {start_db}, respectively."
+    )
+    logging.info(
+        f"To include your offsets in the expoter, please report it in the discussion thread on GitHub:"
+    )
+    logging.info(f"https://github.com/KnugiHK/Whatsapp-Chat-Exporter/discussions/47")
+    return result
+
+
+def _search_offsets(all_offsets, database, main_key) -> Optional[Tuple[Tuple[int, int, int], bytes]]:
+    """Try the offset candidates one after another in this process.
+
+    Returns:
+        tuple or None: The offsets that worked and the decrypted database, or None.
+    """
+    with tqdm(total=len(all_offsets), desc="Brute-forcing offsets", unit="trial", leave=False) as pbar:
+        for offset_tuple in all_offsets:
+            result = _attempt_decrypt_task(offset_tuple, database, main_key)
+            pbar.update(1)
+            if result:
+                return offset_tuple, result
+    return None
+
+
+def _search_offsets_parallel(
+    all_offsets,
+    source: str,
+    main_key: bytes,
+    workers: int
+) -> Optional[Tuple[Tuple[int, int, int], bytes]]:
+    """Try the offset candidates in worker processes, each mapping the backup from its path.
+
+    Returns:
+        tuple or None: The offsets that worked and the decrypted database, or None.
+    """
+    check_offset = partial(_attempt_decrypt_worker, main_key=main_key)
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(source,)
+    )
     try:
         with tqdm(total=len(all_offsets), desc="Brute-forcing offsets", unit="trial", leave=False) as pbar:
-            results = executor.map(check_offset, all_offsets, chunksize=8)
-            found = False
+            results = executor.map(check_offset, all_offsets)
             for offset_info, result in zip(all_offsets, results):
                 pbar.update(1)
                 if result:
-                    start_iv, _, start_db = offset_info
                     # Clean shutdown on success
                     executor.shutdown(wait=False, cancel_futures=True)
-                    found = True
-                    break
-        if found:
-            logging.info(
-                f"The offsets of your IV and database are {start_iv} and {start_db}, respectively."
-            )
-            logging.info(
-                f"To include your offsets in the expoter, please report it in the discussion thread on GitHub:"
-            )
-            logging.info(f"https://github.com/KnugiHK/Whatsapp-Chat-Exporter/discussions/47")
-            return result
-
+                    return offset_info, result
     except KeyboardInterrupt:
         executor.shutdown(wait=False, cancel_futures=True)
         logging.info("")
         raise KeyboardInterrupt(
             f"Brute force interrupted by user (Ctrl+C). Shutting down gracefully..."
         )
-    
     finally:
         executor.shutdown(wait=False)
+    return None
+
+
+def _decrypt_crypt14_stream(
+    database: BackupData,
+    main_key: bytes,
+    output: io.IOBase,
+    chunk_size: int = 1 * 1024 * 1024,
+    offset_cache: Optional[OffsetCache] = None
+) -> int:
+    """Decrypt a crypt14 database straight to the output, trying offset candidates in turn.
+
+    Wrong offsets that pass the header check almost always fail within the first chunk,
+    so the candidates are streamed one after another instead of in parallel.
+
+    Args:
+        database (BackupData): The encrypted database.
+        main_key (bytes): The decryption key.
+        output (io.IOBase): A binary file object receiving the decrypted database.
+        chunk_size (int, optional): The number of bytes processed at once. Defaults to 1MB.
+        offset_cache (OffsetCache, optional): Offsets found before, tried after the known
+            offsets and updated on success. Defaults to None.
+
+    Returns:
+        int: The size of the decrypted database.
+
+    Raises:
+        InvalidFileFormatError: If the file is too small.
+        OffsetNotFoundError: If no valid offsets are found.
+    """
+    if len(database) < 191:
+        raise InvalidFileFormatError("The crypt14 file must be at least 191 bytes")
+
+    fingerprint = OffsetCache.fingerprint(database)
+    known_offsets = _known_offsets(fingerprint, offset_cache)
+    candidates = [o for o in known_offsets if _check_header(o, database, main_key)]
+    found = _stream_offsets(candidates, database, main_key, output, chunk_size)
+    if found is None:
+        # A known offset can pass the header check and still fail later on
+        logging.info(f"Common offsets failed. Will attempt to brute-force")
+        candidates = [
+            o for o in _filter_offsets(database, main_key, brute_force_offset(200, 200))
+            if o not in candidates
+        ]
+        found = _stream_offsets(candidates, database, main_key, output, chunk_size)
+    if found is None:
+        raise OffsetNotFoundError("Could not find the correct offsets for decryption.")
+
+    (start_iv, _, start_db), written = found
+    if offset_cache is not None and {"iv": start_iv, "db": start_db} not in CRYPT14_OFFSETS:
+        offset_cache.add(fingerprint, start_iv, start_db)
+    if found[0] not in known_offsets:
+        logging.info(
+            f"The offsets of your IV and database are {start_iv} and {start_db}, respectively."
+        )
+    return written
+
+
+def _stream_offsets(
+    candidates,
+    database: BackupData,
+    main_key: bytes,
+    output: io.IOBase,
+    chunk_size: int
+) -> Optional[Tuple[Tuple[int, int, int], int]]:
+    """Stream the decryption with each offset candidate in turn until one succeeds.
+
+    Returns:
+        tuple or None: The offsets that worked and the size of the decrypted database, or None.
+    """
+    for offset_tuple in candidates:
+        start_iv, end_iv, start_db = offset_tuple
+        if output.seekable() and output.tell():
+            # Discard what a previous candidate has written
+            output.seek(0)
+            output.truncate()
+        try:
+            written = _decrypt_database_stream(
+                database[start_db:], main_key, database[start_iv:end_iv], output, chunk_size
+            )
+        except (zlib.error, ValueError):
+            continue
+        return offset_tuple, written
+    return None
+
+
+def _known_offsets(
+    fingerprint: str,
+    offset_cache: Optional[OffsetCache] = None
+) -> List[Tuple[int, int, int]]:
+    """Get CRYPT14_OFFSETS followed by the cached offsets not already among them."""
+    known = [(o["iv"], o["iv"] + 16, o["db"]) for o in CRYPT14_OFFSETS]
+    if offset_cache is not None:
+        known += [o for o in offset_cache.candidates(fingerprint) if o not in known]
+    return known
+
+
+def _filter_offsets(database, main_key, offsets) -> list:
+    """Keep only the offsets whose first decrypted block looks like a zlib header.
+
+    Args:
+        database (bytes): The encrypted database.
+        main_key (bytes): The decryption key.
+        offsets (Iterable[tuple]): Candidate offsets from brute_force_offset().
+
+    Returns:
+        list: The offsets that passed the header check.
+    """
+    offsets = list(offsets)
+    candidates = []
+    with tqdm(total=len(offsets), desc="Checking offsets", unit="trial", leave=False) as pbar:
+        for offset_tuple in offsets:
+            if _check_header(offset_tuple, database, main_key):
+                candidates.append(offset_tuple)
+            pbar.update(1)
+    return candidates
+
+
+def _attempt_decrypt_worker(offset_tuple, main_key):
+    """Attempt decryption with the given offsets on the backup set up by _init_worker()."""
+    return _attempt_decrypt_task(offset_tuple, _worker_database, main_key)
 
-    raise OffsetNotFoundError("Could not find the correct offsets for decryption.")
 
 def _attempt_decrypt_task(offset_tuple, database, main_key):
     """Attempt decryption with the given offsets."""
@@ -227,11 +693,11 @@ def _attempt_decrypt_task(offset_tuple, database, main_key):
         return None
 
 
-def _decrypt_crypt12(database: bytes, main_key: bytes) -> bytes:
+def _decrypt_crypt12(database: BackupData, main_key: bytes) -> bytes:
     """Decrypt a crypt12 database.
 
         Args:
-            database (bytes): The encrypted database.
+            database (BackupData): The encrypted database.
             main_key (bytes): The decryption key.
 
         Returns:
@@ -240,20 +706,22 @@ def _decrypt_crypt12(database: bytes, main_key: bytes) -> bytes:
         Raises:
             ValueError: If the file format is invalid or the signature mismatches.
     """
+    iv, db_ciphertext = _locate_crypt12(database)
+    return _decrypt_database(db_ciphertext, main_key, iv)
+
+
+def _locate_crypt12(database: BackupData) -> Tuple[BackupData, BackupData]:
+    """Get the IV and the encrypted chunk of a crypt12 database."""
     if len(database) < 67:
         raise InvalidFileFormatError("The crypt12 file must be at least 67 bytes")
-
-    t2 = database[3:35]
-    iv = database[51:67]
-    db_ciphertext = database[67:-20]
-    return _decrypt_database(db_ciphertext, main_key, iv)
+    return database[51:67], database[67:-20]
 
 
-def _decrypt_crypt15(database: bytes, main_key: bytes, db_type: DbType) -> bytes:
+def _decrypt_crypt15(database: BackupData, main_key: bytes, db_type: DbType) -> bytes:
     """Decrypt a crypt15 database.
 
         Args:
-            database (bytes): The encrypted database.
+            database (BackupData): The encrypted database.
             main_key (bytes): The decryption key.
             db_type (DbType): The type of database.
 
@@ -263,6 +731,12 @@ def _decrypt_crypt15(database: bytes, main_key: bytes, db_type: DbType) -> bytes
         Raises:
             ValueError: If the file format is invalid or the signature mismatches.
     """
+    iv, db_ciphertext = _locate_crypt15(database, db_type)
+    return _decrypt_database(db_ciphertext, main_key, iv)
+
+
+def _locate_crypt15(database: BackupData, db_type: DbType) -> Tuple[BackupData, BackupData]:
+    """Get the IV and the encrypted chunk of a crypt15 database."""
     if not support_crypt15:
         raise RuntimeError("Crypt15 is not supported")
     if len(database) < 131:
@@ -276,14 +750,62 @@ def _decrypt_crypt15(database: bytes, main_key: bytes, db_type: DbType) -> bytes
         db_offset = database[0] + 1
     else:
         raise ValueError(f"Invalid db_type: {db_type}")
+    return iv, database[db_offset:]
 
-    db_ciphertext = database[db_offset:]
-    return _decrypt_database(db_ciphertext, main_key, iv)
+
+class BackupKey(NamedTuple):
+    """A parsed backup key, which can be shared by the decryption of several backups."""
+    main_key: bytes
+    signature: Optional[bytes] = None  # Only for crypt12 and crypt14
+
+
+def load_key(
+    key: Union[bytes, io.IOBase],
+    crypt: Crypt = Crypt.CRYPT14,
+    *,
+    keyfile_stream: bool = False,
+    show_crypt15: bool = False
+) -> BackupKey:
+    """
+    Parse the key of a backup once, so that it can be reused for several backups.
+
+    Args:
+        key (bytes or io.IOBase): The key file content, the key file itself or the crypt15 HEX key.
+        crypt (Crypt, optional): The encryption version of the backup. Defaults to Crypt.CRYPT14.
+        keyfile_stream (bool, optional): Whether the key is a key stream. Defaults to False.
+        show_crypt15 (bool, optional): Whether to show the HEX key of the crypt15 backup. Defaults to False.
+
+    Returns:
+        BackupKey: The main decryption key and the signature of the key file.
+
+    Raises:
+        InvalidKeyError: If the key file of crypt12 or crypt14 backup is not 158 bytes.
+        RuntimeError: for dependency errors
+    """
+    if not support_backup:
+        raise RuntimeError("Dependencies for backup decryption are not available.")
+
+    if isinstance(key, io.IOBase):
+        key = key.read()
+
+    if crypt is not Crypt.CRYPT15:
+        if len(key) != 158:
+            raise InvalidKeyError("The key file must be 158 bytes")
+        return BackupKey(key[126:], key[30:62])
+
+    if keyfile_stream:
+        main_key, hex_key = _extract_enc_key(key)
+    else:
+        main_key, hex_key = _derive_main_enc_key(key)
+    if show_crypt15:
+        hex_key_str = ' '.join([hex_key.hex()[c:c+4] for c in range(0, len(hex_key.hex()), 4)])
+        logging.info(f"The HEX key of the crypt15 backup is: {hex_key_str}")
+    return BackupKey(main_key)
 
 
 def decrypt_backup(
-    database: bytes,
-    key: Union[str, io.IOBase],
+    database: Union[BackupData, str, os.PathLike],
+    key: Union[bytes, io.IOBase, BackupKey],
     output: str = None,
     crypt: Crypt = Crypt.CRYPT14,
     show_crypt15: bool = False,
@@ -291,77 +813,317 @@ def decrypt_backup(
     *,
     dry_run: bool = False,
     keyfile_stream: bool = False,
-    max_worker: int = 10
-) -> int:
+    max_worker: int = 10,
+    stream: bool = False,
+    chunk_size: int = 1 * 1024 * 1024,
+    offset_cache: Optional[OffsetCache] = None,
+    in_memory: bool = False
+) -> Union[int, bytes]:
     """
     Decrypt the WhatsApp backup database.
 
     Args:
-        database (bytes): The encrypted database file.
-        key (str or io.IOBase): The key to decrypt the database.
+        database (BackupData, str or os.PathLike): The encrypted database, or the path to it.
+            A path is memory-mapped, and any bytes-like input is sliced without copying.
+        key (bytes, io.IOBase or BackupKey): The key to decrypt the database, or one parsed by load_key().
         output (str, optional): The path to save the decrypted database. Defaults to None.
         crypt (Crypt, optional): The encryption version of the database. Defaults to Crypt.CRYPT14.
         show_crypt15 (bool, optional): Whether to show the HEX key of the crypt15 backup. Defaults to False.
         db_type (DbType, optional): The type of database (MESSAGE or CONTACT). Defaults to DbType.MESSAGE.
         dry_run (bool, optional): Whether to perform a dry run. Defaults to False.
         keyfile_stream (bool, optional): Whether the key is a key stream. Defaults to False.
+        max_worker (int, optional): The maximum number of workers for crypt14 brute force. Defaults to 10.
+        stream (bool, optional): Whether to decrypt chunk by chunk straight to the output,
+            keeping memory usage bounded regardless of the backup size. Defaults to False.
+        chunk_size (int, optional): The chunk size used when streaming. Defaults to 1MB.
+        offset_cache (OffsetCache, optional): The cache of crypt14 offsets found by brute force. Defaults to None.
+        in_memory (bool, optional): Whether to return the decrypted database, e.g. to be loaded with
+            sqlite3.Connection.deserialize(). It is then only written if output is given. Defaults to False.
 
     Returns:
-        int: The status code of the decryption process (0 for success).
+        int or bytes: The status code of the decryption process (0 for success), or the
+            decrypted database if in_memory is True.
 
     Raises:
-        ValueError: If the key is invalid or output file not provided when dry_run is False.
+        ValueError: If the key is invalid or output file not provided when dry_run and in_memory are False.
         DecryptionError: for errors during decryption
         RuntimeError: for dependency errors
     """
     if not support_backup:
         raise RuntimeError("Dependencies for backup decryption are not available.")
 
-    if not dry_run and output is None:
+    if not dry_run and not in_memory and output is None:
         raise ValueError(
-            "The path to the decrypted database must be specified unless dry_run is true."
+            "The path to the decrypted database must be specified unless dry_run or in_memory is true."
         )
+    if in_memory and stream:
+        raise ValueError("Streaming decryption cannot return the decrypted database.")
+
+    if not isinstance(key, BackupKey):
+        key = load_key(key, crypt, keyfile_stream=keyfile_stream, show_crypt15=show_crypt15)
+
+    source = None
+    mapped = None
+    if isinstance(database, (str, os.PathLike)):
+        source = os.fspath(database)
+        database = mapped = _map_backup(source)
+    database = memoryview(database)
+    try:
+        # signature check, this is check is used in crypt 12 and 14
+        if crypt != Crypt.CRYPT15:
+            t1 = key.signature
 
-    if isinstance(key, io.IOBase):
-        key = key.read()
+            if t1 != database[15:47] and crypt == Crypt.CRYPT14:
+                raise ValueError("The signature of key file and backup file mismatch")
 
-    if crypt is not Crypt.CRYPT15 and len(key) != 158:
-        raise InvalidKeyError("The key file must be 158 bytes")
+            if t1 != database[3:35] and crypt == Crypt.CRYPT12:
+                raise ValueError("The signature of key file and backup file mismatch")
 
-    # signature check, this is check is used in crypt 12 and 14
-    if crypt != Crypt.CRYPT15:
-        t1 = key[30:62]
+        main_key = key.main_key
 
-        if t1 != database[15:47] and crypt == Crypt.CRYPT14:
-            raise ValueError("The signature of key file and backup file mismatch")
+        if stream:
+            return _decrypt_backup_stream(database, main_key, output, crypt, db_type, dry_run=dry_run,
+                                          chunk_size=chunk_size, offset_cache=offset_cache)
 
-        if t1 != database[3:35] and crypt == Crypt.CRYPT12:
-            raise ValueError("The signature of key file and backup file mismatch")
+        try:
+            if crypt == Crypt.CRYPT14:
+                db = _decrypt_crypt14(database, main_key, max_worker, source, offset_cache)
+            elif crypt == Crypt.CRYPT12:
+                db = _decrypt_crypt12(database, main_key)
+            elif crypt == Crypt.CRYPT15:
+                db = _decrypt_crypt15(database, main_key, db_type)
+            else:
+                raise ValueError(f"Unsupported crypt type: {crypt}")
+        except (InvalidFileFormatError, OffsetNotFoundError, ValueError) as e:
+            raise DecryptionError(f"Decryption failed: {e}") from e
+
+        if not dry_run and output is not None:
+            with open(output, "wb") as f:
+                f.write(db)
+        return db if in_memory else 0
+    finally:
+        database.release()
+        _close_backup(mapped)
 
-    if crypt == Crypt.CRYPT15:
-        if keyfile_stream:
-            main_key, hex_key = _extract_enc_key(key)
-        else:
-            main_key, hex_key = _derive_main_enc_key(key)
-        if show_crypt15:
-            hex_key_str = ' '.join([hex_key.hex()[c:c+4] for c in range(0, len(hex_key.hex()), 4)])
-            logging.info(f"The HEX key of the crypt15 backup is: {hex_key_str}")
-    else:
-        main_key = key[126:]
 
+class _DiscardOutput(io.RawIOBase):
+    """A writable sink which drops everything, used for streaming dry runs."""
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        return len(b)
+
+
+def _decrypt_backup_stream(
+    database: BackupData,
+    main_key: bytes,
+    output: Optional[str],
+    crypt: Crypt,
+    db_type: DbType,
+    *,
+    dry_run: bool = False,
+    chunk_size: int = 1 * 1024 * 1024,
+    offset_cache: Optional[OffsetCache] = None
+) -> int:
+    """
+    Streaming counterpart of the decryption step of decrypt_backup(). The partial
+    output is removed if the decryption fails.
+
+    Returns:
+        int: The status code of the decryption process (0 for success).
+
+    Raises:
+        DecryptionError: for errors during decryption
+    """
+    f = _DiscardOutput() if dry_run else open(output, "wb")
     try:
-        if crypt == Crypt.CRYPT14:
-            db = _decrypt_crypt14(database, main_key, max_worker)
-        elif crypt == Crypt.CRYPT12:
-            db = _decrypt_crypt12(database, main_key)
-        elif crypt == Crypt.CRYPT15:
-            db = _decrypt_crypt15(database, main_key, db_type)
-        else:
-            raise ValueError(f"Unsupported crypt type: {crypt}")
-    except (InvalidFileFormatError, OffsetNotFoundError, ValueError) as e:
-        raise DecryptionError(f"Decryption failed: {e}") from e
-
-    if not dry_run:
-        with open(output, "wb") as f:
-            f.write(db)
+        with f:
+            if crypt == Crypt.CRYPT14:
+                _decrypt_crypt14_stream(database, main_key, f, chunk_size, offset_cache)
+            elif crypt == Crypt.CRYPT12:
+                iv, db_ciphertext = _locate_crypt12(database)
+                _decrypt_database_stream(db_ciphertext, main_key, iv, f, chunk_size)
+            elif crypt == Crypt.CRYPT15:
+                iv, db_ciphertext = _locate_crypt15(database, db_type)
+                _decrypt_database_stream(db_ciphertext, main_key, iv, f, chunk_size)
+            else:
+                raise ValueError(f"Unsupported crypt type: {crypt}")
+    except BaseException as e:
+        if not dry_run:
+            os.remove(output)
+        if isinstance(e, (InvalidFileFormatError, OffsetNotFoundError, ValueError, zlib.error)):
+            raise DecryptionError(f"Decryption failed: {e}") from e
+        raise
     return 0
+
+
+def detect_crypt(path: str) -> Optional[Crypt]:
+    """Get the encryption version of a backup from its file name, or None if unknown."""
+    for crypt in (Crypt.CRYPT12, Crypt.CRYPT14, Crypt.CRYPT15):
+        if f"crypt{crypt.value}" in path:
+            return crypt
+    return None
+
+
+class BatchResult(NamedTuple):
+    """The outcome of decrypting one backup in decrypt_batch()."""
+    source: str
+    output: str
+    status: str  # "decrypted", "skipped" or "failed"
+    size: int
+    output_size: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+    # The crypt14 offsets found by brute force, for the parent to record in the offset cache
+    offsets: Optional[Dict[str, Dict[str, int]]] = None
+
+
+BATCH_MANIFEST = ".decrypt_manifest.json"
+
+
+def _file_digest(path: str, chunk_size: int = 1 * 1024 * 1024) -> Tuple[int, str]:
+    """Get the size and the SHA-256 of a file."""
+    digest = sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()
+
+
+def _batch_decrypt_task(
+    source: str,
+    output: str,
+    crypt: Crypt,
+    key: BackupKey,
+    offset_cache: Optional[str],
+    stream: bool,
+    chunk_size: int
+) -> BatchResult:
+    """Decrypt one backup of a batch in a worker process."""
+    db_type = DbType.CONTACT if os.path.basename(source).startswith("wa") else DbType.MESSAGE
+    size = os.path.getsize(source)
+    started = time.perf_counter()
+    # Only read here, the parent saves what the workers found, so they cannot overwrite each other
+    cache = OffsetCache(offset_cache, autosave=False) if offset_cache else None
+    cached = dict(cache.offsets) if cache is not None else {}
+    try:
+        decrypt_backup(
+            source,
+            key,
+            output,
+            crypt,
+            db_type=db_type,
+            max_worker=1,
+            stream=stream,
+            chunk_size=chunk_size,
+            offset_cache=cache
+        )
+    except (DecryptionError, ValueError, zlib.error, OSError) as e:
+        return BatchResult(source, output, "failed", size, error=str(e))
+    found = {k: v for k, v in cache.offsets.items() if cached.get(k) != v} if cache is not None else {}
+    return BatchResult(
+        source, output, "decrypted", size, os.path.getsize(output), time.perf_counter() - started,
+        offsets=found or None
+    )
+
+
+def decrypt_batch(
+    backups: List[str],
+    keys: Dict[Crypt, BackupKey],
+    output_dir: str,
+    *,
+    max_worker: Optional[int] = None,
+    offset_cache: Optional[str] = None,
+    stream: bool = False,
+    chunk_size: int = 1 * 1024 * 1024
+) -> List[BatchResult]:
+    """
+    Decrypt many backups (e.g. the daily msgstore-YYYY-MM-DD.1.db.crypt15 files) into a
+    directory on a process pool, with keys derived once by load_key().
+
+    A manifest in the output directory records the size and SHA-256 of each backup
+    and of its decrypted database, so that outputs already matching are skipped.
+
+    Args:
+        backups (List[str]): The paths of the backups.
+        keys (Dict[Crypt, BackupKey]): The parsed key for each encryption version present.
+        output_dir (str): The directory receiving the decrypted databases.
+        max_worker (int, optional): The number of worker processes. Defaults to the available cores.
+        offset_cache (str, optional): The path to the crypt14 offset cache. Defaults to None.
+        stream (bool, optional): Whether to decrypt chunk by chunk. Defaults to False.
+        chunk_size (int, optional): The chunk size used when streaming. Defaults to 1MB.
+
+    Returns:
+        List[BatchResult]: The outcome for each backup, in the order given.
+    """
+    manifest_path = os.path.join(output_dir, BATCH_MANIFEST)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    results: Dict[str, BatchResult] = {}
+    pending = []
+    for source in backups:
+        name = os.path.basename(source)
+        output = os.path.join(output_dir, name[:name.rindex(".crypt")] if ".crypt" in name else name)
+        entry = manifest.get(os.path.basename(output))
+        if entry is not None and os.path.isfile(output):
+            source_size, source_hash = _file_digest(source)
+            if (entry.get("source_size"), entry.get("source_sha256")) == (source_size, source_hash) and \
+                    (entry.get("size"), entry.get("sha256")) == _file_digest(output):
+                results[source] = BatchResult(source, output, "skipped", source_size, entry["size"])
+                continue
+        pending.append((source, output))
+
+    if max_worker is None:
+        max_worker = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    max_worker = max(1, min(max_worker or 1, len(pending) or 1))
+
+    found_offsets: Dict[str, Dict[str, int]] = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_worker) as executor:
+        futures = {}
+        for source, output in pending:
+            crypt = detect_crypt(os.path.basename(source))
+            if crypt not in keys:
+                results[source] = BatchResult(
+                    source, output, "failed", os.path.getsize(source),
+                    error="Unknown backup format or no key for it"
+                )
+                continue
+            future = executor.submit(
+                _batch_decrypt_task, source, output, crypt, keys[crypt], offset_cache, stream, chunk_size
+            )
+            futures[future] = (source, output)
+        with tqdm(total=len(futures), desc="Decrypting backups", unit="file", leave=False) as pbar:
+            for future in concurrent.futures.as_completed(futures):
+                source, output = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # One broken backup or worker must not abort the rest of the batch
+                    result = BatchResult(source, output, "failed", os.path.getsize(source), error=str(e))
+                results[result.source] = result
+                if result.offsets:
+                    found_offsets.update(result.offsets)
+                if result.status == "decrypted":
+                    source_size, source_hash = _file_digest(result.source)
+                    output_size, output_hash = _file_digest(result.output)
+                    manifest[os.path.basename(result.output)] = {
+                        "source": os.path.basename(result.source),
+                        "source_size": source_size,
+                        "source_sha256": source_hash,
+                        "size": output_size,
+                        "sha256": output_hash
+                    }
+                    write_json_atomic(manifest_path, manifest)
+                pbar.update(1)
+
+    if offset_cache and found_offsets:
+        OffsetCache(offset_cache).update(found_offsets)
+    return [results[source] for source in backups]
@@ -4,6 +4,7 @@ import logging
 import sqlite3
 import os
 import shutil
+import time
 from tqdm import tqdm
 from pathlib import Path
 from mimetypes import MimeTypes
@@ -15,8 +16,50 @@ from Whatsapp_Chat_Exporter.utility import MAX_SIZE, ROW_SIZE, JidType, Device,
 from Whatsapp_Chat_Exporter.utility import rendering, get_file_name, setup_template, get_cond_for_empty
 from Whatsapp_Chat_Exporter.utility import get_status_location, convert_time_unit, get_jid_map_selection
 from Whatsapp_Chat_Exporter.utility import get_chat_condition, safe_name, bytes_to_readable, determine_metadata
-
-
+from Whatsapp_Chat_Exporter.utility import fetch_rows, column_index, estimate_row_count
+from Whatsapp_Chat_Exporter.utility import SchemaProfile, get_transcription_selection
+from Whatsapp_Chat_Exporter.utility import get_partition_condition, balance_partitions, group_chat_counts
+from Whatsapp_Chat_Exporter.utility import get_chat_id_condition, resolve_chat_filter
+
+
+# Tables and columns read by the legacy message query, the new schema is used otherwise
+LEGACY_MESSAGE_SCHEMA = {
+    "messages": (
+        "_id", "key_remote_jid", "key_from_me", "key_id", "timestamp", "data", "status", "needs_push",
+        "edit_version", "thumb_image", "remote_resource", "media_wa_type", "latitude", "longitude",
+        "media_caption", "quoted_row_id", "received_timestamp", "read_device_timestamp"
+    ),
+    "messages_quotes": ("_id", "key_id", "data"),
+    "missed_call_logs": ("message_row_id", "video_call"),
+    "jid": ("_id", "raw_string", "type"),
+    "chat": ("jid_row_id", "subject"),
+    "message_system": ("message_row_id", "action_type"),
+    "message_system_group": ("message_row_id", "is_me_joined"),
+    "message_system_number_change": ("message_row_id", "old_jid_row_id", "new_jid_row_id"),
+    "receipt_user": ("message_row_id", "receipt_timestamp", "read_timestamp", "played_timestamp"),
+    "message_media": ("message_row_id", "file_path", "message_url", "mime_type", "media_key", "file_hash"),
+    "media_hash_thumbnail": ("media_hash", "thumbnail"),
+}
+
+# Indexes created on the working copy of --optimize-db, covering the joins of the extraction queries
+HELPER_INDEXES = {
+    "chat": ("jid_row_id", "_id", "subject"),
+    "jid_map": ("lid_row_id", "jid_row_id"),
+    "message_quoted": ("message_row_id", "key_id", "text_data"),
+    "message_location": ("message_row_id", "latitude", "longitude"),
+    "message_media": ("message_row_id",),
+    "message_thumbnail": ("message_row_id",),
+    "message_future": ("message_row_id", "version"),
+    "missed_call_logs": ("message_row_id", "video_call"),
+    "message_system": ("message_row_id", "action_type"),
+    "message_system_group": ("message_row_id", "is_me_joined"),
+    "message_system_number_change": ("message_row_id", "old_jid_row_id", "new_jid_row_id"),
+    "receipt_user": ("message_row_id", "receipt_timestamp", "read_timestamp", "played_timestamp"),
+    "media_hash_thumbnail": ("media_hash",),
+    "message_vcard": ("message_row_id",),
+    "messages_vcards": ("message_row_id",),
+    "message_add_on_reaction": ("message_add_on_row_id",),
+}
 
 
 def contacts(db, data, enrich_from_vcards):
@@ -32,8 +75,18 @@ def contacts(db, data, enrich_from_vcards):
         bool: False if no contacts found, True otherwise
     """
     c = db.cursor()
-    c.execute("SELECT count() FROM wa_contacts")
-    total_row_number = c.fetchone()[0]
+    total_row_number = estimate_row_count(db, "wa_contacts", data.get_system("no_count"))
+    c.execute("SELECT jid, COALESCE(display_name, wa_name) as display_name, status FROM wa_contacts;")
+
+    with tqdm(total=total_row_number, desc="Processing contacts", unit="contact", leave=False) as pbar:
+        for rows in fetch_rows(c):
+            for jid, display_name, status in rows:
+                current_chat = data.add_chat(jid, ChatStore(Device.ANDROID, display_name))
+                if status is not None:
+                    current_chat.status = status
+            pbar.update(len(rows))
+        total_time = pbar.format_dict['elapsed']
+        total_row_number = pbar.n
 
     if total_row_number == 0:
         if enrich_from_vcards is not None:
@@ -43,26 +96,50 @@ def contacts(db, data, enrich_from_vcards):
             logging.warning(
                 "No contacts profiles found in the default database, consider using --enrich-from-vcards for adopting names from exported contacts from Google")
         return False
-    else:
-        logging.info(f"Processed {total_row_number} contacts")
-
-    c.execute("SELECT jid, COALESCE(display_name, wa_name) as display_name, status FROM wa_contacts;")
-    
-    with tqdm(total=total_row_number, desc="Processing contacts", unit="contact", leave=False) as pbar:
-        while (row := _fetch_row_safely(c)) is not None:
-            current_chat = data.add_chat(row["jid"], ChatStore(Device.ANDROID, row["display_name"]))
-            if row["status"] is not None:
-                current_chat.status = row["status"]
-            pbar.update(1)
-        total_time = pbar.format_dict['elapsed']
     logging.info(f"Processed {total_row_number} contacts in {convert_time_unit(total_time)}")
 
     return True
 
 
-def messages(db, data, media_folder, timezone_offset, filter_date, filter_chat, filter_empty, no_reply):
+def optimize_database(db, path=None):
     """
-    Process WhatsApp messages from the database.
+    Create a read-optimized working copy of a message database for the extraction.
+
+    The database is copied to path with the SQLite backup API, so the original is only read.
+    The copy gets the indexes in HELPER_INDEXES for the tables that exist, then ANALYZE is run
+    so that the planner, and estimate_row_count(), know the size of each table.
+
+    Args:
+        db: Database connection to the original database
+        path: Path of the working copy, which can be ":memory:". If None, the indexes are
+            created in db itself, which must be a private copy, e.g. a deserialized image.
+
+    Returns:
+        sqlite3.Connection: The connection to the working copy
+    """
+    logging.info("Optimizing the message database...", extra={"clear": True})
+    start_time = time.perf_counter()
+    if path is not None:
+        copy = sqlite3.connect(path)
+        db.backup(copy)
+        db = copy
+    schema = SchemaProfile.probe(db)
+    for table, columns in HELPER_INDEXES.items():
+        if schema.has_columns(table, *columns):
+            db.execute(f'CREATE INDEX IF NOT EXISTS "exporter_{table}" ON "{table}" ({", ".join(columns)})')
+    db.execute("ANALYZE")
+    db.commit()
+    logging.info(f"Optimized the message database in {convert_time_unit(time.perf_counter() - start_time)}")
+    return db
+
+
+def messages(db, data, media_folder, timezone_offset, filter_date, filter_chat, filter_empty, no_reply,
+             separate_media=True, fix_dot_files=False):
+    """
+    Process WhatsApp messages, together with their media and vCards, from the database.
+
+    The message, media and thumbnail columns are read in a single pass over the message table,
+    while vCards are looked up from a narrow query on the vCard table.
 
     Args:
         db: Database connection
@@ -72,95 +149,149 @@ def messages(db, data, media_folder, timezone_offset, filter_date, filter_chat,
         filter_date: Date filter condition
         filter_chat: Chat filter conditions
         filter_empty: Filter for empty chats
+        separate_media: Whether to separate media files by chat
+        fix_dot_files: Whether to fix media files without extension
     """
     c = db.cursor()
-    total_row_number = _get_message_count(c, filter_empty, filter_date, filter_chat, data.get_system("jid_map_exists"))
+    schema = _get_schema(db, data)
+    table_message = not schema.supports(LEGACY_MESSAGE_SCHEMA)
+    # Only the messages after the last delta export, if any
+    last_id = data.get_system("last_message_id")
+    # Only the chats of this partition when extracting in parallel or in batches
+    partition = data.get_system("chat_partition")
+    if table_message:
+        content_cursor = _get_messages_cursor_new(
+            c,
+            filter_empty,
+            filter_date,
+            _resolve_chat_filter(db, data, filter_chat),
+            get_transcription_selection(schema),
+            schema.has_table("jid_map"),
+            last_id,
+            partition
+        )
+    else:
+        content_cursor = _get_messages_cursor_legacy(
+            c, filter_empty, filter_date, filter_chat, last_id, partition)
+
+    # The filters are not applied to the estimate, the exact count comes from the pass itself
+    total_row_number = estimate_row_count(
+        db, "message" if table_message else "messages", data.get_system("no_count"))
+    vcards = _get_vcards(db.cursor(), schema, table_message, partition)
+    col = column_index(content_cursor)
+    mime = MimeTypes()
+    media_count = vcard_count = 0
 
-    try:
-        content_cursor = _get_messages_cursor_legacy(c, filter_empty, filter_date, filter_chat)
-        table_message = False
-    except sqlite3.OperationalError as e:
-        logging.debug(f'Got sql error "{e}" in _get_message_cursor_legacy trying fallback.\n')
-        try:
-            content_cursor = _get_messages_cursor_new(
-                c,
-                filter_empty,
-                filter_date,
-                filter_chat,
-                data.get_system("transcription_selection"),
-                data.get_system("jid_map_exists")
-            )
-            table_message = True
-        except Exception as e:
-            raise e
+    # Ensure thumbnails and vCards directories exist
+    Path(f"{media_folder}/thumbnails").mkdir(parents=True, exist_ok=True)
+    vcard_path = os.path.join(media_folder, "vCards")
+    Path(vcard_path).mkdir(parents=True, exist_ok=True)
 
     with tqdm(total=total_row_number, desc="Processing messages", unit="msg", leave=False) as pbar:
-        while (content := _fetch_row_safely(content_cursor)) is not None:
-            _process_single_message(data, content, table_message, timezone_offset)
-            pbar.update(1)
+        for rows in fetch_rows(content_cursor):
+            for content in rows:
+                message = _process_single_message(data, content, col, table_message, timezone_offset)
+                if message is None:
+                    continue
+                # Media of status updates (jid type 7) are not exported
+                if content[col.media_row_id] is not None and content[col.jid_type] != 7:
+                    _process_single_media(data, content, col, media_folder, mime, separate_media, fix_dot_files)
+                    media_count += 1
+                for vcard, media_name in vcards.get(content[col._id], ()):
+                    _process_vcard(message, vcard, media_name, vcard_path)
+                    vcard_count += 1
+            pbar.update(len(rows))
         total_time = pbar.format_dict['elapsed']
-    _get_reactions(db, data)
-    logging.info(f"Processed {total_row_number} messages in {convert_time_unit(total_time)}")
+        total_row_number = pbar.n
+    _get_reactions(db, data, filter_date, filter_chat)
+    logging.info(f"Processed {total_row_number} messages, {media_count} media "
+                 f"and {vcard_count} vCards in {convert_time_unit(total_time)}")
 
-# Helper functions for message processing
 
-def _get_message_count(cursor, filter_empty, filter_date, filter_chat, jid_map_exists):
-    """Get the total number of messages to process."""
-    try:
-        empty_filter = get_cond_for_empty(filter_empty, "messages.key_remote_jid", "messages.needs_push")
-        date_filter = f'AND timestamp {filter_date}' if filter_date is not None else ''
-        include_filter = get_chat_condition(
-            filter_chat[0], True, ["messages.key_remote_jid", "messages.remote_resource"], "jid", "android")
-        exclude_filter = get_chat_condition(
-            filter_chat[1], False, ["messages.key_remote_jid", "messages.remote_resource"], "jid", "android")
-
-        cursor.execute(f"""SELECT count()
-                      FROM messages
-                        INNER JOIN jid
-                            ON messages.key_remote_jid = jid.raw_string
-                        LEFT JOIN chat
-                            ON chat.jid_row_id = jid._id
-                      WHERE 1=1
-                        {empty_filter}
-                        {date_filter}
-                        {include_filter}
-                        {exclude_filter}""")
-    except sqlite3.OperationalError as e:
-        logging.debug(f'Got sql error "{e}" in _get_message_count trying fallback.\n')
-
-        empty_filter = get_cond_for_empty(filter_empty, "key_remote_jid", "broadcast")
-        date_filter = f'AND timestamp {filter_date}' if filter_date is not None else ''
-        remote_jid_selection, group_jid_selection = get_jid_map_selection(jid_map_exists)
-        include_filter = get_chat_condition(
-            filter_chat[0], True, ["key_remote_jid", "group_sender_jid"], "jid", "android")
-        exclude_filter = get_chat_condition(
-            filter_chat[1], False, ["key_remote_jid", "group_sender_jid"], "jid", "android")
-
-        cursor.execute(f"""SELECT count(),
-                        {remote_jid_selection} as key_remote_jid,
-                        {group_jid_selection} as group_sender_jid
-                      FROM message
+def chat_message_counts(db, data):
+    """
+    Count the messages of each chat, after the last delta export if any.
+
+    Args:
+        db: Database connection
+        data: Data store object
+
+    Returns:
+        list: The row ids of the chats exported as the same chat, or their JID on the legacy
+            schema, with their number of messages, as from group_chat_counts()
+    """
+    last_id = data.get_system("last_message_id")
+    schema = _get_schema(db, data)
+    if schema.supports(LEGACY_MESSAGE_SCHEMA):
+        query = """SELECT key_remote_jid, key_remote_jid, count()
+                   FROM messages WHERE _id > ? GROUP BY key_remote_jid"""
+    elif schema.has_table("jid_map"):
+        # A chat of a LID is exported together with the chat of its JID
+        query = """SELECT message.chat_row_id, COALESCE(jid_map.jid_row_id, chat.jid_row_id), count()
+                   FROM message
                         LEFT JOIN chat
-                            ON chat._id = message.chat_row_id
-                        INNER JOIN jid
-                            ON jid._id = chat.jid_row_id
-                        INNER JOIN jid jid_global
-                            ON jid_global._id = chat.jid_row_id
-                        LEFT JOIN jid jid_group
-                            ON jid_group._id = message.sender_jid_row_id
-                        {get_jid_map_join(jid_map_exists)}
-                      WHERE 1=1
-                        {empty_filter}
-                        {date_filter}
-                        {include_filter}
-                        {exclude_filter}""")
-    return cursor.fetchone()[0]
+                            ON message.chat_row_id = chat._id
+                        LEFT JOIN jid_map
+                            ON chat.jid_row_id = jid_map.lid_row_id
+                   WHERE message._id > ? GROUP BY message.chat_row_id"""
+    else:
+        query = """SELECT message.chat_row_id, message.chat_row_id, count()
+                   FROM message WHERE message._id > ? GROUP BY message.chat_row_id"""
+    return group_chat_counts(db.execute(query, (last_id if last_id is not None else -1,)))
 
 
-def _get_messages_cursor_legacy(cursor, filter_empty, filter_date, filter_chat):
+def chat_partitions(db, data, partitions):
+    """
+    Split the chats into partitions of about the same number of messages, so that they can be
+    extracted separately with the "chat_partition" system value set to each of them.
+
+    Args:
+        db: Database connection
+        data: Data store object
+        partitions: The maximum number of partitions
+
+    Returns:
+        list: The row ids of the chats in each partition, or their JIDs on the legacy schema
+    """
+    return balance_partitions(chat_message_counts(db, data), partitions)
+
+
+# Helper functions for message processing
+
+def _get_jid_filter_query(db, data):
+    """Get the query selecting the row ids of JIDs, as exported with the JID a LID is mapped to, matching a pattern."""
+    if _get_schema(db, data).has_table("jid_map"):
+        return """SELECT jid._id
+                  FROM jid
+                    LEFT JOIN jid_map
+                        ON jid._id = jid_map.lid_row_id
+                    LEFT JOIN jid mapped
+                        ON jid_map.jid_row_id = mapped._id
+                  WHERE COALESCE(mapped.raw_string, jid.raw_string) LIKE ?"""
+    return "SELECT _id FROM jid WHERE raw_string LIKE ?"
+
+
+def _resolve_chat_filter(db, data, filter_chat):
+    """Resolve the chat filters to the row ids of the matching chats and of the matching JIDs."""
+    jids = _get_jid_filter_query(db, data)
+    return resolve_chat_filter(db, data, filter_chat, (f"SELECT _id FROM chat WHERE jid_row_id IN ({jids})", jids))
+
+
+def _get_schema(db, data):
+    """Get the schema profile of the message database, probing it on first use."""
+    schema = data.get_system("schema")
+    if schema is None:
+        schema = SchemaProfile.probe(db)
+        data.set_system("schema", schema)
+    return schema
+
+
+def _get_messages_cursor_legacy(cursor, filter_empty, filter_date, filter_chat, last_id=None, partition=None):
     """Get cursor for legacy database schema."""
     empty_filter = get_cond_for_empty(filter_empty, "messages.key_remote_jid", "messages.needs_push")
     date_filter = f'AND messages.timestamp {filter_date}' if filter_date is not None else ''
+    id_filter = f'AND messages._id > {int(last_id)}' if last_id is not None else ''
+    partition_filter = get_partition_condition("messages.key_remote_jid", partition)
     include_filter = get_chat_condition(
         filter_chat[0], True, ["messages.key_remote_jid", "messages.remote_resource"], "jid_global", "android")
     exclude_filter = get_chat_condition(
@@ -190,7 +321,14 @@ def _get_messages_cursor_legacy(cursor, filter_empty, filter_date, filter_chat):
                             jid_new.raw_string as new_jid,
                             jid_global.type as jid_type,
                             COALESCE(receipt_user.receipt_timestamp, messages.received_timestamp) as received_timestamp,
-                            COALESCE(receipt_user.read_timestamp, receipt_user.played_timestamp, messages.read_device_timestamp) as read_timestamp
+                            COALESCE(receipt_user.read_timestamp, receipt_user.played_timestamp, messages.read_device_timestamp) as read_timestamp,
+                            message_media.message_row_id as media_row_id,
+                            message_media.file_path,
+                            message_media.message_url,
+                            message_media.mime_type,
+                            message_media.media_key,
+                            message_media.file_hash,
+                            media_hash_thumbnail.thumbnail
                     FROM messages
                         LEFT JOIN messages_quotes
                             ON messages.quoted_row_id = messages_quotes._id
@@ -212,7 +350,13 @@ def _get_messages_cursor_legacy(cursor, filter_empty, filter_date, filter_chat):
                             ON jid_new._id = message_system_number_change.new_jid_row_id
                         LEFT JOIN receipt_user
                             ON receipt_user.message_row_id = messages._id
+                        LEFT JOIN message_media
+                            ON message_media.message_row_id = messages._id
+                        LEFT JOIN media_hash_thumbnail
+                            ON message_media.file_hash = media_hash_thumbnail.media_hash
                     WHERE messages.key_remote_jid <> '-1'
+                        {id_filter}
+                        {partition_filter}
                         {empty_filter}
                         {date_filter}
                         {include_filter}
@@ -226,18 +370,22 @@ def _get_messages_cursor_new(
         cursor,
         filter_empty,
         filter_date,
-        filter_chat,
+        chat_filter_ids,
         transcription_selection,
-        jid_map_exists
+        jid_map_exists,
+        last_id=None,
+        partition=None
     ):
-    """Get cursor for new database schema."""
+    """Get cursor for new database schema, with the chat filters resolved by _resolve_chat_filter()."""
     empty_filter = get_cond_for_empty(filter_empty, "key_remote_jid", "broadcast")
     date_filter = f'AND message.timestamp {filter_date}' if filter_date is not None else ''
+    id_filter = f'AND message._id > {int(last_id)}' if last_id is not None else ''
+    partition_filter = get_partition_condition("message.chat_row_id", partition)
     remote_jid_selection, group_jid_selection = get_jid_map_selection(jid_map_exists)
-    include_filter = get_chat_condition(
-        filter_chat[0], True, ["key_remote_jid", "group_sender_jid"], "jid_global", "android")
-    exclude_filter = get_chat_condition(
-        filter_chat[1], False, ["key_remote_jid", "group_sender_jid"], "jid_global", "android")
+    include_filter = get_chat_id_condition(
+        chat_filter_ids[0], True, ["message.chat_row_id", "jid_group._id"], "jid_global", "android")
+    exclude_filter = get_chat_id_condition(
+        chat_filter_ids[1], False, ["message.chat_row_id", "jid_group._id"], "jid_global", "android")
 
     cursor.execute(f"""SELECT {remote_jid_selection} as key_remote_jid,
                             message._id,
@@ -265,6 +413,13 @@ def _get_messages_cursor_new(
                             jid_global.type as jid_type,
                             COALESCE(receipt_user.receipt_timestamp, message.received_timestamp) as received_timestamp,
                             COALESCE(receipt_user.read_timestamp, receipt_user.played_timestamp) as read_timestamp,
+                            message_media.message_row_id as media_row_id,
+                            message_media.file_path,
+                            message_media.message_url,
+                            message_media.mime_type,
+                            message_media.media_key,
+                            message_media.file_hash,
+                            media_hash_thumbnail.thumbnail,
                             {transcription_selection}
                     FROM message
                         LEFT JOIN message_quoted
@@ -297,8 +452,12 @@ def _get_messages_cursor_new(
                             ON jid_new._id = message_system_number_change.new_jid_row_id
                         LEFT JOIN receipt_user
                             ON receipt_user.message_row_id = message._id
+                        LEFT JOIN media_hash_thumbnail
+                            ON message_media.file_hash = media_hash_thumbnail.media_hash
                         {get_jid_map_join(jid_map_exists)}
                     WHERE key_remote_jid <> '-1'
+                        {id_filter}
+                        {partition_filter}
                         {empty_filter}
                         {date_filter}
                         {include_filter}
@@ -307,190 +466,160 @@ def _get_messages_cursor_new(
     return cursor
 
 
-def _fetch_row_safely(cursor):
-    """Safely fetch a row from cursor, handling operational errors."""
-    while True:
-        try:
-            content = cursor.fetchone()
-            return content
-        except sqlite3.OperationalError as e:
-            # Not sure how often this might happen, but this check should reduce the overhead
-            # if DEBUG flag is not set.
-            if logging.isEnabledFor(logging.DEBUG):
-                logging.debug(f'Got sql error "{e}" in _fetch_row_safely ignoring row.\n')
-            continue
-
+def _process_single_message(data, content, col, table_message, timezone_offset):
+    """
+    Process a single message row, a tuple whose column positions are given by col.
 
-def _process_single_message(data, content, table_message, timezone_offset):
-    """Process a single message row."""
-    if content["key_remote_jid"] is None:
-        return
+    Returns:
+        Message: The message added to its chat, or None if the row was skipped
+    """
+    if content[col.key_remote_jid] is None:
+        return None
 
     # Get or create the chat
-    current_chat = data.get_chat(content["key_remote_jid"])
+    current_chat = data.get_chat(content[col.key_remote_jid])
     if current_chat is None:
-        current_chat = data.add_chat(content["key_remote_jid"], ChatStore(
-            Device.ANDROID, content["chat_subject"]))
+        current_chat = data.add_chat(content[col.key_remote_jid], ChatStore(
+            Device.ANDROID, content[col.chat_subject]))
     # Determine sender_jid_row_id
-    if "sender_jid_row_id" in content:
-        sender_jid_row_id = content["sender_jid_row_id"]
+    if hasattr(col, "sender_jid_row_id"):
+        sender_jid_row_id = content[col.sender_jid_row_id]
     else:
         sender_jid_row_id = None
 
     # Create message object
     message = Message(
-        from_me=not sender_jid_row_id and content["key_from_me"],
-        timestamp=content["timestamp"],
-        time=content["timestamp"],
-        key_id=content["key_id"],
+        from_me=not sender_jid_row_id and content[col.key_from_me],
+        timestamp=content[col.timestamp],
+        time=content[col.timestamp],
+        key_id=content[col.key_id],
         timezone_offset=timezone_offset,
-        message_type=content["media_wa_type"],
-        received_timestamp=content["received_timestamp"],
-        read_timestamp=content["read_timestamp"]
+        message_type=content[col.media_wa_type],
+        received_timestamp=content[col.received_timestamp],
+        read_timestamp=content[col.read_timestamp]
     )
 
     # Handle binary data
-    if isinstance(content["data"], bytes):
-        _process_binary_message(message, content)
-        current_chat.add_message(content["_id"], message)
-        return
+    if isinstance(content[col.data], bytes):
+        _process_binary_message(message, content, col)
+        current_chat.add_message(content[col._id], message)
+        return message
 
     # Set sender for group chats
-    if content["jid_type"] == JidType.GROUP and content["key_from_me"] == 0:
-        _set_group_sender(message, content, data, table_message)
+    if content[col.jid_type] == JidType.GROUP and content[col.key_from_me] == 0:
+        _set_group_sender(message, content, col, data, table_message)
     else:
         message.sender = None
 
     # Handle quoted messages
-    if content["quoted"] is not None:
-        message.reply = content["quoted"]
-        if content["quoted_data"] is not None and len(content["quoted_data"]) > 200:
-            message.quoted_data = content["quoted_data"][:201] + "..."
+    if content[col.quoted] is not None:
+        message.reply = content[col.quoted]
+        if content[col.quoted_data] is not None and len(content[col.quoted_data]) > 200:
+            message.quoted_data = content[col.quoted_data][:201] + "..."
         else:
-            message.quoted_data = content["quoted_data"]
+            message.quoted_data = content[col.quoted_data]
     else:
         message.reply = None
 
     # Handle message caption
-    if not table_message and content["media_caption"] is not None:
+    if not table_message and content[col.media_caption] is not None:
         # Old schema
-        message.caption = content["media_caption"]
+        message.caption = content[col.media_caption]
     elif table_message:
         # New schema
-        if content["media_wa_type"] == 1 and content["data"] is not None:
-            message.caption = content["data"]
-        elif content["media_wa_type"] == 2 and content["transcription_text"] is not None:
-            message.caption = f'"{content["transcription_text"]}"'
+        if content[col.media_wa_type] == 1 and content[col.data] is not None:
+            message.caption = content[col.data]
+        elif content[col.media_wa_type] == 2 and content[col.transcription_text] is not None:
+            message.caption = f'"{content[col.transcription_text]}"'
     else:
         message.caption = None
 
     # Handle message content based on status
-    if content["status"] == 6:  # 6 = Metadata
-        _process_metadata_message(message, content, data, table_message)
+    if content[col.status] == 6:  # 6 = Metadata
+        _process_metadata_message(message, content, col, data, table_message)
     else:
         # Real message
-        _process_regular_message(message, content, table_message)
+        _process_regular_message(message, content, col, table_message)
 
-    current_chat.add_message(content["_id"], message)
+    current_chat.add_message(content[col._id], message)
+    return message
 
 
-def _process_binary_message(message, content):
+def _process_binary_message(message, content, col):
     """Process binary message data."""
     message.data = ("The message is binary data and its base64 is "
                     '<a href="https://gchq.github.io/CyberChef/#recipe=From_Base64'
                     "('A-Za-z0-9%2B/%3D',true,false)Text_Encoding_Brute_Force"
-                    f"""('Decode')&input={b64encode(b64encode(content["data"])).decode()}">""")
-    message.data += b64encode(content["data"]).decode("utf-8") + "</a>"
+                    f"""('Decode')&input={b64encode(b64encode(content[col.data])).decode()}">""")
+    message.data += b64encode(content[col.data]).decode("utf-8") + "</a>"
     message.safe = message.meta = True
 
 
-def _set_group_sender(message, content, data, table_message):
+def _set_group_sender(message, content, col, data, table_message):
     """Set sender name for group messages."""
-    name = fallback = None
     if table_message:
-        if content["sender_jid_row_id"] > 0:
-            _jid = content["group_sender_jid"]
-            if _jid in data:
-                name = data.get_chat(_jid).name
-            if "@" in _jid:
-                fallback = _jid.split('@')[0]
+        _jid = content[col.group_sender_jid] if content[col.sender_jid_row_id] > 0 else None
     else:
-        if content["remote_resource"] is not None:
-            if content["remote_resource"] in data:
-                name = data.get_chat(content["remote_resource"]).name
-            if "@" in content["remote_resource"]:
-                fallback = content["remote_resource"].split('@')[0]
+        _jid = content[col.remote_resource]
+    message.sender = data.names.resolve(_jid)
 
-    message.sender = name or fallback
 
-
-def _process_metadata_message(message, content, data, table_message):
+def _process_metadata_message(message, content, col, data, table_message):
     """Process metadata message."""
     message.meta = True
-    name = fallback = None
 
     if table_message:
-        if content["sender_jid_row_id"] > 0:
-            _jid = content["group_sender_jid"]
-            if _jid in data:
-                name = data.get_chat(_jid).name
-            if "@" in _jid:
-                fallback = _jid.split('@')[0]
-        else:
-            name = "You"
+        by_me = content[col.sender_jid_row_id] <= 0
+        _jid = content[col.group_sender_jid]
     else:
-        _jid = content["remote_resource"]
-        if _jid is not None:
-            if _jid in data:
-                name = data.get_chat(_jid).name
-            if "@" in _jid:
-                fallback = _jid.split('@')[0]
-        else:
-            name = "You"
+        _jid = content[col.remote_resource]
+        by_me = _jid is None
+    name = "You" if by_me else data.names.resolve(_jid)
 
-    message.data = determine_metadata(content, name or fallback)
+    # Metadata messages are rare, so the row is only turned into a mapping here
+    message.data = determine_metadata(dict(zip(vars(col), content)), name)
 
     if isinstance(message.data, str) and "<br>" in message.data:
         message.safe = True
 
     if message.data is None:
-        if content["video_call"] is not None:  # Missed call
+        if content[col.video_call] is not None:  # Missed call
             message.meta = True
-            if content["video_call"] == 1:
+            if content[col.video_call] == 1:
                 message.data = "A video call was missed"
-            elif content["video_call"] == 0:
+            elif content[col.video_call] == 0:
                 message.data = "A voice call was missed"
-        elif content["data"] is None and content["thumb_image"] is None:
+        elif content[col.data] is None and content[col.thumb_image] is None:
             message.meta = True
             message.data = None
 
 
-def _process_regular_message(message, content, table_message):
+def _process_regular_message(message, content, col, table_message):
     """Process regular (non-metadata) message."""
-    message.sticker = content["media_wa_type"] == 20  # Sticker is a message
+    message.sticker = content[col.media_wa_type] == 20  # Sticker is a message
 
-    if content["key_from_me"] == 1:
-        if content["status"] == 5 and content["edit_version"] == 7 or table_message and content["media_wa_type"] == 15:
+    if content[col.key_from_me] == 1:
+        if content[col.status] == 5 and content[col.edit_version] == 7 or table_message and content[col.media_wa_type] == 15:
             msg = "Message deleted"
             message.meta = True
         else:
-            if content["media_wa_type"] == 5:
-                msg = f"Location shared: {content['latitude'], content['longitude']}"
+            if content[col.media_wa_type] == 5:
+                msg = f"Location shared: {content[col.latitude], content[col.longitude]}"
                 message.meta = True
             else:
-                msg = content["data"]
+                msg = content[col.data]
                 if msg is not None:
                     msg = _format_message_text(msg)
     else:
-        if content["status"] == 0 and content["edit_version"] == 7 or table_message and content["media_wa_type"] == 15:
+        if content[col.status] == 0 and content[col.edit_version] == 7 or table_message and content[col.media_wa_type] == 15:
             msg = "Message deleted"
             message.meta = True
         else:
-            if content["media_wa_type"] == 5:
-                msg = f"Location shared: {content['latitude'], content['longitude']}"
+            if content[col.media_wa_type] == 5:
+                msg = f"Location shared: {content[col.latitude], content[col.longitude]}"
                 message.meta = True
             else:
-                msg = content["data"]
+                msg = content[col.data]
                 if msg is not None:
                     msg = _format_message_text(msg)
 
@@ -506,29 +635,53 @@ def _format_message_text(text):
     return text
 
 
-def _get_reactions(db, data):
+def _get_reactions(db, data, filter_date=None, filter_chat=(None, None)):
     """
     Process message reactions. Only new schema is supported.
-    Chat filter is not applied here at the moment. Maybe in the future.
+    The chat and date filters are applied to the messages reacted to.
+
+    The reactions are read in batches ordered by chat, so that the chat of each batch of
+    reactions is looked up once and the messages are found by their row id in the chat.
     """
     c = db.cursor()
-    
-    try:
-        # Check if tables exist, old schema might not have reactions or in somewhere else
-        c.execute("SELECT count(*) FROM sqlite_master WHERE type='table' AND name='message_add_on'")
-        if c.fetchone()[0] == 0:
-            return
+    schema = _get_schema(db, data)
+    # Old schema might not have reactions or in somewhere else
+    if not schema.has_table("message_add_on"):
+        return
+
+    # Only the reactions after the last delta export, if any
+    last_id = data.get_system("last_reaction_id")
+    id_filter = f"AND message_add_on._id > {int(last_id)}" if last_id is not None else ""
+    partition_filter = get_partition_condition("message_add_on.chat_row_id", data.get_system("chat_partition"))
+    date_filter = f"AND parent.timestamp {filter_date}" if filter_date is not None else ""
+    chat_filter_ids = _resolve_chat_filter(db, data, filter_chat)
+    include_filter = get_chat_id_condition(
+        chat_filter_ids[0], True, ["message_add_on.chat_row_id", "parent.sender_jid_row_id"], "chat_jid", "android")
+    exclude_filter = get_chat_id_condition(
+        chat_filter_ids[1], False, ["message_add_on.chat_row_id", "parent.sender_jid_row_id"], "chat_jid", "android")
+    # The messages of the chat of a LID are stored in the chat of the JID it is mapped to
+    if schema.has_table("jid_map"):
+        chat_jid_selection = "COALESCE(mapped_jid.raw_string, chat_jid.raw_string)"
+        jid_map_join = """LEFT JOIN jid_map
+                    ON chat.jid_row_id = jid_map.lid_row_id
+                LEFT JOIN jid mapped_jid
+                    ON jid_map.jid_row_id = mapped_jid._id"""
+    else:
+        chat_jid_selection, jid_map_join = "chat_jid.raw_string", ""
 
+    total_row_number = estimate_row_count(db, "message_add_on", data.get_system("no_count"))
+    try:
         logging.info("Processing reactions...", extra={"clear": True})
 
-        c.execute("""
+        c.execute(f"""
             SELECT
+                message_add_on._id,
+                message_add_on.chat_row_id,
                 message_add_on.parent_message_row_id,
                 message_add_on_reaction.reaction,
                 message_add_on.from_me,
                 jid.raw_string as sender_jid_raw,
-                chat_jid.raw_string as chat_jid_raw,
-                message_add_on_reaction.sender_timestamp
+                {chat_jid_selection} as chat_jid_raw
             FROM message_add_on
                 INNER JOIN message_add_on_reaction 
                     ON message_add_on._id = message_add_on_reaction.message_add_on_row_id
@@ -538,240 +691,69 @@ def _get_reactions(db, data):
                     ON message_add_on.chat_row_id = chat._id
                 LEFT JOIN jid chat_jid 
                     ON chat.jid_row_id = chat_jid._id
+                {jid_map_join}
+                LEFT JOIN message parent
+                    ON message_add_on.parent_message_row_id = parent._id
+            WHERE 1=1
+                {id_filter}
+                {partition_filter}
+                {date_filter}
+                {include_filter}
+                {exclude_filter}
+            ORDER BY message_add_on.chat_row_id, message_add_on._id
         """)
     except sqlite3.OperationalError:
         logging.warning(f"Could not fetch reactions (schema might be too old or incompatible)")
         return
 
-    rows = c.fetchall()
-    total_row_number = len(rows)
-
+    col = column_index(c)
+    chat_row_id = chat = None
     with tqdm(total=total_row_number, desc="Processing reactions", unit="reaction", leave=False) as pbar:
-        for row in rows:
-            parent_id = row["parent_message_row_id"]
-            reaction = row["reaction"]
-            chat_id = row["chat_jid_raw"]
-            _react_timestamp = row["sender_timestamp"]
-
-            if chat_id and chat_id in data:
-                chat = data[chat_id]
-                if parent_id in chat._messages:
-                    message = chat._messages[parent_id]
-                    
-                    # Determine sender name
-                    sender_name = None
-                    if row["from_me"]:
-                        sender_name = "You"
-                    elif row["sender_jid_raw"]:
-                        sender_jid = row["sender_jid_raw"]
-                        if sender_jid in data:
-                            sender_name = data[sender_jid].name
-                        if not sender_name:
-                            sender_name = sender_jid.split('@')[0] if "@" in sender_jid else sender_jid
-                    
-                    if not sender_name:
-                        sender_name = "Unknown"
-
-                    message.reactions[sender_name] = reaction
-            pbar.update(1)
-        total_time = pbar.format_dict['elapsed']
-    logging.info(f"Processed {total_row_number} reactions in {convert_time_unit(total_time)}")
-
-
-def media(db, data, media_folder, filter_date, filter_chat, filter_empty, separate_media=True, fix_dot_files=False):
-    """
-    Process WhatsApp media files from the database.
-
-    Args:
-        db: Database connection
-        data: Data store object
-        media_folder: Folder containing media files
-        filter_date: Date filter condition
-        filter_chat: Chat filter conditions
-        filter_empty: Filter for empty chats
-        separate_media: Whether to separate media files by chat
-    """
-    c = db.cursor()
-    total_row_number = _get_media_count(c, filter_empty, filter_date, filter_chat)
-    try:
-        content_cursor = _get_media_cursor_legacy(c, filter_empty, filter_date, filter_chat)
-    except sqlite3.OperationalError as e:
-        logging.debug(f'Got sql error "{e}" in _get_media_cursor_legacy trying fallback.\n')
-        content_cursor = _get_media_cursor_new(c, filter_empty, filter_date, filter_chat)
-
-    content = content_cursor.fetchone()
-    mime = MimeTypes()
-
-    # Ensure thumbnails directory exists
-    Path(f"{media_folder}/thumbnails").mkdir(parents=True, exist_ok=True)
+        for rows in fetch_rows(c):
+            for row in rows:
+                last_id = max(row[col._id], last_id or 0)
+                if row[col.chat_row_id] != chat_row_id or chat_row_id is None:
+                    chat_row_id = row[col.chat_row_id]
+                    chat = data.get_chat(row[col.chat_jid_raw])
+                if chat is None:
+                    continue
+                message = chat.get_message(row[col.parent_message_row_id])
+                if message is None:
+                    continue
 
-    with tqdm(total=total_row_number, desc="Processing media", unit="media", leave=False) as pbar:
-        while (content := _fetch_row_safely(content_cursor)) is not None:
-            _process_single_media(data, content, media_folder, mime, separate_media, fix_dot_files)
-            pbar.update(1)
+                # Determine sender name
+                if row[col.from_me]:
+                    sender_name = "You"
+                elif row[col.sender_jid_raw]:
+                    sender_jid = row[col.sender_jid_raw]
+                    sender_name = data.names.resolve(sender_jid) or sender_jid
+                else:
+                    sender_name = "Unknown"
+                message.add_reaction(sender_name, row[col.reaction])
+            pbar.update(len(rows))
         total_time = pbar.format_dict['elapsed']
-    logging.info(f"Processed {total_row_number} media in {convert_time_unit(total_time)}")
-
-# Helper functions for media processing
-
-def _get_media_count(cursor, filter_empty, filter_date, filter_chat):
-    """Get the total number of media files to process."""
-    try:
-        empty_filter = get_cond_for_empty(filter_empty, "key_remote_jid", "messages.needs_push")
-        date_filter = f'AND messages.timestamp {filter_date}' if filter_date is not None else ''
-        include_filter = get_chat_condition(
-            filter_chat[0], True, ["messages.key_remote_jid", "remote_resource"], "jid", "android")
-        exclude_filter = get_chat_condition(
-            filter_chat[1], False, ["messages.key_remote_jid", "remote_resource"], "jid", "android")
-
-        cursor.execute(f"""SELECT count()
-                    FROM message_media
-                        INNER JOIN messages
-                            ON message_media.message_row_id = messages._id
-                        INNER JOIN jid
-                            ON messages.key_remote_jid = jid.raw_string
-                        LEFT JOIN chat
-                            ON chat.jid_row_id = jid._id
-                    WHERE 1=1  
-                        {empty_filter}
-                        {date_filter}
-                        {include_filter}
-                        {exclude_filter}""")
-    except sqlite3.OperationalError as e:
-        logging.debug(f'Got sql error "{e}" in _get_media_count trying fallback.\n')
-        empty_filter = get_cond_for_empty(filter_empty, "jid.raw_string", "broadcast")
-        date_filter = f'AND message.timestamp {filter_date}' if filter_date is not None else ''
-        include_filter = get_chat_condition(
-            filter_chat[0], True, ["key_remote_jid", "group_sender_jid"], "jid", "android")
-        exclude_filter = get_chat_condition(
-            filter_chat[1], False, ["key_remote_jid", "group_sender_jid"], "jid", "android")
-
-        cursor.execute(f"""SELECT count(),
-                        COALESCE(lid_global.raw_string, jid.raw_string) as key_remote_jid,
-                        COALESCE(lid_group.raw_string, jid_group.raw_string) as group_sender_jid
-                    FROM message_media
-                        INNER JOIN message
-                            ON message_media.message_row_id = message._id
-                        LEFT JOIN chat
-                            ON chat._id = message.chat_row_id
-                        INNER JOIN jid
-                            ON jid._id = chat.jid_row_id
-                        LEFT JOIN jid jid_group
-                            ON jid_group._id = message.sender_jid_row_id
-                        LEFT JOIN jid_map as jid_map_global
-                            ON chat.jid_row_id = jid_map_global.lid_row_id
-                        LEFT JOIN jid lid_global
-                            ON jid_map_global.jid_row_id = lid_global._id
-                        LEFT JOIN jid_map as jid_map_group
-                            ON message.sender_jid_row_id = jid_map_group.lid_row_id
-                        LEFT JOIN jid lid_group
-                            ON jid_map_group.jid_row_id = lid_group._id
-                    WHERE 1=1    
-                        {empty_filter}
-                        {date_filter}
-                        {include_filter}
-                        {exclude_filter}""")
-    return cursor.fetchone()[0]
-
-
-def _get_media_cursor_legacy(cursor, filter_empty, filter_date, filter_chat):
-    """Get cursor for legacy media database schema."""
-    empty_filter = get_cond_for_empty(filter_empty, "messages.key_remote_jid", "messages.needs_push")
-    date_filter = f'AND messages.timestamp {filter_date}' if filter_date is not None else ''
-    include_filter = get_chat_condition(
-        filter_chat[0], True, ["messages.key_remote_jid", "remote_resource"], "jid", "android")
-    exclude_filter = get_chat_condition(
-        filter_chat[1], False, ["messages.key_remote_jid", "remote_resource"], "jid", "android")
-
-    cursor.execute(f"""SELECT messages.key_remote_jid,
-                        message_row_id,
-                        file_path,
-                        message_url,
-                        mime_type,
-                        media_key,
-                        file_hash,
-                        thumbnail
-                 FROM message_media
-                    INNER JOIN messages
-                        ON message_media.message_row_id = messages._id
-                    LEFT JOIN media_hash_thumbnail
-                        ON message_media.file_hash = media_hash_thumbnail.media_hash
-                    INNER JOIN jid
-                        ON messages.key_remote_jid = jid.raw_string
-                    LEFT JOIN chat
-                        ON chat.jid_row_id = jid._id
-                WHERE jid.type <> 7
-                    {empty_filter}
-                    {date_filter}
-                    {include_filter}
-                    {exclude_filter}
-                ORDER BY messages.key_remote_jid ASC""")
-    return cursor
-
-
-def _get_media_cursor_new(cursor, filter_empty, filter_date, filter_chat):
-    """Get cursor for new media database schema."""
-    empty_filter = get_cond_for_empty(filter_empty, "key_remote_jid", "broadcast")
-    date_filter = f'AND message.timestamp {filter_date}' if filter_date is not None else ''
-    include_filter = get_chat_condition(
-        filter_chat[0], True, ["key_remote_jid", "group_sender_jid"], "jid", "android")
-    exclude_filter = get_chat_condition(
-        filter_chat[1], False, ["key_remote_jid", "group_sender_jid"], "jid", "android")
-
-    cursor.execute(f"""SELECT COALESCE(lid_global.raw_string, jid.raw_string) as key_remote_jid,
-                    message_row_id,
-                    file_path,
-                    message_url,
-                    mime_type,
-                    media_key,
-                    file_hash,
-                    thumbnail,
-                    COALESCE(lid_group.raw_string, jid_group.raw_string) as group_sender_jid
-                FROM message_media
-                    INNER JOIN message
-                        ON message_media.message_row_id = message._id
-                    LEFT JOIN chat
-                        ON chat._id = message.chat_row_id
-                    INNER JOIN jid
-                        ON jid._id = chat.jid_row_id
-                    LEFT JOIN media_hash_thumbnail
-                        ON message_media.file_hash = media_hash_thumbnail.media_hash
-                    LEFT JOIN jid jid_group
-                        ON jid_group._id = message.sender_jid_row_id
-                    LEFT JOIN jid_map as jid_map_global
-                        ON chat.jid_row_id = jid_map_global.lid_row_id
-                    LEFT JOIN jid lid_global
-                        ON jid_map_global.jid_row_id = lid_global._id
-                    LEFT JOIN jid_map as jid_map_group
-                        ON message.sender_jid_row_id = jid_map_group.lid_row_id
-                    LEFT JOIN jid lid_group
-                        ON jid_map_group.jid_row_id = lid_group._id
-                WHERE jid.type <> 7
-                    {empty_filter}
-                    {date_filter}
-                    {include_filter}
-                    {exclude_filter}
-                ORDER BY jid.raw_string ASC""")
-    return cursor
+        total_row_number = pbar.n
+    data.set_system("last_reaction_id", last_id)
+    logging.info(f"Processed {total_row_number} reactions in {convert_time_unit(total_time)}")
 
 
-def _process_single_media(data, content, media_folder, mime, separate_media, fix_dot_files=False):
-    """Process a single media file."""
-    file_path = f"{media_folder}/{content['file_path']}"
-    current_chat = data.get_chat(content["key_remote_jid"])
-    message = current_chat.get_message(content["message_row_id"])
+def _process_single_media(data, content, col, media_folder, mime, separate_media, fix_dot_files=False):
+    """Process the media file of a message row, a tuple whose column positions are given by col."""
+    file_path = f"{media_folder}/{content[col.file_path]}"
+    current_chat = data.get_chat(content[col.key_remote_jid])
+    message = current_chat.get_message(content[col._id])
     message.media = True
 
     if os.path.isfile(file_path):
         # Set mime type
-        if content["mime_type"] is None:
+        if content[col.mime_type] is None:
             guess = mime.guess_type(file_path)[0]
             if guess is not None:
                 message.mime = guess
             else:
                 message.mime = "application/octet-stream"
         else:
-            message.mime = content["mime_type"]
+            message.mime = content[col.mime_type]
         
         if fix_dot_files and file_path.endswith("."):
             extension = mime.guess_extension(message.mime)
@@ -786,7 +768,7 @@ def _process_single_media(data, content, media_folder, mime, separate_media, fix
         # Copy media to separate folder if needed
         if separate_media:
             chat_display_name = safe_name(current_chat.name or message.sender
-                                          or content["key_remote_jid"].split('@')[0])
+                                          or content[col.key_remote_jid].split('@')[0])
             current_filename = file_path.split("/")[-1]
             new_folder = os.path.join(media_folder, "separated", chat_display_name)
             Path(new_folder).mkdir(parents=True, exist_ok=True)
@@ -801,125 +783,66 @@ def _process_single_media(data, content, media_folder, mime, separate_media, fix
         message.meta = True
 
     # Handle thumbnail
-    if content["thumbnail"] is not None:
-        thumb_path = f"{media_folder}/thumbnails/{b64decode(content['file_hash']).hex()}.png"
+    if content[col.thumbnail] is not None:
+        thumb_path = f"{media_folder}/thumbnails/{b64decode(content[col.file_hash]).hex()}.png"
         if not os.path.isfile(thumb_path):
             with open(thumb_path, "wb") as f:
-                f.write(content["thumbnail"])
+                f.write(content[col.thumbnail])
         message.thumb = thumb_path
 
 
-def vcard(db, data, media_folder, filter_date, filter_chat, filter_empty):
-    """Process vCard data from WhatsApp database and save to files."""
-    c = db.cursor()
-    try:
-        rows = _execute_vcard_query_modern(c, filter_date, filter_chat, filter_empty)
-    except sqlite3.OperationalError as e:
-        logging.debug(f'Got sql error "{e}" in _execute_vcard_query_modern trying fallback.\n')
-        rows = _execute_vcard_query_legacy(c, filter_date, filter_chat, filter_empty)
-
-    total_row_number = len(rows)
-
-    # Create vCards directory if it doesn't exist
-    path = os.path.join(media_folder, "vCards")
-    Path(path).mkdir(parents=True, exist_ok=True)
-
-    with tqdm(total=total_row_number, desc="Processing vCards", unit="vcard", leave=False) as pbar:
-        for row in rows:
-            _process_vcard_row(row, path, data)
-            pbar.update(1)
-        total_time = pbar.format_dict['elapsed']
-    logging.info(f"Processed {total_row_number} vCards in {convert_time_unit(total_time)}")
-
-def _execute_vcard_query_modern(c, filter_date, filter_chat, filter_empty):
-    """Execute vCard query for modern WhatsApp database schema."""
-
-    # Build the filter conditions
-    date_filter = f'AND messages.timestamp {filter_date}' if filter_date is not None else ''
-    empty_filter = get_cond_for_empty(filter_empty, "key_remote_jid", "messages.needs_push")
-    include_filter = get_chat_condition(
-        filter_chat[0], True, ["key_remote_jid", "group_sender_jid"], "jid", "android")
-    exclude_filter = get_chat_condition(
-        filter_chat[1], False, ["key_remote_jid", "group_sender_jid"], "jid", "android")
-
-    query = f"""SELECT message_row_id,
-                    COALESCE(lid_global.raw_string, jid.raw_string) as key_remote_jid,
-                    vcard,
-                    messages.media_name,
-                    COALESCE(lid_group.raw_string, jid_group.raw_string) as group_sender_jid
-                FROM messages_vcards
-                    INNER JOIN messages
-                        ON messages_vcards.message_row_id = messages._id
-                    INNER JOIN jid
-                        ON messages.key_remote_jid = jid.raw_string
-                    LEFT JOIN chat
-                        ON chat.jid_row_id = jid._id
-                    LEFT JOIN jid jid_group
-                        ON jid_group._id = message.sender_jid_row_id
-                    LEFT JOIN jid_map as jid_map_global
-                        ON chat.jid_row_id = jid_map_global.lid_row_id
-                    LEFT JOIN jid lid_global
-                        ON jid_map_global.jid_row_id = lid_global._id
-                    LEFT JOIN jid_map as jid_map_group
-                        ON message.sender_jid_row_id = jid_map_group.lid_row_id
-                    LEFT JOIN jid lid_group
-                        ON jid_map_group.jid_row_id = lid_group._id
-             WHERE 1=1
-                {empty_filter}
-                {date_filter}
-                {include_filter}
-                {exclude_filter}
-             ORDER BY messages.key_remote_jid ASC;"""
-    c.execute(query)
-    return c.fetchall()
-
-
-def _execute_vcard_query_legacy(c, filter_date, filter_chat, filter_empty):
-    """Execute vCard query for legacy WhatsApp database schema."""
-
-    # Build the filter conditions
-    chat_filter_include = get_chat_condition(
-        filter_chat[0], True, ["key_remote_jid", "jid_group.raw_string"], "jid", "android")
-    chat_filter_exclude = get_chat_condition(
-        filter_chat[1], False, ["key_remote_jid", "jid_group.raw_string"], "jid", "android")
-    date_filter = f'AND message.timestamp {filter_date}' if filter_date is not None else ''
-    empty_filter = get_cond_for_empty(filter_empty, "key_remote_jid", "broadcast")
+def _get_vcards(c, schema, table_message, partition=None):
+    """
+    Get the vCards of all messages, keyed by the row id of their message.
 
-    query = f"""SELECT message_row_id,
-                jid.raw_string as key_remote_jid,
-                vcard,
-                message.text_data as media_name
-             FROM message_vcard
-                INNER JOIN message
-                    ON message_vcard.message_row_id = message._id
-                LEFT JOIN chat
-                    ON chat._id = message.chat_row_id
-                INNER JOIN jid
-                    ON jid._id = chat.jid_row_id
-                LEFT JOIN jid jid_group
-                    ON jid_group._id = message.sender_jid_row_id
-            WHERE 1=1
-                {empty_filter}
-                {date_filter}
-                {chat_filter_include}
-                {chat_filter_exclude}
-             ORDER BY message.chat_row_id ASC;"""
-    c.execute(query)
-    return c.fetchall()
+    vCards are rare, so they are read from the vCard table alone and looked up
+    while the messages are processed, instead of joining them to the message query.
+    """
+    if not schema.has_table("message_vcard" if table_message else "messages_vcards"):
+        return {}
+    _execute_vcard_query(c, table_message, partition)
+    vcards = {}
+    for rows in fetch_rows(c):
+        for message_row_id, vcard, media_name in rows:
+            vcards.setdefault(message_row_id, []).append((vcard, media_name))
+    return vcards
+
+
+def _execute_vcard_query(c, table_message, partition=None):
+    """Execute vCard query for the new (table_message) or legacy WhatsApp database schema."""
+    if table_message:
+        partition_filter = get_partition_condition("message.chat_row_id", partition)
+        c.execute(f"""SELECT message_row_id,
+                        vcard,
+                        message.text_data as media_name
+                     FROM message_vcard
+                        INNER JOIN message
+                            ON message_vcard.message_row_id = message._id
+                     WHERE 1=1
+                        {partition_filter}""")
+    else:
+        partition_filter = get_partition_condition("messages.key_remote_jid", partition)
+        c.execute(f"""SELECT message_row_id,
+                        vcard,
+                        messages.media_name
+                     FROM messages_vcards
+                        INNER JOIN messages
+                            ON messages_vcards.message_row_id = messages._id
+                     WHERE 1=1
+                        {partition_filter}""")
 
 
-def _process_vcard_row(row, path, data):
-    """Process a single vCard row and save to file."""
-    media_name = row["media_name"] if row["media_name"] is not None else "Undefined vCard File"
+def _process_vcard(message, vcard, media_name, path):
+    """Save a vCard of a message to file and link it from the message."""
+    media_name = media_name if media_name is not None else "Undefined vCard File"
     file_name = "".join(x for x in media_name if x.isalnum())
     file_name = file_name.encode('utf-8')[:230].decode('utf-8', 'ignore')
     file_path = os.path.join(path, f"{file_name}.vcf")
 
     if not os.path.isfile(file_path):
         with open(file_path, "w", encoding="utf-8") as f:
-            f.write(row["vcard"])
+            f.write(vcard)
 
-    message = data.get_chat(row["key_remote_jid"]).get_message(row["message_row_id"])
     message.data = "This media include the following vCard file(s):<br>" \
         f'<a href="{htmle(file_path)}">{htmle(media_name)}</a>'
     message.mime = "text/x-vcard"
@@ -930,65 +853,59 @@ def _process_vcard_row(row, path, data):
 def calls(db, data, timezone_offset, filter_chat):
     """Process call logs from WhatsApp database."""
     c = db.cursor()
+    schema = _get_schema(db, data)
+    if not schema.has_table("call_log"):
+        return
 
-    # Check if there are any calls that match the filter
-    total_row_number = _get_calls_count(c, filter_chat)
+    # Skip the query if the call log is empty
+    total_row_number = estimate_row_count(db, "call_log", data.get_system("no_count"))
     if total_row_number == 0:
         return
 
-    logging.info(f"Processing calls...({total_row_number})", extra={"clear": True})
+    logging.info("Processing calls...", extra={"clear": True})
 
     # Fetch call data
-    calls_data = _fetch_calls_data(c, filter_chat)
+    calls_data = _fetch_calls_data(
+        c, resolve_chat_filter(db, data, filter_chat, (_get_jid_filter_query(db, data),)), schema.has_table("jid_map"))
 
     # Create a chat store for all calls
     chat = ChatStore(Device.ANDROID, "WhatsApp Calls")
 
     # Process each call
+    col = column_index(calls_data)
     with tqdm(total=total_row_number, desc="Processing calls", unit="call", leave=False) as pbar:
-        while (content := _fetch_row_safely(calls_data)) is not None:
-            _process_call_record(content, chat, data, timezone_offset)
-            pbar.update(1)
+        for rows in fetch_rows(calls_data):
+            for content in rows:
+                _process_call_record(content, col, chat, data, timezone_offset)
+            pbar.update(len(rows))
         total_time = pbar.format_dict['elapsed']
+        total_row_number = pbar.n
+    if total_row_number == 0:
+        return
 
     # Add the calls chat to the data
     data.add_chat("000000000000000", chat)
     logging.info(f"Processed {total_row_number} calls in {convert_time_unit(total_time)}")
 
-def _get_calls_count(c, filter_chat):
-    """Get the count of call records that match the filter."""
+
+def _fetch_calls_data(c, chat_filter_ids, jid_map_exists):
+    """Fetch call data from the database, with the chat filters resolved to the row ids of the matching JIDs."""
 
     # Build the filter conditions
-    include_filter = get_chat_condition(filter_chat[0], True, ["key_remote_jid"])
-    exclude_filter = get_chat_condition(filter_chat[1], False, ["key_remote_jid"])
+    include_filter = get_chat_id_condition(chat_filter_ids[0], True, ["call_log.jid_row_id"])
+    exclude_filter = get_chat_id_condition(chat_filter_ids[1], False, ["call_log.jid_row_id"])
 
-    query = f"""SELECT count(),
-                COALESCE(lid_global.raw_string, jid.raw_string) as key_remote_jid
-            FROM call_log
-                INNER JOIN jid
-                    ON call_log.jid_row_id = jid._id
-                LEFT JOIN chat
-                    ON call_log.jid_row_id = chat.jid_row_id
-                LEFT JOIN jid_map as jid_map_global
+    if jid_map_exists:
+        remote_jid_selection = "COALESCE(lid_global.raw_string, jid.raw_string)"
+        jid_map_join = """LEFT JOIN jid_map as jid_map_global
                     ON chat.jid_row_id = jid_map_global.lid_row_id
                 LEFT JOIN jid lid_global
-                    ON jid_map_global.jid_row_id = lid_global._id
-            WHERE 1=1
-                {include_filter}
-                {exclude_filter}"""
-    c.execute(query)
-    return c.fetchone()[0]
-
-
-def _fetch_calls_data(c, filter_chat):
-    """Fetch call data from the database."""
-
-    # Build the filter conditions
-    include_filter = get_chat_condition(filter_chat[0], True, ["key_remote_jid"])
-    exclude_filter = get_chat_condition(filter_chat[1], False, ["key_remote_jid"])
+                    ON jid_map_global.jid_row_id = lid_global._id"""
+    else:
+        remote_jid_selection, jid_map_join = "jid.raw_string", ""
 
     query = f"""SELECT call_log._id,
-                    COALESCE(lid_global.raw_string, jid.raw_string) as key_remote_jid,
+                    {remote_jid_selection} as key_remote_jid,
                     from_me,
                     call_id,
                     timestamp,
@@ -1002,10 +919,7 @@ def _fetch_calls_data(c, filter_chat):
                     ON call_log.jid_row_id = jid._id
                 LEFT JOIN chat
                     ON call_log.jid_row_id = chat.jid_row_id
-                LEFT JOIN jid_map as jid_map_global
-                    ON chat.jid_row_id = jid_map_global.lid_row_id
-                LEFT JOIN jid lid_global
-                    ON jid_map_global.jid_row_id = lid_global._id
+                {jid_map_join}
             WHERE 1=1
                 {include_filter}
                 {exclude_filter}"""
@@ -1013,54 +927,51 @@ def _fetch_calls_data(c, filter_chat):
     return c
 
 
-def _process_call_record(content, chat, data, timezone_offset):
-    """Process a single call record and add it to the chat."""
+def _process_call_record(content, col, chat, data, timezone_offset):
+    """Process a single call record, a tuple row whose column positions are given by col, and add it to the chat."""
     call = Message(
-        from_me=content["from_me"],
-        timestamp=content["timestamp"],
-        time=content["timestamp"],
-        key_id=content["call_id"],
+        from_me=content[col.from_me],
+        timestamp=content[col.timestamp],
+        time=content[col.timestamp],
+        key_id=content[col.call_id],
         timezone_offset=timezone_offset,
         received_timestamp=None,  # TODO: Add timestamp
         read_timestamp=None  # TODO: Add timestamp
     )
 
     # Get caller/callee name
-    _jid = content["key_remote_jid"]
-    name = data.get_chat(_jid).name if _jid in data else content["chat_subject"] or None
-    if _jid is not None and "@" in _jid:
-        fallback = _jid.split('@')[0]
-    else:
-        fallback = None
-    call.sender = name or fallback
+    _jid = content[col.key_remote_jid]
+    # The subject is only used for callers without a chat
+    name = None if _jid in data else content[col.chat_subject]
+    call.sender = name or data.names.resolve(_jid)
 
     # Set metadata
     call.meta = True
 
     # Construct call description based on call type and result
-    call.data = _construct_call_description(content, call)
+    call.data = _construct_call_description(content, col, call)
 
     # Add call to chat
-    chat.add_message(content["_id"], call)
+    chat.add_message(content[col._id], call)
 
 
-def _construct_call_description(content, call):
+def _construct_call_description(content, col, call):
     """Construct a description of the call based on its type and result."""
     description = (
-        f"A {'video' if content['video_call'] else 'voice'} "
+        f"A {'video' if content[col.video_call] else 'voice'} "
         f"call {'to' if call.from_me else 'from'} "
         f"{call.sender} was "
     )
 
-    if content['call_result'] in (0, 4, 7):
+    if content[col.call_result] in (0, 4, 7):
         description += "cancelled." if call.from_me else "missed."
-    elif content['call_result'] == 2:
+    elif content[col.call_result] == 2:
         description += "not answered." if call.from_me else "missed."
-    elif content['call_result'] == 3:
+    elif content[col.call_result] == 3:
         description += "unavailable."
-    elif content['call_result'] == 5:
-        call_time = convert_time_unit(content['duration'])
-        call_bytes = bytes_to_readable(content['bytes_transferred'])
+    elif content[col.call_result] == 5:
+        call_time = convert_time_unit(content[col.duration])
+        call_bytes = bytes_to_readable(content[col.bytes_transferred])
         description += (
             f"initiated and lasted for {call_time} "
             f"with {call_bytes} data transferred."
@@ -1152,6 +1063,8 @@ def _generate_paginated_chat(current_chat, safe_file_name, name, contact, output
     current_size = 0
     current_page = 1
     render_box = []
+    # The page of each message already written, for replies to link to
+    reply_pages = {}
 
     # Use default maximum size if set to 0
     if maximum_size == 0:
@@ -1179,8 +1092,11 @@ def _generate_paginated_chat(current_chat, safe_file_name, name, contact, output
                 current_chat,
                 headline,
                 next=f"{safe_file_name}-{current_page + 1}.html",
-                previous=f"{safe_file_name}-{current_page - 1}.html" if current_page > 1 else False
+                previous=f"{safe_file_name}-{current_page - 1}.html" if current_page > 1 else False,
+                reply_pages=reply_pages
             )
+            page = f"{safe_file_name}-{current_page}.html"
+            reply_pages.update((rendered.key_id, page) for rendered in render_box)
             render_box = [message]
             current_size = 0
             current_page += 1
@@ -1202,7 +1118,8 @@ def _generate_paginated_chat(current_chat, safe_file_name, name, contact, output
                     current_chat,
                     headline,
                     False,
-                    previous=f"{safe_file_name}-{current_page - 1}.html"
+                    previous=f"{safe_file_name}-{current_page - 1}.html",
+                    reply_pages=reply_pages
                 )
 
 
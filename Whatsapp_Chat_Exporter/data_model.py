@@ -1,21 +1,45 @@
 import os
+import math
+import pickle
+import sqlite3
+from collections import OrderedDict
 from datetime import datetime, tzinfo, timedelta
-from typing import MutableMapping, Union, Optional, Dict, Any
+from bisect import bisect_left, bisect_right
+from functools import partial
+from operator import attrgetter
+from types import MappingProxyType
+from typing import Callable, List, Mapping, MutableMapping, Union, Optional, Dict, Any
 
 
 class Timing:
     """
     Handles timestamp formatting with timezone support.
+
+    The offset is fixed, so the clock time of a timestamp follows from its whole seconds alone.
+    The two formats used for every message are therefore built from a table of "%H:%M" strings
+    and a cache of "%Y/%m/%d" dates, while other formats go through strftime. The offset may be
+    a float, such as the local offset or 5.5 hours, as long as it is a whole number of seconds.
     """
 
-    def __init__(self, timezone_offset: Optional[int]) -> None:
+    # Every "%H:%M" of a day, shared by all messages sent in the same minute of the day
+    _MINUTES = tuple(f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(1440))
+
+    def __init__(self, timezone_offset: Optional[Union[int, float]]) -> None:
         """
         Initialize Timing object.
 
         Args:
-            timezone_offset (Optional[int]): Hours offset from UTC
+            timezone_offset (Optional[Union[int, float]]): Hours offset from UTC
         """
         self.timezone_offset = timezone_offset
+        self._timezone = TimeZone(timezone_offset)
+        self._days: Dict[int, str] = {}
+        # The offset in whole seconds, or None if the formats must go through strftime
+        self._offset_seconds: Optional[int] = None
+        if isinstance(timezone_offset, (int, float)):
+            offset = timedelta(hours=timezone_offset)
+            if not offset.microseconds:
+                self._offset_seconds = offset.days * 86400 + offset.seconds
 
     def format_timestamp(self, timestamp: Optional[Union[int, float]], format: str) -> Optional[str]:
         """
@@ -28,10 +52,38 @@ class Timing:
         Returns:
             Optional[str]: Formatted timestamp string, or None if timestamp is None
         """
-        if timestamp is not None:
-            timestamp = timestamp / 1000 if timestamp > 9999999999 else timestamp
-            return datetime.fromtimestamp(timestamp, TimeZone(self.timezone_offset)).strftime(format)
-        return None
+        if timestamp is None:
+            return None
+        timestamp = timestamp / 1000 if timestamp > 9999999999 else timestamp
+        if self._offset_seconds is not None:
+            if format == "%H:%M":
+                seconds = self._whole_seconds(timestamp) + self._offset_seconds
+                return self._MINUTES[seconds % 86400 // 60]
+            if format == "%Y/%m/%d %H:%M":
+                seconds = self._whole_seconds(timestamp)
+                day, second = divmod(seconds + self._offset_seconds, 86400)
+                date = self._days.get(day)
+                if date is None:
+                    date = self._days[day] = datetime.fromtimestamp(
+                        seconds, self._timezone).strftime("%Y/%m/%d ")
+                return date + self._MINUTES[second // 60]
+        return datetime.fromtimestamp(timestamp, self._timezone).strftime(format)
+
+    @staticmethod
+    def _whole_seconds(timestamp: Union[int, float]) -> int:
+        """
+        Get the whole seconds of a timestamp as datetime.fromtimestamp sees them, which rounds
+        the fraction to microseconds, half to even, before splitting off the seconds.
+        """
+        if isinstance(timestamp, int):
+            return timestamp
+        fraction, seconds = math.modf(timestamp)
+        microseconds = round(fraction * 1e6)
+        if microseconds >= 1000000:
+            seconds += 1
+        elif microseconds < 0:
+            seconds -= 1
+        return int(seconds)
 
 
 class TimeZone(tzinfo):
@@ -48,6 +100,10 @@ class TimeZone(tzinfo):
         """
         self.offset = offset
 
+    def __getinitargs__(self) -> tuple:
+        """Arguments to recreate the timezone when unpickled, as in the worker processes."""
+        return (self.offset,)
+
     def utcoffset(self, dt: Optional[datetime]) -> timedelta:
         """Get UTC offset."""
         return timedelta(hours=self.offset)
@@ -67,6 +123,7 @@ class ChatCollection(MutableMapping):
         """Initialize an empty chat collection."""
         self._chats: Dict[str, ChatStore] = {}
         self._system: Dict[str, Any] = {}
+        self.names = NameResolver(self)
 
     def __getitem__(self, key: str) -> 'ChatStore':
         """Get a chat by its ID. Required for dict-like access."""
@@ -82,6 +139,10 @@ class ChatCollection(MutableMapping):
         """Delete a chat by its ID. Required for dict-like access."""
         del self._chats[key]
 
+    def __contains__(self, key: object) -> bool:
+        """Check if a chat exists, without the KeyError of the default implementation."""
+        return key in self._chats
+
     def __iter__(self):
         """Iterate over chat IDs. Required for dict-like access."""
         return iter(self._chats)
@@ -102,6 +163,19 @@ class ChatCollection(MutableMapping):
         """
         return self._chats.get(chat_id)
 
+    def get_name(self, chat_id: Optional[str]) -> Optional[str]:
+        """
+        Get the name of a chat, without using the chat otherwise.
+
+        Args:
+            chat_id (Optional[str]): The ID of the chat
+
+        Returns:
+            Optional[str]: The name of the chat, None if it has no name or is not found
+        """
+        chat = self._chats.get(chat_id)
+        return chat.name if chat is not None else None
+
     def add_chat(self, chat_id: str, chat: 'ChatStore') -> None:
         """
         Add a new chat to the collection.
@@ -172,9 +246,211 @@ class ChatCollection(MutableMapping):
         self._system[key] = value 
 
 
+class SpillingChatCollection(ChatCollection):
+    """
+    A collection of chats that keeps the messages of only the most recently used chats in memory
+    and spills those of the others to a temporary SQLite database, one row per message, for
+    exports larger than the available memory.
+
+    The chats themselves, with their names, always stay in memory. Messages added to a spilled
+    chat are appended to its rows when it is spilled again, and the rows are only read back once
+    the messages of the chat are read. Changes to a Message object kept after its chat was spilled
+    are not seen by the collection, which reads back its own copy.
+    """
+
+    def __init__(self, max_chats: int = 64, path: str = "") -> None:
+        """
+        Initialize SpillingChatCollection object.
+
+        Args:
+            max_chats (int): Number of chats whose messages are kept in memory. Defaults to 64
+            path (str): Database to spill to. Defaults to a temporary file removed when closed
+        """
+        super().__init__()
+        if max_chats < 1:
+            raise ValueError("max_chats must be a positive integer")
+        self.max_chats = max_chats
+        # The chats that might have messages in memory, least recently used first
+        self._recent: OrderedDict[str, None] = OrderedDict()
+        # The Timing objects shared by the messages, stored by their position
+        self._timings: List[Timing] = []
+        self._timing_positions: Dict[int, int] = {}
+        self._store = sqlite3.connect(path)
+        self._store.execute("""CREATE TABLE IF NOT EXISTS message (
+                                   chat_id TEXT NOT NULL,
+                                   id,
+                                   timing INTEGER NOT NULL,
+                                   state BLOB NOT NULL
+                               )""")
+        self._store.execute("CREATE INDEX IF NOT EXISTS message_chat ON message (chat_id)")
+
+    def __getitem__(self, key: str) -> 'ChatStore':
+        """Get a chat by its ID, as the most recently used one."""
+        chat = self._chats[key]
+        self._use(key)
+        return chat
+
+    def __setitem__(self, key: str, value: 'ChatStore') -> None:
+        """Set a chat by its ID. Required for dict-like access."""
+        if not isinstance(value, ChatStore):
+            raise TypeError("Value must be a ChatStore object")
+        if self._chats.get(key, value) is not value:
+            self._discard(key)
+        self._chats[key] = value
+        self._use(key)
+
+    def __delitem__(self, key: str) -> None:
+        """Delete a chat by its ID, with its spilled messages."""
+        self._discard(key)
+        del self._chats[key]
+        self._recent.pop(key, None)
+
+    def get_chat(self, chat_id: str) -> Optional['ChatStore']:
+        """
+        Get a chat by its ID.
+
+        Args:
+            chat_id (str): The ID of the chat to retrieve
+
+        Returns:
+            Optional['ChatStore']: The chat if found, None otherwise
+        """
+        chat = self._chats.get(chat_id)
+        if chat is not None:
+            self._use(chat_id)
+        return chat
+
+    def add_chat(self, chat_id: str, chat: 'ChatStore') -> 'ChatStore':
+        """
+        Add a new chat to the collection.
+
+        Args:
+            chat_id (str): The ID for the chat
+            chat (ChatStore): The chat to add
+
+        Raises:
+            TypeError: If chat is not a ChatStore object
+        """
+        if not isinstance(chat, ChatStore):
+            raise TypeError("Chat must be a ChatStore object")
+        self[chat_id] = chat
+        return chat
+
+    def remove_chat(self, chat_id: str) -> None:
+        """
+        Remove a chat from the collection.
+
+        Args:
+            chat_id (str): The ID of the chat to remove
+        """
+        if chat_id in self._chats:
+            del self[chat_id]
+
+    def close(self) -> None:
+        """Close the database, which removes it if it is temporary. The collection is unusable afterwards."""
+        for chat in self._chats.values():
+            chat._spilled = None
+        self._store.close()
+
+    def _use(self, chat_id: str) -> None:
+        """Mark a chat as the most recently used one and spill the least recently used."""
+        recent = self._recent
+        recent[chat_id] = None
+        recent.move_to_end(chat_id)
+        while len(recent) > self.max_chats:
+            self._spill(recent.popitem(last=False)[0])
+
+    def _spill(self, chat_id: str) -> None:
+        """Append the messages of a chat that are in memory to its rows and release them."""
+        chat = self._chats[chat_id]
+        if not chat._messages:
+            return
+        state = attrgetter(*_SPILLED_SLOTS)
+        rows = []
+        for id, message in chat._messages.items():
+            rows.append((chat_id, id, self._timing_position(message._timing),
+                         pickle.dumps(state(message), pickle.HIGHEST_PROTOCOL)))
+        self._store.executemany("INSERT INTO message (chat_id, id, timing, state) VALUES (?, ?, ?, ?)", rows)
+        chat._messages = {}
+        chat._drop_indexes()
+        if chat._spilled is None:
+            chat._spilled = partial(self._load, chat_id)
+
+    def _load(self, chat_id: str) -> Dict[str, 'Message']:
+        """Read back and remove the rows of a chat, once its messages are read."""
+        messages = {}
+        rows = self._store.execute(
+            "SELECT id, timing, state FROM message WHERE chat_id = ? ORDER BY rowid", (chat_id,))
+        for id, timing, state in rows:
+            message = messages[id] = Message.__new__(Message)
+            message._timing = self._timings[timing]
+            for slot, value in zip(_SPILLED_SLOTS, pickle.loads(state)):
+                setattr(message, slot, value)
+        self._store.execute("DELETE FROM message WHERE chat_id = ?", (chat_id,))
+        self._use(chat_id)
+        return messages
+
+    def _timing_position(self, timing: 'Timing') -> int:
+        """Get the position of a Timing object, adding it if it is new."""
+        try:
+            return self._timing_positions[id(timing)]
+        except KeyError:
+            self._timings.append(timing)
+            position = self._timing_positions[id(timing)] = len(self._timings) - 1
+            return position
+
+    def _discard(self, chat_id: str) -> None:
+        """Remove the rows of a chat that is replaced or deleted."""
+        chat = self._chats.get(chat_id)
+        if chat is not None and chat._spilled is not None:
+            chat._spilled = None
+            self._store.execute("DELETE FROM message WHERE chat_id = ?", (chat_id,))
+
+
+class NameResolver:
+    """
+    Resolves JIDs to display names for senders and callers.
+
+    The name of a JID is the name of its chat, from the contacts, push names and vCards,
+    otherwise the user part of the JID. The user parts are split once per JID and shared by
+    all messages of the sender, while names are read from the chats so that renames are seen.
+    """
+
+    def __init__(self, data: ChatCollection) -> None:
+        """
+        Initialize NameResolver object.
+
+        Args:
+            data (ChatCollection): The chats whose names are resolved
+        """
+        self._data = data
+        self._fallbacks: Dict[str, Optional[str]] = {}
+
+    def name(self, jid: Optional[str]) -> Optional[str]:
+        """Get the name of the chat of a JID, or None if it has no chat or no name."""
+        return self._data.get_name(jid)
+
+    def fallback(self, jid: str) -> Optional[str]:
+        """Get the user part of a JID, or None if it is not a full JID."""
+        try:
+            return self._fallbacks[jid]
+        except KeyError:
+            user = self._fallbacks[jid] = jid.split('@')[0] if "@" in jid else None
+            return user
+
+    def resolve(self, jid: Optional[str]) -> Optional[str]:
+        """Get the display name of a JID, falling back to its user part, or None if it has neither."""
+        if jid is None:
+            return None
+        return self.name(jid) or self.fallback(jid)
+
+
 class ChatStore:
     """
     Stores chat information and messages.
+
+    Messages are kept in insertion order by their id. Lookups by key_id and by time range are
+    served by secondary indexes, built on the first such lookup and kept up to date afterwards.
     """
 
     def __init__(self, type: str, name: Optional[str] = None, media: Optional[str] = None) -> None:
@@ -193,6 +469,11 @@ class ChatStore:
             raise TypeError("Name must be a string or None")
         self.name = name
         self._messages: Dict[str, 'Message'] = {}
+        self._key_ids: Optional[Dict[Union[int, str], 'Message']] = None
+        self._timestamps: Optional[List[Union[int, float]]] = None
+        self._timestamp_ids: Optional[List[str]] = None
+        # Reads back the messages spilled by a SpillingChatCollection
+        self._spilled: Optional[Callable[[], Dict[str, 'Message']]] = None
         self.type = type
         if media is not None:
             from Whatsapp_Chat_Exporter.utility import Device
@@ -211,29 +492,117 @@ class ChatStore:
 
     def __len__(self) -> int:
         """Get number of chats. Required for dict-like access."""
+        self._restore()
         return len(self._messages)
 
     def add_message(self, id: str, message: 'Message') -> None:
         """Add a message to the chat store."""
         if not isinstance(message, Message):
             raise TypeError("message must be a Message object")
+        if id in self._messages:
+            # The replaced message might be anywhere in the indexes
+            self._drop_indexes()
+        elif self._key_ids is not None or self._timestamps is not None:
+            self._index_message(id, message)
         self._messages[id] = message
 
     def get_message(self, id: str) -> 'Message':
         """Get a message from the chat store."""
-        return self._messages.get(id)
+        message = self._messages.get(id)
+        if message is None and self._spilled is not None:
+            self._restore()
+            message = self._messages.get(id)
+        return message
 
     def delete_message(self, id: str) -> None:
         """Delete a message from the chat store."""
+        self._restore()
         if id in self._messages:
-            del self._messages[id]
+            message = self._messages.pop(id)
+            if self._key_ids is not None and self._key_ids.get(message.key_id) is message:
+                # Another message might have the same key_id, so it is rebuilt when needed
+                self._key_ids = None
+            if self._timestamps is not None:
+                position = bisect_left(self._timestamps, message.timestamp)
+                while self._timestamp_ids[position] != id:
+                    position += 1
+                del self._timestamps[position]
+                del self._timestamp_ids[position]
+
+    def get_message_by_key_id(self, key_id: Union[int, str]) -> Optional['Message']:
+        """
+        Get a message by its key_id, such as the one a reply refers to.
+
+        Args:
+            key_id (Union[int, str]): The key_id of the message
+
+        Returns:
+            Optional[Message]: The message, the last added one if several share the key_id
+        """
+        self._restore()
+        if self._key_ids is None:
+            self._key_ids = {message.key_id: message for message in self._messages.values()}
+        return self._key_ids.get(key_id)
+
+    def messages_between(
+            self,
+            start: Optional[Union[int, float]] = None,
+            end: Optional[Union[int, float]] = None
+    ) -> List['Message']:
+        """
+        Get the messages sent in a time range, ordered by their timestamp.
+
+        Args:
+            start (Optional[Union[int, float]]): Unix timestamp in seconds, included. Defaults to no limit
+            end (Optional[Union[int, float]]): Unix timestamp in seconds, excluded. Defaults to no limit
+
+        Returns:
+            List[Message]: The messages in the range
+        """
+        self._restore()
+        if self._timestamps is None:
+            ordered = sorted(self._messages.items(), key=lambda item: item[1].timestamp)
+            self._timestamp_ids = [id for id, _ in ordered]
+            self._timestamps = [message.timestamp for _, message in ordered]
+        first = 0 if start is None else bisect_left(self._timestamps, start)
+        last = len(self._timestamps) if end is None else bisect_left(self._timestamps, end)
+        return [self._messages[id] for id in self._timestamp_ids[first:last]]
+
+    def _index_message(self, id: str, message: 'Message') -> None:
+        """Add a new message to the indexes that are built."""
+        if self._key_ids is not None:
+            self._key_ids[message.key_id] = message
+        if self._timestamps is not None:
+            if not self._timestamps or message.timestamp >= self._timestamps[-1]:
+                self._timestamps.append(message.timestamp)
+                self._timestamp_ids.append(id)
+            else:
+                position = bisect_right(self._timestamps, message.timestamp)
+                self._timestamps.insert(position, message.timestamp)
+                self._timestamp_ids.insert(position, id)
+
+    def _drop_indexes(self) -> None:
+        """Drop the indexes, to be built again on the next lookup."""
+        self._key_ids = None
+        self._timestamps = None
+        self._timestamp_ids = None
+
+    def _restore(self) -> None:
+        """Read back the spilled messages, if any, ahead of those added since the chat was spilled."""
+        if self._spilled is not None:
+            load, self._spilled = self._spilled, None
+            messages = load()
+            messages.update(self._messages)
+            self._messages = messages
+            self._drop_indexes()
 
     def to_json(self) -> Dict[str, Any]:
         """Convert chat store to JSON-serializable dict."""
+        self._restore()
         json_dict = {
             key: value
             for key, value in self.__dict__.items()
-            if key != '_messages'
+            if not key.startswith('_')
         }
         json_dict['messages'] = {id: msg.to_json() for id, msg in self._messages.items()}
         return json_dict
@@ -250,20 +619,32 @@ class ChatStore:
             chat.add_message(id, message)
         return chat
 
+    def clear_messages(self) -> None:
+        """Remove all messages from the chat store, e.g. once they are written."""
+        self._restore()
+        self._messages = {}
+        self._drop_indexes()
+
     def get_last_message(self) -> 'Message':
-        """Get the most recent message in the chat."""
-        return tuple(self._messages.values())[-1]
+        """Get the last added message in the chat."""
+        self._restore()
+        for message in reversed(self._messages.values()):
+            return message
+        raise IndexError("The chat has no messages")
 
     def items(self):
         """Get message items pairs."""
+        self._restore()
         return self._messages.items()
 
     def values(self):
         """Get all messages in the chat."""
+        self._restore()
         return self._messages.values()
 
     def keys(self):
         """Get all message keys in the chat."""
+        self._restore()
         return self._messages.keys()
 
     def merge_with(self, other: 'ChatStore'):
@@ -285,14 +666,34 @@ class ChatStore:
         self.status = other.status or self.status
 
         # Merge messages
+        self._restore()
+        other._restore()
         self._messages.update(other._messages)
+        self._drop_indexes()
+
+    def sort_messages(self) -> None:
+        """Sort the messages by their timestamp, after merging messages extracted separately."""
+        self._restore()
+        self._messages = dict(sorted(self._messages.items(), key=lambda item: (item[1].timestamp, item[0])))
 
 
 class Message:
     """
     Represents a single message in a chat.
+
+    Messages are the most numerous objects of an export, so their attributes are kept in
+    slots rather than in a per-instance dict. Reactions are only allocated for the messages
+    that have some, and the times are kept as epochs until they are first read, with the
+    Timing shared by all messages of the export.
     """
 
+    __slots__ = (
+        "from_me", "timestamp", "_time", "media", "key_id", "meta", "data", "sender", "safe",
+        "mime", "message_type", "_received_timestamp", "_read_timestamp", "reply", "quoted_data",
+        "caption", "thumb", "sticker", "_reactions", "_timing"
+    )
+    _NO_REACTIONS = MappingProxyType({})
+
     def __init__(
             self,
             *,
@@ -323,13 +724,8 @@ class Message:
         """
         self.from_me = bool(from_me)
         self.timestamp = timestamp / 1000 if timestamp > 9999999999 else timestamp
-
-        if isinstance(time, (int, float)):
-            self.time = timezone_offset.format_timestamp(self.timestamp, "%H:%M")
-        elif isinstance(time, str):
-            self.time = time
-        else:
-            raise TypeError("Time must be a string or number")
+        self._timing = timezone_offset
+        self.time = time
 
         self.media = False
         self.key_id = key_id
@@ -339,20 +735,8 @@ class Message:
         self.safe = False
         self.mime = None
         self.message_type = message_type
-        if isinstance(received_timestamp, (int, float)):
-            self.received_timestamp = timezone_offset.format_timestamp(
-                received_timestamp, "%Y/%m/%d %H:%M")
-        elif isinstance(received_timestamp, str):
-            self.received_timestamp = received_timestamp
-        else:
-            self.received_timestamp = None
-        if isinstance(read_timestamp, (int, float)):
-            self.read_timestamp = timezone_offset.format_timestamp(
-                read_timestamp, "%Y/%m/%d %H:%M")
-        elif isinstance(read_timestamp, str):
-            self.read_timestamp = read_timestamp
-        else:
-            self.read_timestamp = None
+        self.received_timestamp = received_timestamp
+        self.read_timestamp = read_timestamp
 
         # Extra attributes
         self.reply = None
@@ -360,13 +744,92 @@ class Message:
         self.caption = None
         self.thumb = None  # Android specific
         self.sticker = False
-        self.reactions = {}
+        self._reactions = None
+
+    @property
+    def time(self) -> str:
+        """Time of the message as "%H:%M", formatted from the timestamp when first read."""
+        if self._time is None:
+            self._time = self._timing.format_timestamp(self.timestamp, "%H:%M")
+        return self._time
+
+    @time.setter
+    def time(self, value: Union[int, float, str]) -> None:
+        if isinstance(value, (int, float)):
+            # Formatted from the timestamp on first access
+            self._time = None
+        elif isinstance(value, str):
+            self._time = value
+        else:
+            raise TypeError("Time must be a string or number")
+
+    @property
+    def received_timestamp(self) -> Optional[str]:
+        """When the message was received as "%Y/%m/%d %H:%M", formatted when first read."""
+        if isinstance(self._received_timestamp, (int, float)):
+            self._received_timestamp = self._timing.format_timestamp(
+                self._received_timestamp, "%Y/%m/%d %H:%M")
+        return self._received_timestamp
+
+    @received_timestamp.setter
+    def received_timestamp(self, value: Union[int, float, str, None]) -> None:
+        self._received_timestamp = value if isinstance(value, (int, float, str)) else None
+
+    @property
+    def read_timestamp(self) -> Optional[str]:
+        """When the message was read as "%Y/%m/%d %H:%M", formatted when first read."""
+        if isinstance(self._read_timestamp, (int, float)):
+            self._read_timestamp = self._timing.format_timestamp(
+                self._read_timestamp, "%Y/%m/%d %H:%M")
+        return self._read_timestamp
+
+    @read_timestamp.setter
+    def read_timestamp(self, value: Union[int, float, str, None]) -> None:
+        self._read_timestamp = value if isinstance(value, (int, float, str)) else None
+
+    @property
+    def reactions(self) -> Mapping[str, str]:
+        """Reactions to the message, keyed by the name of the sender."""
+        return self._reactions or self._NO_REACTIONS
+
+    @reactions.setter
+    def reactions(self, value: Optional[Dict[str, str]]) -> None:
+        self._reactions = dict(value) if value else None
+
+    def add_reaction(self, sender: str, reaction: str) -> None:
+        """
+        Add or replace the reaction of a sender.
+
+        Args:
+            sender (str): Name of the sender of the reaction
+            reaction (str): The reaction
+        """
+        if self._reactions is None:
+            self._reactions = {}
+        self._reactions[sender] = reaction
 
     def to_json(self) -> Dict[str, Any]:
         """Convert message to JSON-serializable dict."""
         return {
-            key: value
-            for key, value in self.__dict__.items()
+            "from_me": self.from_me,
+            "timestamp": self.timestamp,
+            "time": self.time,
+            "media": self.media,
+            "key_id": self.key_id,
+            "meta": self.meta,
+            "data": self.data,
+            "sender": self.sender,
+            "safe": self.safe,
+            "mime": self.mime,
+            "message_type": self.message_type,
+            "received_timestamp": self.received_timestamp,
+            "read_timestamp": self.read_timestamp,
+            "reply": self.reply,
+            "quoted_data": self.quoted_data,
+            "caption": self.caption,
+            "thumb": self.thumb,
+            "sticker": self.sticker,
+            "reactions": dict(self._reactions) if self._reactions else {}
         }
 
     @classmethod
@@ -386,3 +849,7 @@ class Message:
             if hasattr(message, key) and key not in added:
                 setattr(message, key, value)
         return message
+
+
+# The slots of a message stored by SpillingChatCollection, besides its shared Timing
+_SPILLED_SLOTS = tuple(slot for slot in Message.__slots__ if slot != "_timing")
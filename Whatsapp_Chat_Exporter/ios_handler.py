@@ -10,7 +10,9 @@ from mimetypes import MimeTypes
 from markupsafe import escape as htmle
 from Whatsapp_Chat_Exporter.data_model import ChatStore, Message
 from Whatsapp_Chat_Exporter.utility import APPLE_TIME, get_chat_condition, Device
-from Whatsapp_Chat_Exporter.utility import bytes_to_readable, convert_time_unit, safe_name
+from Whatsapp_Chat_Exporter.utility import bytes_to_readable, convert_time_unit, safe_name, estimate_row_count
+from Whatsapp_Chat_Exporter.utility import get_partition_condition, balance_partitions, group_chat_counts
+from Whatsapp_Chat_Exporter.utility import get_chat_id_condition, resolve_chat_filter
 
 
 
@@ -18,9 +20,8 @@ from Whatsapp_Chat_Exporter.utility import bytes_to_readable, convert_time_unit,
 def contacts(db, data):
     """Process WhatsApp contacts with status information."""
     c = db.cursor()
-    c.execute("""SELECT count() FROM ZWAADDRESSBOOKCONTACT WHERE ZABOUTTEXT IS NOT NULL""")
-    total_row_number = c.fetchone()[0]
-    logging.info(f"Pre-processing contacts...({total_row_number})", extra={"clear": True})
+    total_row_number = estimate_row_count(db, "ZWAADDRESSBOOKCONTACT", data.get_system("no_count"))
+    logging.info("Pre-processing contacts...", extra={"clear": True})
 
     c.execute("""SELECT ZWHATSAPPID, ZABOUTTEXT FROM ZWAADDRESSBOOKCONTACT WHERE ZABOUTTEXT IS NOT NULL""")
     with tqdm(total=total_row_number, desc="Processing contacts", unit="contact", leave=False) as pbar:
@@ -34,6 +35,7 @@ def contacts(db, data):
             data.add_chat(zwhatsapp_id, current_chat)
             pbar.update(1)
         total_time = pbar.format_dict['elapsed']
+        total_row_number = pbar.n
     logging.info(f"Pre-processed {total_row_number} contacts in {convert_time_unit(total_time)}")
 
 
@@ -67,32 +69,16 @@ def messages(db, data, media_folder, timezone_offset, filter_date, filter_chat,
     cursor2 = db.cursor()
 
     # Build the chat filter conditions
-    chat_filter_include = get_chat_condition(
-        filter_chat[0], True, ["ZWACHATSESSION.ZCONTACTJID", "ZMEMBERJID"], "ZGROUPINFO", "ios")
-    chat_filter_exclude = get_chat_condition(
-        filter_chat[1], False, ["ZWACHATSESSION.ZCONTACTJID", "ZMEMBERJID"], "ZGROUPINFO", "ios")
+    chat_filter_include, chat_filter_exclude = _get_chat_filters(db, data, filter_chat)
     date_filter = f'AND ZMESSAGEDATE {filter_date}' if filter_date is not None else ''
+    # Only the messages after the last delta export, if any
+    last_id = data.get_system("last_message_id")
+    id_filter = f'AND ZWAMESSAGE.Z_PK > {int(last_id)}' if last_id is not None else ''
+    # Only the chats of this partition when extracting in parallel or in batches
+    partition_filter = get_partition_condition("ZWAMESSAGE.ZCHATSESSION", data.get_system("chat_partition"))
 
     # Process contacts first
-    contact_query = f"""
-        SELECT count() 
-        FROM (SELECT DISTINCT ZCONTACTJID,
-            ZPARTNERNAME,
-            ZWAPROFILEPUSHNAME.ZPUSHNAME
-        FROM ZWACHATSESSION
-            INNER JOIN ZWAMESSAGE
-                ON ZWAMESSAGE.ZCHATSESSION = ZWACHATSESSION.Z_PK
-            LEFT JOIN ZWAPROFILEPUSHNAME
-                ON ZWACHATSESSION.ZCONTACTJID = ZWAPROFILEPUSHNAME.ZJID
-            LEFT JOIN ZWAGROUPMEMBER
-                    ON ZWAMESSAGE.ZGROUPMEMBER = ZWAGROUPMEMBER.Z_PK
-        WHERE 1=1
-            {chat_filter_include}
-            {chat_filter_exclude}
-        GROUP BY ZCONTACTJID);
-    """
-    c.execute(contact_query)
-    total_row_number = c.fetchone()[0]
+    total_row_number = estimate_row_count(db, "ZWACHATSESSION", data.get_system("no_count"))
 
     # Get distinct contacts
     contacts_query = f"""
@@ -107,6 +93,7 @@ def messages(db, data, media_folder, timezone_offset, filter_date, filter_chat,
             LEFT JOIN ZWAGROUPMEMBER
                     ON ZWAMESSAGE.ZGROUPMEMBER = ZWAGROUPMEMBER.Z_PK
         WHERE 1=1
+            {partition_filter}
             {chat_filter_include}
             {chat_filter_exclude}
         GROUP BY ZCONTACTJID;
@@ -131,24 +118,11 @@ def messages(db, data, media_folder, timezone_offset, filter_date, filter_chat,
             process_contact_avatars(current_chat, media_folder, contact_id)
             pbar.update(1)
         total_time = pbar.format_dict['elapsed']
+        total_row_number = pbar.n
     logging.info(f"Processed {total_row_number} contacts in {convert_time_unit(total_time)}")
 
-    # Get message count
-    message_count_query = f"""
-        SELECT count()
-        FROM ZWAMESSAGE
-            INNER JOIN ZWACHATSESSION
-                ON ZWAMESSAGE.ZCHATSESSION = ZWACHATSESSION.Z_PK
-            LEFT JOIN ZWAGROUPMEMBER
-                ON ZWAMESSAGE.ZGROUPMEMBER = ZWAGROUPMEMBER.Z_PK
-        WHERE 1=1
-            {date_filter}
-            {chat_filter_include}
-            {chat_filter_exclude}
-    """
-    c.execute(message_count_query)
-    total_row_number = c.fetchone()[0]
-    logging.info(f"Processing messages...(0/{total_row_number})", extra={"clear": True})
+    total_row_number = estimate_row_count(db, "ZWAMESSAGE", data.get_system("no_count"))
+    logging.info("Processing messages...", extra={"clear": True})
 
     # Fetch messages
     messages_query = f"""
@@ -172,22 +146,15 @@ def messages(db, data, media_folder, timezone_offset, filter_date, filter_chat,
                 ON ZWAMESSAGE.ZCHATSESSION = ZWACHATSESSION.Z_PK
         WHERE 1=1   
             {date_filter}
+            {id_filter}
+            {partition_filter}
             {chat_filter_include}
             {chat_filter_exclude}
         ORDER BY ZMESSAGEDATE ASC;
     """
     c.execute(messages_query)
 
-    reply_query = """SELECT ZSTANZAID,
-                        ZTEXT,
-                        ZTITLE
-                     FROM ZWAMESSAGE
-                        LEFT JOIN ZWAMEDIAITEM
-                            ON ZWAMESSAGE.Z_PK = ZWAMEDIAITEM.ZMESSAGE
-                     WHERE ZTEXT IS NOT NULL
-                        OR ZTITLE IS NOT NULL;"""
-    cursor2.execute(reply_query)
-    message_map = {row[0][:17]: row[1] or row[2] for row in cursor2.fetchall() if row[0]}
+    message_map = _QuotedTexts(cursor2, partition_filter)
 
     # Process each message
     with tqdm(total=total_row_number, desc="Processing messages", unit="msg", leave=False) as pbar:
@@ -225,24 +192,112 @@ def messages(db, data, media_folder, timezone_offset, filter_date, filter_chat,
 
             pbar.update(1)
         total_time = pbar.format_dict['elapsed']
+        total_row_number = pbar.n
     logging.info(f"Processed {total_row_number} messages in {convert_time_unit(total_time)}")
 
 
+def _get_chat_filters(db, data, filter_chat):
+    """
+    Get the conditions of the chat filters to include and to exclude, resolved once to the
+    primary keys of the matching chat sessions and group members.
+    """
+    chat_filter_ids = resolve_chat_filter(db, data, filter_chat, (
+        "SELECT Z_PK FROM ZWACHATSESSION WHERE ZCONTACTJID LIKE ?",
+        "SELECT Z_PK FROM ZWAGROUPMEMBER WHERE ZMEMBERJID LIKE ?"
+    ))
+    columns = ["ZWAMESSAGE.ZCHATSESSION", "ZWAGROUPMEMBER.Z_PK"]
+    return (
+        get_chat_id_condition(chat_filter_ids[0], True, columns, "ZGROUPINFO", "ios"),
+        get_chat_id_condition(chat_filter_ids[1], False, columns, "ZGROUPINFO", "ios")
+    )
+
+
+def chat_message_counts(db, data):
+    """
+    Count the messages of each chat session, after the last delta export if any.
+
+    Args:
+        db: Database connection
+        data: Data store object
+
+    Returns:
+        list: The primary keys of the chat sessions exported as the same chat with their
+            number of messages, as from group_chat_counts()
+    """
+    last_id = data.get_system("last_message_id")
+    return group_chat_counts(db.execute(
+        """SELECT ZWAMESSAGE.ZCHATSESSION, ZWACHATSESSION.ZCONTACTJID, count()
+           FROM ZWAMESSAGE
+                LEFT JOIN ZWACHATSESSION
+                    ON ZWAMESSAGE.ZCHATSESSION = ZWACHATSESSION.Z_PK
+           WHERE ZWAMESSAGE.Z_PK > ? GROUP BY ZWAMESSAGE.ZCHATSESSION""",
+        (last_id if last_id is not None else -1,)
+    ))
+
+
+def chat_partitions(db, data, partitions):
+    """
+    Split the chats into partitions of about the same number of messages, so that they can be
+    extracted separately with the "chat_partition" system value set to each of them.
+
+    Args:
+        db: Database connection
+        data: Data store object
+        partitions: The maximum number of partitions
+
+    Returns:
+        list: The primary keys of the chat sessions in each partition
+    """
+    return balance_partitions(chat_message_counts(db, data), partitions)
+
+
+class _QuotedTexts(dict):
+    """
+    The texts that replies can quote, by the first 17 characters of the stanza ID of the message.
+
+    Only the messages of the chats being extracted are read up front, so that a batch or a worker
+    does not hold the text of the whole account. Quotes of messages in other chats, such as
+    private replies to a group, are read one by one when they are needed.
+    """
+
+    def __init__(self, cursor, partition_filter: str) -> None:
+        self._cursor = cursor
+        self._partial = bool(partition_filter)
+        cursor.execute(f"""SELECT ZSTANZAID,
+                               ZTEXT,
+                               ZTITLE
+                            FROM ZWAMESSAGE
+                               LEFT JOIN ZWAMEDIAITEM
+                                   ON ZWAMESSAGE.Z_PK = ZWAMEDIAITEM.ZMESSAGE
+                            WHERE (ZTEXT IS NOT NULL
+                               OR ZTITLE IS NOT NULL)
+                               {partition_filter};""")
+        super().__init__((row[0][:17], row[1] or row[2]) for row in cursor.fetchall() if row[0])
+
+    def get(self, key_id, default=None):
+        """Get the quoted text of a stanza ID, reading it if it belongs to another chat."""
+        if key_id in self or not self._partial:
+            return super().get(key_id, default)
+        # The stanza IDs starting with key_id, as the map keeps only their first 17 characters
+        self._cursor.execute("""SELECT ZTEXT,
+                                    ZTITLE
+                                 FROM ZWAMESSAGE
+                                    LEFT JOIN ZWAMEDIAITEM
+                                        ON ZWAMESSAGE.Z_PK = ZWAMEDIAITEM.ZMESSAGE
+                                 WHERE ZSTANZAID >= ? AND ZSTANZAID < ?
+                                    AND (ZTEXT IS NOT NULL OR ZTITLE IS NOT NULL)
+                                 ORDER BY ZWAMESSAGE.Z_PK DESC
+                                 LIMIT 1;""", (key_id, key_id + "\x7f"))
+        row = self._cursor.fetchone()
+        text = self[key_id] = (row[0] or row[1]) if row is not None else None
+        return text if text is not None else default
+
+
 def process_message_data(message, content, is_group_message, data, message_map, no_reply):
     """Process and set message data from content row."""
     # Handle group sender info
     if is_group_message and content["ZISFROMME"] == 0:
-        name = None
-        if content["ZMEMBERJID"] is not None:
-            if content["ZMEMBERJID"] in data:
-                name = data.get_chat(content["ZMEMBERJID"]).name
-            if "@" in content["ZMEMBERJID"]:
-                fallback = content["ZMEMBERJID"].split('@')[0]
-            else:
-                fallback = None
-        else:
-            fallback = None
-        message.sender = name or fallback
+        message.sender = data.names.resolve(content["ZMEMBERJID"])
     else:
         message.sender = None
 
@@ -316,30 +371,15 @@ def media(db, data, media_folder, filter_date, filter_chat, filter_empty, separa
     c = db.cursor()
 
     # Build filter conditions
-    chat_filter_include = get_chat_condition(
-        filter_chat[0], True, ["ZWACHATSESSION.ZCONTACTJID", "ZMEMBERJID"], "ZGROUPINFO", "ios")
-    chat_filter_exclude = get_chat_condition(
-        filter_chat[1], False, ["ZWACHATSESSION.ZCONTACTJID", "ZMEMBERJID"], "ZGROUPINFO", "ios")
+    chat_filter_include, chat_filter_exclude = _get_chat_filters(db, data, filter_chat)
     date_filter = f'AND ZMESSAGEDATE {filter_date}' if filter_date is not None else ''
+    last_id = data.get_system("last_message_id")
+    id_filter = f'AND ZWAMESSAGE.Z_PK > {int(last_id)}' if last_id is not None else ''
+    # Only the chats of this partition when extracting in parallel or in batches
+    partition_filter = get_partition_condition("ZWAMESSAGE.ZCHATSESSION", data.get_system("chat_partition"))
 
-    # Get media count
-    media_count_query = f"""
-        SELECT count()
-        FROM ZWAMEDIAITEM
-            INNER JOIN ZWAMESSAGE
-                ON ZWAMEDIAITEM.ZMESSAGE = ZWAMESSAGE.Z_PK
-            INNER JOIN ZWACHATSESSION
-                ON ZWAMESSAGE.ZCHATSESSION = ZWACHATSESSION.Z_PK
-            LEFT JOIN ZWAGROUPMEMBER
-                ON ZWAMESSAGE.ZGROUPMEMBER = ZWAGROUPMEMBER.Z_PK
-        WHERE 1=1
-            {date_filter}
-            {chat_filter_include}
-            {chat_filter_exclude}
-    """
-    c.execute(media_count_query)
-    total_row_number = c.fetchone()[0]
-    logging.info(f"Processing media...(0/{total_row_number})", extra={"clear": True})
+    total_row_number = estimate_row_count(db, "ZWAMEDIAITEM", data.get_system("no_count"))
+    logging.info("Processing media...", extra={"clear": True})
 
     # Fetch media items
     media_query = f"""
@@ -359,6 +399,8 @@ def media(db, data, media_folder, filter_date, filter_chat, filter_empty, separa
                 ON ZWAMESSAGE.ZGROUPMEMBER = ZWAGROUPMEMBER.Z_PK
         WHERE ZMEDIALOCALPATH IS NOT NULL
             {date_filter}
+            {id_filter}
+            {partition_filter}
             {chat_filter_include}
             {chat_filter_exclude}
         ORDER BY ZCONTACTJID ASC
@@ -372,6 +414,7 @@ def media(db, data, media_folder, filter_date, filter_chat, filter_empty, separa
             process_media_item(content, data, media_folder, mime, separate_media, fix_dot_files)
             pbar.update(1)
         total_time = pbar.format_dict['elapsed']
+        total_row_number = pbar.n
     logging.info(f"Processed {total_row_number} media in {convert_time_unit(total_time)}")
 
 
@@ -431,11 +474,12 @@ def vcard(db, data, media_folder, filter_date, filter_chat, filter_empty):
     c = db.cursor()
 
     # Build filter conditions
-    chat_filter_include = get_chat_condition(
-        filter_chat[0], True, ["ZCONTACTJID", "ZMEMBERJID"], "ZGROUPINFO", "ios")
-    chat_filter_exclude = get_chat_condition(
-        filter_chat[1], False, ["ZCONTACTJID", "ZMEMBERJID"], "ZGROUPINFO", "ios")
+    chat_filter_include, chat_filter_exclude = _get_chat_filters(db, data, filter_chat)
     date_filter = f'AND ZWAMESSAGE.ZMESSAGEDATE {filter_date}' if filter_date is not None else ''
+    last_id = data.get_system("last_message_id")
+    id_filter = f'AND ZWAMESSAGE.Z_PK > {int(last_id)}' if last_id is not None else ''
+    # Only the chats of this partition when extracting in parallel or in batches
+    partition_filter = get_partition_condition("ZWAMESSAGE.ZCHATSESSION", data.get_system("chat_partition"))
 
     # Fetch vCard mentions
     vcard_query = f"""
@@ -455,6 +499,8 @@ def vcard(db, data, media_folder, filter_date, filter_chat, filter_empty):
                 ON ZWAMESSAGE.ZGROUPMEMBER = ZWAGROUPMEMBER.Z_PK
         WHERE 1=1
             {date_filter}
+            {id_filter}
+            {partition_filter}
             {chat_filter_include}
             {chat_filter_exclude}
     """
@@ -520,16 +566,8 @@ def calls(db, data, timezone_offset, filter_chat):
     chat_filter_exclude = get_chat_condition(
         filter_chat[1], False, ["ZGROUPCALLCREATORUSERJIDSTRING"], None, "ios")
 
-    # Get call count
-    call_count_query = f"""
-        SELECT count()
-        FROM ZWACDCALLEVENT
-        WHERE 1=1
-            {chat_filter_include}
-            {chat_filter_exclude}
-    """
-    c.execute(call_count_query)
-    total_row_number = c.fetchone()[0]
+    # Skip the query if there is no call event
+    total_row_number = estimate_row_count(db, "ZWACDCALLEVENT", data.get_system("no_count"))
     if total_row_number == 0:
         return
 
@@ -562,6 +600,9 @@ def calls(db, data, timezone_offset, filter_chat):
             process_call_record(content, chat, data, timezone_offset)
             pbar.update(1)
         total_time = pbar.format_dict['elapsed']
+        total_row_number = pbar.n
+    if total_row_number == 0:
+        return
 
     # Add calls chat to data
     data.add_chat("000000000000000", chat)
@@ -581,12 +622,7 @@ def process_call_record(content, chat, data, timezone_offset):
 
     # Set sender info
     _jid = content["ZGROUPCALLCREATORUSERJIDSTRING"]
-    name = data.get_chat(_jid).name if _jid in data else None
-    if _jid is not None and "@" in _jid:
-        fallback = _jid.split('@')[0]
-    else:
-        fallback = None
-    call.sender = name or fallback
+    call.sender = data.names.resolve(_jid)
 
     # Set call metadata
     call.meta = True
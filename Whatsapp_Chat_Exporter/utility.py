@@ -6,14 +6,20 @@ import os
 import unicodedata
 import re
 import math
+import heapq
 import shutil
+import tempfile
+import sys
+from functools import lru_cache
+from itertools import islice
+from types import SimpleNamespace
 from bleach import clean as sanitize
 from markupsafe import Markup
 from datetime import datetime, timedelta
 from enum import IntEnum
 from tqdm import tqdm
 from Whatsapp_Chat_Exporter.data_model import ChatCollection, ChatStore, Timing
-from typing import Dict, List, Optional, Tuple, Union, Any
+from typing import Callable, Collection, Dict, FrozenSet, Iterable, List, Optional, Tuple, Union, Any
 try:
     from enum import StrEnum, IntEnum
 except ImportError:
@@ -29,6 +35,7 @@ except ImportError:
 
 MAX_SIZE = 4 * 1024 * 1024  # Default 4MB
 ROW_SIZE = 0x3D0
+ROW_BATCH_SIZE = 1000
 CURRENT_TZ_OFFSET = datetime.now().astimezone().utcoffset().seconds / 3600
 
 
@@ -139,6 +146,12 @@ def sanitize_except(html: str) -> Markup:
     return Markup(sanitize(html, tags=["br"]))
 
 
+@lru_cache(maxsize=64)
+def _local_date(timestamp: Union[int, float]) -> datetime.date:
+    """The local date of a timestamp. The templates ask for the same few timestamps repeatedly."""
+    return datetime.fromtimestamp(timestamp).date()
+
+
 def determine_day(last: int, current: int) -> Optional[datetime.date]:
     """Determines if the day has changed between two timestamps. Exposed to Jinja's environment.
 
@@ -149,8 +162,8 @@ def determine_day(last: int, current: int) -> Optional[datetime.date]:
     Returns:
         The date of the current message if it's a different day than the last message, otherwise None.
     """
-    last = datetime.fromtimestamp(last).date()
-    current = datetime.fromtimestamp(current).date()
+    last = _local_date(last)
+    current = _local_date(current)
     if last == current:
         return None
     else:
@@ -204,8 +217,15 @@ def rendering(
     chat,
     headline,
     next=False,
-    previous=False
+    previous=False,
+    reply_pages=None
 ):
+    """Render the messages of a chat, or of one page of it, to an HTML file.
+
+    Replies are resolved through the key_id index of the chat, so a quoted message is found
+    wherever it is in the chat. reply_pages maps the key_id of the messages on earlier pages to
+    their page file, to link replies to them.
+    """
     if chat.their_avatar_thumb is None and chat.their_avatar is not None:
         their_avatar_thumb = chat.their_avatar
     else:
@@ -226,7 +246,9 @@ def rendering(
                 previous=previous,
                 status=chat.status,
                 media_base=chat.media_base,
-                headline=headline
+                headline=headline,
+                quoted_message=chat.get_message_by_key_id,
+                reply_pages=reply_pages or {}
             )
         )
 
@@ -483,6 +505,138 @@ def incremental_merge(source_dir: str, target_dir: str, media_dir: str, pretty_p
     merger.merge(source_dir, target_dir, media_dir)
 
 
+class ExportState:
+    """The high-water marks of a delta export, stored next to the output between runs.
+
+    For each chat, the largest message row id (message._id on Android, Z_PK on iOS) and its timestamp
+    are recorded. Row ids only grow, so the next run only needs the messages above the largest of them.
+    The marks are only valid for the same export settings, e.g. the same filters.
+    """
+
+    VERSION = 1
+    FILE_NAME = ".export_state.json"
+    CALLS = ("000000000000000", "000000000000001")
+
+    def __init__(self, settings: Dict[str, Any], chats: Optional[Dict[str, Dict[str, Any]]] = None,
+                 reaction_id: Optional[int] = None) -> None:
+        """Initialize the state.
+
+        Args:
+            settings: The export settings the marks are valid for.
+            chats: The largest row id and its timestamp, keyed by chat.
+            reaction_id: The largest row id of the processed reactions.
+        """
+        self.settings = settings
+        self.chats = chats or {}
+        self.reaction_id = reaction_id
+
+    @property
+    def message_id(self) -> Optional[int]:
+        """The largest message row id exported so far, or None if nothing was exported."""
+        return max((chat["id"] for chat in self.chats.values()), default=None)
+
+    @classmethod
+    def load(cls, output_dir: str, settings: Dict[str, Any]) -> Optional['ExportState']:
+        """Loads the state of the last run, if it was made with the same settings.
+
+        Args:
+            output_dir: The output directory.
+            settings: The export settings of this run.
+
+        Returns:
+            The state, or None if a full export is needed.
+        """
+        path = os.path.join(output_dir, cls.FILE_NAME)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read the export state ({e}), all messages will be exported.")
+            return None
+        if state.get("version") != cls.VERSION or state.get("settings") != settings:
+            logging.warning("The export settings changed since the last run, all messages will be exported.")
+            return None
+        return cls(settings, state.get("chats"), state.get("reaction_id"))
+
+    def update(self, data: ChatCollection) -> None:
+        """Raises the marks to the messages in the collection.
+
+        Args:
+            data: The exported chats.
+        """
+        for jid, chat in data.items():
+            if jid in self.CALLS:
+                continue
+            ids = [key for key in chat.keys() if isinstance(key, int)]
+            if not ids:
+                continue
+            last = max(ids)
+            if jid not in self.chats or last > self.chats[jid]["id"]:
+                self.chats[jid] = {"id": last, "timestamp": chat.get_message(last).timestamp}
+        reaction_id = data.get_system("last_reaction_id")
+        if reaction_id is not None:
+            self.reaction_id = max(reaction_id, self.reaction_id or 0)
+
+    def save(self, output_dir: str) -> None:
+        """Saves the state atomically, so that an interrupted run keeps the last one.
+
+        Args:
+            output_dir: The output directory.
+        """
+        write_json_atomic(os.path.join(output_dir, self.FILE_NAME), {
+            "version": self.VERSION,
+            "settings": self.settings,
+            "reaction_id": self.reaction_id,
+            "chats": self.chats
+        })
+
+
+def write_json_atomic(path: str, data: Any) -> None:
+    """Writes a JSON file through a temporary file, so that readers never see it half written.
+
+    The temporary file is removed if writing fails, and the previous file, if any, is kept.
+
+    Args:
+        path: The path of the JSON file.
+        data: The data to write.
+    """
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+
+
+def import_previous_export(json_file: str, data: ChatCollection) -> None:
+    """Imports the chats of the last delta export under the chats already in the collection.
+
+    Chat details already in the collection, e.g. from the contacts, take precedence. Message keys
+    are restored to the integer row ids they had before being written to JSON.
+
+    Args:
+        json_file: The path to the JSON file of the last export.
+        data: The collection to import the chats into.
+    """
+    with open(json_file, "r") as f:
+        previous = json.load(f)
+    for jid, chat_data in previous.items():
+        chat = ChatStore.from_json(chat_data)
+        messages = [(int(key) if key.isdigit() else key, message) for key, message in chat.items()]
+        for key, _ in messages:
+            chat.delete_message(str(key))
+        for key, message in messages:
+            chat.add_message(key, message)
+        if jid in data:
+            chat.merge_with(data.get_chat(jid))
+        data.add_chat(jid, chat)
+    logging.info(f"Imported {len(previous)} chats from the last export")
+
+
 def get_file_name(contact: str, chat: ChatStore) -> Tuple[str, str]:
     """Generates a sanitized filename and contact name for a chat.
 
@@ -551,6 +705,62 @@ def _get_group_condition(jid: str, platform: str) -> str:
             "Only android and ios are supported for argument platform if jid is not None")
 
 
+def get_partition_condition(column: str, keys: Optional[List[Union[int, str]]]) -> str:
+    """Generates a SQL condition restricting a query to the chats of a partition.
+
+    Args:
+        column: The column identifying the chat, e.g. message.chat_row_id.
+        keys: The row ids or JIDs of the chats in the partition, or None for all chats.
+
+    Returns:
+        A SQL condition string.
+    """
+    if keys is None:
+        return ""
+    values = (str(int(key)) if isinstance(key, int) else "'" + key.replace("'", "''") + "'" for key in keys)
+    return f"AND {column} IN ({', '.join(values)})"
+
+
+def group_chat_counts(rows: Iterable[Tuple[Union[int, str], Any, int]]) -> List[Tuple[Tuple, int]]:
+    """Groups the message counts of chats by the chat they are exported as.
+
+    Chats exported as the same chat, e.g. a chat and the chat of its LID, must be extracted together.
+
+    Args:
+        rows: The key of each chat, the chat it is exported as and its number of messages.
+
+    Returns:
+        The keys and the total number of messages of each exported chat.
+    """
+    groups = {}
+    for key, exported_as, count in rows:
+        if key is None:
+            continue
+        keys, total = groups.get(exported_as, ((), 0))
+        groups[exported_as] = (keys + (key,), total + count)
+    return list(groups.values())
+
+
+def balance_partitions(counts: List[Tuple[Tuple, int]], partitions: int) -> List[List[Union[int, str]]]:
+    """Splits chats into partitions with about the same number of messages.
+
+    The largest chats are placed first, each into the partition with the fewest messages so far.
+
+    Args:
+        counts: The keys of each group of chats and their number of messages, as from group_chat_counts().
+        partitions: The maximum number of partitions.
+
+    Returns:
+        The sorted keys of each non-empty partition.
+    """
+    heap = [(0, index, []) for index in range(partitions)]
+    for keys, count in sorted(counts, key=lambda item: item[1], reverse=True):
+        total, index, partition = heapq.heappop(heap)
+        partition.extend(keys)
+        heapq.heappush(heap, (total + count, index, partition))
+    return [sorted(keys) for _, _, keys in sorted(heap, key=lambda item: item[1]) if keys]
+
+
 def get_chat_condition(
     filter: Optional[List[str]],
     include: bool,
@@ -589,29 +799,102 @@ def get_chat_condition(
     if jid is not None:
         is_group_condition = _get_group_condition(jid, platform)
 
-    # Build conditions for each chat filter
+    operator = "LIKE" if include else "NOT LIKE"
+    return _combine_chat_conditions(
+        len(filter), include, columns, is_group_condition,
+        lambda index, column: f"{columns[column]} {operator} '%{filter[index]}%'"
+    )
+
+
+def get_chat_id_condition(
+    filter_ids: Optional[List[Tuple[Collection[int], ...]]],
+    include: bool,
+    columns: List[str],
+    jid: Optional[str] = None,
+    platform: Optional[str] = None
+) -> str:
+    """Generates the SQL condition of get_chat_condition() from chat filters resolved to row ids.
+
+    Comparing integer columns, which are often indexed, is much cheaper than a LIKE on every row.
+
+    Args:
+        filter_ids: For each chat filter, the row ids it matches in each column, as from resolve_chat_filter().
+        include: True to include chats that match the filter, False to exclude them.
+        columns: A list of row id column names to check against the filter.
+        jid: The JID column name (used for group identification).
+        platform: The platform ("android" or "ios") for platform-specific JID queries.
+
+    Returns:
+        A SQL condition string.
+    """
+    if not filter_ids:
+        return ""
+    is_group_condition = _get_group_condition(jid, platform) if jid is not None else None
+    operator = "IN" if include else "NOT IN"
+
+    def condition(index, column):
+        # No row has the id -1, which keeps the NULL semantics of LIKE when nothing matches
+        ids = ", ".join(str(int(i)) for i in sorted(filter_ids[index][column])) or "-1"
+        return f"{columns[column]} {operator} ({ids})"
+
+    return _combine_chat_conditions(len(filter_ids), include, columns, is_group_condition, condition)
+
+
+def _combine_chat_conditions(count: int, include: bool, columns: List[str], is_group_condition: Optional[str],
+                             condition: Callable[[int, int], str]) -> str:
+    """Combines the conditions of each chat filter on the primary column and, for groups, the secondary column."""
     conditions = []
-    for index, chat in enumerate(filter):
+    for index in range(count):
         # Add connector for subsequent conditions (with double space)
         connector = " OR" if include else " AND"
         prefix = connector if index > 0 else ""
 
         # Primary column condition
-        operator = "LIKE" if include else "NOT LIKE"
-        conditions.append(f"{prefix} {columns[0]} {operator} '%{chat}%'")
+        conditions.append(f"{prefix} {condition(index, 0)}")
 
         # Secondary column condition for groups
         if len(columns) > 1 and is_group_condition:
             if include:
-                group_condition = f" OR ({columns[1]} {operator} '%{chat}%' AND {is_group_condition})" 
+                group_condition = f" OR ({condition(index, 1)} AND {is_group_condition})"
             else:
-                group_condition = f" AND ({columns[1]} {operator} '%{chat}%' AND {is_group_condition})"
+                group_condition = f" AND ({condition(index, 1)} AND {is_group_condition})"
             conditions.append(group_condition)
 
     combined_conditions = "".join(conditions)
     return f"AND ({combined_conditions})"
 
 
+def resolve_chat_filter(db, data, filter_chat: Tuple[Optional[List[str]], Optional[List[str]]],
+                        queries: Tuple[str, ...]) -> Tuple[Optional[List[Tuple[FrozenSet[int], ...]]], ...]:
+    """Resolves the phone numbers of the chat filters to the row ids they match, once per export.
+
+    The resolved ids are cached in the "chat_filter_ids" system value of data.
+
+    Args:
+        db: The database connection.
+        data: The ChatCollection object.
+        filter_chat: The chat filters to include and to exclude.
+        queries: For each column of the condition, a query selecting the row ids whose JID matches
+            the LIKE pattern given as its only parameter.
+
+    Returns:
+        For the filters to include and to exclude, the row ids matching each phone number in each
+        column, or None if the filter is empty.
+    """
+    cache = data.get_system("chat_filter_ids")
+    if cache is None:
+        cache = {}
+        data.set_system("chat_filter_ids", cache)
+    key = (tuple(tuple(f) if f else None for f in filter_chat), queries)
+    if key not in cache:
+        cache[key] = tuple(
+            [tuple(frozenset(row[0] for row in db.execute(query, (f"%{chat}%",))) for query in queries)
+             for chat in f] if f else None
+            for f in filter_chat
+        )
+    return cache[key]
+
+
 # Android Specific
 CRYPT14_OFFSETS = (
     {"iv": 67, "db": 191},
@@ -726,6 +1009,106 @@ def determine_metadata(content: sqlite3.Row, init_msg: Optional[str]) -> Optiona
     return msg
 
 
+def decode_text(value: bytes) -> str:
+    """Decodes a TEXT value from SQLite, replacing invalid UTF-8 sequences.
+
+    Args:
+        value: The raw bytes of the value.
+
+    Returns:
+        The decoded string.
+    """
+    return value.decode(encoding="utf-8", errors="replace")
+
+
+def estimate_row_count(db: sqlite3.Connection, table: str, skip: bool = False) -> Optional[int]:
+    """Estimates the number of rows in a table to size a progress bar, without scanning the table.
+
+    The row count recorded by ANALYZE in sqlite_stat1 is used if available, otherwise the largest
+    rowid, which is read from the end of the table. The estimate ignores any filter, the exact
+    number of rows is known once the rows have been processed.
+
+    Args:
+        db: The database connection.
+        table: The name of the table.
+        skip: Whether to skip estimating, e.g. if the user does not want any count.
+
+    Returns:
+        The estimated number of rows, or None if it is skipped or cannot be estimated.
+    """
+    if skip:
+        return None
+    try:
+        row = db.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table,)).fetchone()
+        if row is not None:
+            return int(row[0].split()[0])
+    except (sqlite3.OperationalError, ValueError):
+        pass
+    try:
+        return db.execute(f"SELECT max(rowid) FROM {table}").fetchone()[0] or 0
+    except sqlite3.OperationalError as e:
+        logging.debug(f'Got sql error "{e}" when estimating the rows of {table}.\n')
+        return None
+
+
+def column_index(cursor: sqlite3.Cursor) -> SimpleNamespace:
+    """Maps the column names of the last query to their positions, so that rows can be read as plain tuples.
+
+    Args:
+        cursor: The cursor on which the query has been executed.
+
+    Returns:
+        A namespace whose attributes are the column positions, in the order of the columns.
+    """
+    return SimpleNamespace(**{column[0]: index for index, column in enumerate(cursor.description)})
+
+
+def fetch_rows(cursor: sqlite3.Cursor, batch_size: int = ROW_BATCH_SIZE):
+    """Fetches the rows of the last query in batches of plain tuples, decoding text natively.
+
+    This works like repeated fetchmany() calls, except that the rows before a failing one are
+    kept: a row with invalid UTF-8 is read again with decode_text(), and rows failing with
+    other sqlite3.OperationalError (e.g. corrupted rows) are skipped. Before Python 3.11 the
+    cursor moves past a row that fails to decode, so text is always decoded with decode_text().
+
+    Args:
+        cursor: The cursor on which the query has been executed.
+        batch_size: The maximum number of rows per batch.
+
+    Yields:
+        A list of tuples for each batch.
+    """
+    cursor.row_factory = None
+    connection = cursor.connection
+    text_factory = connection.text_factory
+    native_factory = str if sys.version_info >= (3, 11) else decode_text
+    while True:
+        rows = []
+        failed = False
+        connection.text_factory = native_factory
+        try:
+            rows.extend(islice(cursor, batch_size))
+        except sqlite3.OperationalError as e:
+            failed = True
+            # The cursor stays on a row that failed to decode, read it again leniently
+            if str(e).startswith("Could not decode to UTF-8"):
+                connection.text_factory = decode_text
+                try:
+                    row = cursor.fetchone()
+                    if row is not None:
+                        rows.append(row)
+                except sqlite3.OperationalError as e:
+                    logging.debug(f'Got sql error "{e}" in fetch_rows ignoring row.\n')
+            elif logging.isEnabledFor(logging.DEBUG):
+                logging.debug(f'Got sql error "{e}" in fetch_rows ignoring row.\n')
+        finally:
+            connection.text_factory = text_factory
+        if rows:
+            yield rows
+        elif not failed:
+            return
+
+
 def get_status_location(output_folder: str, offline_static: str) -> str:
     """
     Gets the location of the W3.CSS file, either from web or local storage.
@@ -753,19 +1136,57 @@ def get_status_location(output_folder: str, offline_static: str) -> str:
     return w3css
 
 
-def check_jid_map(db: sqlite3.Connection) -> bool:
+class SchemaProfile:
+    """
+    The tables and columns of a database, probed once so that the handlers can choose
+    their queries directly instead of preparing queries that fail on other schemas.
     """
-    Checks if the jid_map table exists in the database.
 
-    Args:
-        db (sqlite3.Connection): The SQLite database connection.
+    def __init__(self, tables: Dict[str, FrozenSet[str]]) -> None:
+        """
+        Args:
+            tables (Dict[str, FrozenSet[str]]): The column names of each table and view.
+        """
+        self.tables = tables
 
-    Returns:
-        bool: True if the jid_map table exists, False otherwise.
-    """
-    cursor = db.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='jid_map'")
-    return cursor.fetchone() is not None
+    @classmethod
+    def probe(cls, db: sqlite3.Connection) -> 'SchemaProfile':
+        """
+        Reads the tables and columns of a database with a single query.
+
+        Args:
+            db (sqlite3.Connection): The SQLite database connection.
+
+        Returns:
+            SchemaProfile: The profile of the database.
+        """
+        tables: Dict[str, set] = {}
+        rows = db.execute("""SELECT sqlite_master.name, table_info.name
+                             FROM sqlite_master, pragma_table_info(sqlite_master.name) AS table_info
+                             WHERE sqlite_master.type IN ('table', 'view')""")
+        for table, column in rows:
+            tables.setdefault(table, set()).add(column)
+        return cls({table: frozenset(columns) for table, columns in tables.items()})
+
+    def has_table(self, table: str) -> bool:
+        """Checks if a table or view exists."""
+        return table in self.tables
+
+    def has_columns(self, table: str, *columns: str) -> bool:
+        """Checks if a table exists and has all the given columns."""
+        return table in self.tables and self.tables[table].issuperset(columns)
+
+    def supports(self, requirements: Dict[str, Tuple[str, ...]]) -> bool:
+        """
+        Checks if the database has all the tables and columns required by a query.
+
+        Args:
+            requirements (Dict[str, Tuple[str, ...]]): The columns required from each table.
+
+        Returns:
+            bool: True if every table has its required columns, False otherwise.
+        """
+        return all(self.has_columns(table, *columns) for table, columns in requirements.items())
 
 
 def get_jid_map_join(jid_map_exists: bool) -> str:
@@ -797,20 +1218,16 @@ def get_jid_map_selection(jid_map_exists: bool) -> tuple:
         )
         
 
-def get_transcription_selection(db: sqlite3.Connection) -> str:
+def get_transcription_selection(schema: SchemaProfile) -> str:
     """
     Returns the SQL selection statement for transcription text based on the database schema.
 
     Args:
-        db (sqlite3.Connection): The SQLite database connection.
+        schema (SchemaProfile): The profile of the database.
     Returns:
         str: The SQL selection statement for transcription.
     """
-    cursor = db.cursor()
-    cursor.execute("PRAGMA table_info(message_media)")
-    columns = [row[1] for row in cursor.fetchall()]
-
-    if "raw_transcription_text" in columns:
+    if schema.has_columns("message_media", "raw_transcription_text"):
         return "message_media.raw_transcription_text AS transcription_text"
     else:
         return "NULL AS transcription_text"
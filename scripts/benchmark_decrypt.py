@@ -0,0 +1,265 @@
+"""
+Benchmark the decryption of Android backups with synthetic crypt12, crypt14 and crypt15
+backups generated locally, without any network access or real WhatsApp data.
+
+Each case runs in its own process so that the peak RSS is not polluted by the others.
+The results are written to a JSON file, which can be compared with an earlier run:
+
+    python scripts/benchmark_decrypt.py --sizes 10MB,100MB --output after.json --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import platform
+import argparse
+import subprocess
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from Crypto.Cipher import AES
+from Whatsapp_Chat_Exporter import android_crypt
+from Whatsapp_Chat_Exporter.utility import Crypt, DbType, readable_to_bytes, bytes_to_readable
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+PAGE_SIZE = 4096
+WRITE_CHUNK = 4 * 1024 * 1024
+# Java serialization header of a byte[32], as found in the crypt15 encrypted_backup.key
+JAVA_BYTE_ARRAY_32 = bytes.fromhex("ACED0005757200025B42ACF317F8060854E0020000787000000020")
+CRYPT15_HEADER_SIZE = 128
+
+
+def build_keys(workdir):
+    """Generate (once) the 158 bytes crypt12/14 key file and the crypt15 javaobj key file."""
+    key_path = os.path.join(workdir, "key")
+    crypt15_key_path = os.path.join(workdir, "encrypted_backup.key")
+    if not os.path.isfile(key_path):
+        with open(key_path, "wb") as f:
+            f.write(os.urandom(158))
+    if not os.path.isfile(crypt15_key_path):
+        with open(crypt15_key_path, "wb") as f:
+            f.write(JAVA_BYTE_ARRAY_32 + os.urandom(32))
+    return key_path, crypt15_key_path
+
+
+def _pages(size):
+    """Yield a SQLite-like image of the given size, compressing about 2:1 like a real msgstore."""
+    pool = [os.urandom(PAGE_SIZE // 2) + bytes(PAGE_SIZE // 2) for _ in range(64)]
+    pool[0] = b"SQLite format 3\x00" + pool[0][16:]
+    buffer = []
+    for i in range(size // PAGE_SIZE):
+        buffer.append(pool[i % len(pool)] if i else pool[0])
+        if len(buffer) * PAGE_SIZE >= WRITE_CHUNK:
+            yield b"".join(buffer)
+            buffer = []
+    if buffer:
+        yield b"".join(buffer)
+
+
+def build_backup(path, crypt, size, main_key, signature, iv_offset=67, db_offset=191):
+    """
+    Write a synthetic backup with the layout read by android_crypt, encrypting and
+    compressing chunk by chunk so that multi-GB backups can be generated in little memory.
+    """
+    iv = os.urandom(16)
+    if crypt == Crypt.CRYPT14:
+        header = bytearray(os.urandom(max(db_offset, iv_offset + 16, 47)))[:db_offset]
+        header[15:47] = signature
+        header[iv_offset:iv_offset + 16] = iv
+        footer = 16
+    elif crypt == Crypt.CRYPT12:
+        header = bytearray(os.urandom(67))
+        header[3:35] = signature
+        header[51:67] = iv
+        footer = 16 + 20  # _decrypt_crypt12 strips 20 bytes, then the 32 bytes footer
+    else:
+        header = bytearray(os.urandom(CRYPT15_HEADER_SIZE + 2))
+        header[0] = CRYPT15_HEADER_SIZE
+        header[8:24] = iv
+        footer = 16
+
+    cipher = AES.new(main_key, AES.MODE_GCM, iv)
+    compressor = zlib.compressobj()
+    with open(path, "wb") as f:
+        f.write(header)
+        for chunk in _pages(size):
+            f.write(cipher.encrypt(compressor.compress(chunk)))
+        f.write(cipher.encrypt(compressor.flush()))
+        f.write(cipher.digest())
+        f.write(os.urandom(footer))
+
+
+def case_name(case):
+    name = f"crypt{case['crypt']}-{bytes_to_readable(case['size']).replace(' ', '')}-{case['mode']}"
+    if case["crypt"] == Crypt.CRYPT14:
+        name += f"-{case['iv']}:{case['db']}"
+    return name
+
+
+def prepare(case, workdir):
+    """Generate the backup of a case unless it is already in the work directory."""
+    key_path, crypt15_key_path = build_keys(workdir)
+    crypt = Crypt(case["crypt"])
+    if crypt == Crypt.CRYPT15:
+        with open(crypt15_key_path, "rb") as f:
+            main_key = android_crypt.load_key(f.read(), crypt, keyfile_stream=True).main_key
+        signature = None
+    else:
+        with open(key_path, "rb") as f:
+            key = f.read()
+        main_key, signature = key[126:], key[30:62]
+
+    name = case_name(dict(case, mode="backup"))
+    path = os.path.join(workdir, f"{name}.crypt{case['crypt']}")
+    if not os.path.isfile(path):
+        print(f"Generating {os.path.basename(path)}...", file=sys.stderr)
+        build_backup(path, crypt, case["size"], main_key, signature, case.get("iv", 67), case.get("db", 191))
+    return path, crypt15_key_path if crypt == Crypt.CRYPT15 else key_path
+
+
+def peak_rss():
+    """Get the peak RSS of this process in bytes, or None if unavailable."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def run_case(case, backup, key_path):
+    """Decrypt one backup in this process and measure it."""
+    crypt = Crypt(case["crypt"])
+    with open(key_path, "rb") as f:
+        key = android_crypt.load_key(f.read(), crypt, keyfile_stream=crypt == Crypt.CRYPT15)
+    size = os.path.getsize(backup)
+    result = {"backup_size": size, "offset_seconds": None}
+
+    if crypt == Crypt.CRYPT14:
+        # Time needed to find the offsets, as in _decrypt_crypt14()
+        database = memoryview(android_crypt._map_backup(backup))
+        started = time.perf_counter()
+        known = android_crypt._known_offsets(android_crypt.OffsetCache.fingerprint(database))
+        candidates = [o for o in known if android_crypt._check_header(o, database, key.main_key)]
+        if not candidates:
+            candidates = android_crypt._filter_offsets(
+                database, key.main_key, android_crypt.brute_force_offset())
+        result["offset_seconds"] = time.perf_counter() - started
+        result["offset_candidates"] = len(candidates)
+        database.release()
+
+    started = time.perf_counter()
+    android_crypt.decrypt_backup(
+        backup,
+        key,
+        crypt=crypt,
+        db_type=DbType.MESSAGE,
+        dry_run=True,
+        max_worker=case["workers"],
+        stream=case["mode"] == "stream",
+        chunk_size=case["chunk_size"]
+    )
+    seconds = time.perf_counter() - started
+    result.update({
+        "seconds": seconds,
+        "throughput_mb_s": size / seconds / 1024 ** 2,
+        "peak_rss_mb": peak_rss() / 1024 ** 2 if resource is not None else None
+    })
+    return result
+
+
+def compare(results, baseline_path):
+    """Print the change of each metric against an earlier result file."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    print(f"\n{'Case':<40} {'Time':>10} {'Throughput':>12} {'Peak RSS':>10} {'Offset':>10}")
+    for result in results:
+        before = baseline.get(result["name"])
+        if before is None:
+            print(f"{result['name']:<40} {'(new)':>10}")
+            continue
+        deltas = []
+        for metric in ("seconds", "throughput_mb_s", "peak_rss_mb", "offset_seconds"):
+            if result.get(metric) is None or not before.get(metric):
+                deltas.append("-")
+            else:
+                deltas.append(f"{(result[metric] - before[metric]) / before[metric] * 100:+.1f}%")
+        print(f"{result['name']:<40} {deltas[0]:>10} {deltas[1]:>12} {deltas[2]:>10} {deltas[3]:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the decryption of Android backups.")
+    parser.add_argument("--sizes", default="10MB,100MB",
+                        help="Comma separated sizes of the decrypted databases (default: 10MB,100MB)")
+    parser.add_argument("--crypts", default="12,14,15", help="Comma separated crypt versions (default: 12,14,15)")
+    parser.add_argument("--crypt14-offsets", default="67:191,50:150",
+                        help="Comma separated IV:DB offsets of the crypt14 backups, the default includes "
+                             "a known one and one found by brute force (default: 67:191,50:150)")
+    parser.add_argument("--modes", default="memory,stream",
+                        help="Comma separated decryption modes, memory and/or stream (default: memory,stream)")
+    parser.add_argument("--chunk-size", default="1MB", help="Chunk size of streaming decryption (default: 1MB)")
+    parser.add_argument("--workers", default=4, type=int, help="Brute-force workers (default: 4)")
+    parser.add_argument("--repeat", default=1, type=int, help="Runs per case, the fastest is kept (default: 1)")
+    parser.add_argument("--workdir", default="benchmark_backups",
+                        help="Directory of the generated backups, kept for later runs (default: benchmark_backups)")
+    parser.add_argument("--output", default="benchmark_decrypt.json", help="Result file (default: benchmark_decrypt.json)")
+    parser.add_argument("--compare", default=None, help="Earlier result file to compare with")
+    parser.add_argument("--run-case", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case is not None:
+        case, backup, key_path = json.loads(args.run_case)
+        print(json.dumps(run_case(case, backup, key_path)))
+        return
+
+    os.makedirs(args.workdir, exist_ok=True)
+    cases = []
+    for crypt in (Crypt(int(c)) for c in args.crypts.split(",")):
+        offsets = [tuple(map(int, o.split(":"))) for o in args.crypt14_offsets.split(",")]
+        for size in (readable_to_bytes(s) for s in args.sizes.split(",")):
+            for mode in args.modes.split(","):
+                for iv, db in offsets if crypt == Crypt.CRYPT14 else [(None, None)]:
+                    case = {"crypt": crypt.value, "size": size, "mode": mode, "workers": args.workers,
+                            "chunk_size": readable_to_bytes(args.chunk_size)}
+                    if crypt == Crypt.CRYPT14:
+                        case.update(iv=iv, db=db)
+                    cases.append(case)
+
+    results = []
+    for case in cases:
+        backup, key_path = prepare(case, args.workdir)
+        runs = []
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run-case", json.dumps([case, backup, key_path])],
+                check=True, capture_output=True, text=True
+            ).stdout
+            runs.append(json.loads(output.splitlines()[-1]))
+        result = dict(min(runs, key=lambda r: r["seconds"]), name=case_name(case), **case)
+        results.append(result)
+        offset = f", offsets found in {result['offset_seconds']:.2f}s" if result["offset_seconds"] is not None else ""
+        rss = f", peak RSS {result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] is not None else ""
+        print(f"{result['name']}: {result['seconds']:.2f}s, {result['throughput_mb_s']:.1f} MB/s{rss}{offset}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": 1,
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "results": results
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
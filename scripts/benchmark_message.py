@@ -0,0 +1,123 @@
+"""
+Benchmark the memory and the JSON conversion of the Message objects held by the exporter,
+with synthetic messages shaped like those of a real export: mostly text, some replies,
+media with captions and a few reactions.
+
+The results are written to a JSON file, which can be compared with an earlier run:
+
+    python scripts/benchmark_message.py --count 50000 --output after.json --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from Whatsapp_Chat_Exporter.data_model import ChatStore, Message, Timing
+from Whatsapp_Chat_Exporter.utility import CURRENT_TZ_OFFSET, Device
+
+
+def build_chat(count, seed=0):
+    """Build a chat of count messages, the same ones for the same seed."""
+    rng = random.Random(seed)
+    # The offset the exporter uses without --time-offset, which is a float
+    timing = Timing(CURRENT_TZ_OFFSET)
+    chat = ChatStore(Device.ANDROID)
+    timestamp = 1700000000000
+    for i in range(count):
+        timestamp += rng.randint(1000, 600000)
+        message = Message(
+            from_me=rng.random() < 0.4,
+            timestamp=timestamp,
+            time=timestamp,
+            key_id=f"3EB0{i:016X}",
+            received_timestamp=timestamp + 1000,
+            read_timestamp=timestamp + 5000 if rng.random() < 0.8 else None,
+            timezone_offset=timing,
+            message_type=0
+        )
+        message.data = "".join(rng.choice("abcdefghij ") for _ in range(rng.randint(5, 80)))
+        kind = rng.random()
+        if kind < 0.1:
+            message.reply = f"3EB0{rng.randrange(i + 1):016X}"
+            message.quoted_data = "Quoted text"
+        elif kind < 0.2:
+            message.media = True
+            message.mime = "image/jpeg"
+            message.data = f"WhatsApp/Media/WhatsApp Images/IMG-{i}.jpg"
+            message.caption = "A caption" if rng.random() < 0.3 else None
+        if rng.random() < 0.05:
+            message.reactions = {"You": "\U0001F44D"}
+        chat.add_message(i, message)
+    return chat
+
+
+def run(count):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    chat = build_chat(count)
+    build_seconds = time.perf_counter() - started
+    # Only the messages, not the dict of the chat holding them
+    message_bytes = tracemalloc.get_traced_memory()[0] - before - sys.getsizeof(chat._messages)
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    converted = chat.to_json()
+    json_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    ChatStore.from_json(converted)
+    from_json_seconds = time.perf_counter() - started
+    return {
+        "count": count,
+        "bytes_per_message": message_bytes / count,
+        "build_seconds": build_seconds,
+        "to_json_seconds": json_seconds,
+        "from_json_seconds": from_json_seconds
+    }
+
+
+def compare(result, baseline_path):
+    """Print the change of each metric against an earlier result file."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        before = json.load(f)["result"]
+    for metric in ("bytes_per_message", "build_seconds", "to_json_seconds", "from_json_seconds"):
+        change = (result[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0
+        print(f"{metric:<20} {before[metric]:>12.2f} -> {result[metric]:>12.2f} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the memory and JSON conversion of messages.")
+    parser.add_argument("--count", default=50000, type=int, help="Number of messages (default: 50000)")
+    parser.add_argument("--output", default="benchmark_message.json",
+                        help="Result file (default: benchmark_message.json)")
+    parser.add_argument("--compare", default=None, help="Earlier result file to compare with")
+    args = parser.parse_args()
+
+    result = run(args.count)
+    print(f"{result['bytes_per_message']:.0f} bytes per message, built in {result['build_seconds']:.2f}s, "
+          f"to_json in {result['to_json_seconds']:.2f}s, from_json in {result['from_json_seconds']:.2f}s")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": 1,
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "result": result
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare is not None:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
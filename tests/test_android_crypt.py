@@ -0,0 +1,378 @@
+import os
+import zlib
+import multiprocessing
+import pytest
+from Whatsapp_Chat_Exporter import android_crypt
+from Whatsapp_Chat_Exporter.android_crypt import _is_zlib_header, _check_header, decrypt_backup, OffsetCache
+from Whatsapp_Chat_Exporter.utility import Crypt
+
+pytest.importorskip("Crypto")
+from Crypto.Cipher import AES
+
+
+SQLITE_IMAGE = b"SQLite format 3\x00" + os.urandom(4096)
+
+
+def build_crypt14(iv_offset, db_offset, plaintext=SQLITE_IMAGE, key=None):
+    """Build a synthetic crypt14 backup and its 158 bytes key file."""
+    if key is None:
+        key = os.urandom(158)
+    signature = key[30:62]
+    main_key = key[126:]
+    iv = os.urandom(16)
+
+    header = bytearray(os.urandom(max(iv_offset + 16, db_offset, 47)))
+    header[15:47] = signature
+    header[iv_offset:iv_offset + 16] = iv
+    cipher = AES.new(main_key, AES.MODE_GCM, iv)
+    ciphertext, tag = cipher.encrypt_and_digest(zlib.compress(plaintext))
+    return bytes(header[:db_offset]) + ciphertext + tag + os.urandom(16), key
+
+
+class TestZlibHeader:
+    def test_valid_headers(self):
+        for level in range(10):
+            assert _is_zlib_header(zlib.compress(b"data", level))
+
+    def test_invalid_headers(self):
+        assert not _is_zlib_header(b"")
+        assert not _is_zlib_header(b"\x78")
+        assert not _is_zlib_header(b"\x78\x00")
+        assert not _is_zlib_header(b"\x1f\x8b")
+
+
+class TestCrypt14:
+    def test_check_header(self):
+        database, key = build_crypt14(67, 191)
+        assert _check_header((67, 83, 191), database, key[126:])
+        assert not _check_header((67, 83, len(database)), database, key[126:])
+
+    def test_known_offsets(self, tmp_path):
+        database, key = build_crypt14(67, 191)
+        output = tmp_path / "msgstore.db"
+        assert decrypt_backup(database, key, str(output), Crypt.CRYPT14) == 0
+        assert output.read_bytes() == SQLITE_IMAGE
+
+    def test_brute_force(self, tmp_path):
+        database, key = build_crypt14(50, 150)
+        output = tmp_path / "msgstore.db"
+        assert decrypt_backup(database, key, str(output), Crypt.CRYPT14, max_worker=2) == 0
+        assert output.read_bytes() == SQLITE_IMAGE
+
+    def test_wrong_key(self):
+        database, key = build_crypt14(50, 150)
+        key = key[:126] + os.urandom(32)
+        with pytest.raises(android_crypt.DecryptionError):
+            decrypt_backup(database, key, dry_run=True, crypt=Crypt.CRYPT14, max_worker=2)
+
+    def test_path_input(self, tmp_path):
+        database, key = build_crypt14(67, 191)
+        backup = tmp_path / "msgstore.db.crypt14"
+        backup.write_bytes(database)
+        output = tmp_path / "msgstore.db"
+        assert decrypt_backup(backup, key, str(output), Crypt.CRYPT14) == 0
+        assert output.read_bytes() == SQLITE_IMAGE
+
+    def test_path_input_brute_force(self, tmp_path):
+        database, key = build_crypt14(50, 150)
+        backup = tmp_path / "msgstore.db.crypt14"
+        backup.write_bytes(database)
+        output = tmp_path / "msgstore.db"
+        assert decrypt_backup(str(backup), key, str(output), Crypt.CRYPT14, max_worker=2) == 0
+        assert output.read_bytes() == SQLITE_IMAGE
+
+    def test_brute_force_without_path_stays_in_process(self, tmp_path, monkeypatch):
+        def no_pool(*args, **kwargs):
+            raise AssertionError("The backup must not be copied into worker processes")
+
+        monkeypatch.setattr(android_crypt.concurrent.futures, "ProcessPoolExecutor", no_pool)
+        database, key = build_crypt14(50, 150)
+        output = tmp_path / "msgstore.db"
+        assert decrypt_backup(database, key, str(output), Crypt.CRYPT14, max_worker=2) == 0
+        assert output.read_bytes() == SQLITE_IMAGE
+
+    def test_brute_force_with_one_worker_stays_in_process(self, tmp_path, monkeypatch):
+        def no_pool(*args, **kwargs):
+            raise AssertionError("A single worker must not start a pool")
+
+        monkeypatch.setattr(android_crypt.concurrent.futures, "ProcessPoolExecutor", no_pool)
+        database, key = build_crypt14(50, 150)
+        backup = tmp_path / "msgstore.db.crypt14"
+        backup.write_bytes(database)
+        output = tmp_path / "msgstore.db"
+        assert decrypt_backup(str(backup), key, str(output), Crypt.CRYPT14, max_worker=1) == 0
+        assert output.read_bytes() == SQLITE_IMAGE
+
+    @pytest.mark.parametrize("stream", [False, True])
+    def test_mapped_backup_is_closed(self, tmp_path, monkeypatch, stream):
+        mapped = []
+        original = android_crypt._map_backup
+
+        def map_backup(path):
+            mapped.append(original(path))
+            return mapped[-1]
+
+        monkeypatch.setattr(android_crypt, "_map_backup", map_backup)
+        database, key = build_crypt14(67, 191)
+        backup = tmp_path / "msgstore.db.crypt14"
+        backup.write_bytes(database)
+        decrypt_backup(backup, key, str(tmp_path / "msgstore.db"), Crypt.CRYPT14, stream=stream)
+        with pytest.raises(android_crypt.DecryptionError):
+            decrypt_backup(backup, key[:126] + os.urandom(32), dry_run=True, crypt=Crypt.CRYPT14,
+                           stream=stream)
+        assert len(mapped) == 2 and all(m.closed for m in mapped)
+
+    def test_memoryview_input(self, tmp_path):
+        database, key = build_crypt14(50, 150)
+        output = tmp_path / "msgstore.db"
+        assert decrypt_backup(memoryview(bytearray(database)), key, str(output),
+                              Crypt.CRYPT14, max_worker=2) == 0
+        assert output.read_bytes() == SQLITE_IMAGE
+
+
+class TestStreamDecrypt:
+    @pytest.mark.parametrize("offsets", [(67, 191), (50, 150)])
+    def test_crypt14(self, tmp_path, offsets):
+        database, key = build_crypt14(*offsets)
+        output = tmp_path / "msgstore.db"
+        assert decrypt_backup(database, key, str(output), Crypt.CRYPT14,
+                              stream=True, chunk_size=100) == 0
+        assert output.read_bytes() == SQLITE_IMAGE
+
+    def test_matches_in_memory(self, tmp_path):
+        plaintext = b"SQLite format 3\x00" + b"\x00" * 1024 * 1024 + os.urandom(1024)
+        database, key = build_crypt14(67, 191, plaintext)
+        streamed = tmp_path / "streamed.db"
+        in_memory = tmp_path / "in_memory.db"
+        decrypt_backup(database, key, str(streamed), Crypt.CRYPT14, stream=True, chunk_size=4096)
+        decrypt_backup(database, key, str(in_memory), Crypt.CRYPT14)
+        assert streamed.read_bytes() == in_memory.read_bytes() == plaintext
+
+    def test_dry_run(self):
+        database, key = build_crypt14(67, 191)
+        assert decrypt_backup(database, key, crypt=Crypt.CRYPT14, dry_run=True, stream=True) == 0
+
+    def test_tampered_tag_removes_output(self, tmp_path):
+        database, key = build_crypt14(67, 191)
+        database = bytearray(database)
+        database[-32] ^= 0xFF
+        output = tmp_path / "msgstore.db"
+        with pytest.raises(android_crypt.DecryptionError):
+            decrypt_backup(bytes(database), key, str(output), Crypt.CRYPT14, stream=True)
+        assert not output.exists()
+
+    def test_not_sqlite(self, tmp_path):
+        database, key = build_crypt14(67, 191, b"Not a database" * 100)
+        output = tmp_path / "msgstore.db"
+        with pytest.raises(android_crypt.DecryptionError):
+            decrypt_backup(database, key, str(output), Crypt.CRYPT14, stream=True)
+        assert not output.exists()
+
+
+class TestOffsetCache:
+    def test_brute_force_result_is_cached(self, tmp_path, monkeypatch):
+        cache = OffsetCache(str(tmp_path / "cache" / "offsets.json"))
+        database, key = build_crypt14(50, 150)
+        output = tmp_path / "msgstore.db"
+        decrypt_backup(database, key, str(output), Crypt.CRYPT14, max_worker=2, offset_cache=cache)
+        assert OffsetCache(cache.path).offsets == {OffsetCache.fingerprint(database): {"iv": 50, "db": 150}}
+
+        # A later backup of the same device must not brute force again
+        monkeypatch.setattr(android_crypt, "brute_force_offset", None)
+        database, _ = build_crypt14(50, 150, key=key)
+        for stream in (False, True):
+            assert decrypt_backup(database, key, str(output), Crypt.CRYPT14,
+                                  offset_cache=OffsetCache(cache.path), stream=stream) == 0
+            assert output.read_bytes() == SQLITE_IMAGE
+
+    @pytest.mark.parametrize("stream", [False, True])
+    def test_false_positive_cached_offset(self, tmp_path, monkeypatch, stream):
+        database, key = build_crypt14(50, 150)
+        cache = OffsetCache(str(tmp_path / "offsets.json"))
+        fingerprint = OffsetCache.fingerprint(database)
+        cache.add(fingerprint, 60, 150)
+
+        # The cached offset passes the header check but cannot decrypt the backup
+        check_header = android_crypt._check_header
+        monkeypatch.setattr(android_crypt, "_check_header",
+                            lambda o, d, k: o == (60, 76, 150) or check_header(o, d, k))
+        output = tmp_path / "msgstore.db"
+        assert decrypt_backup(database, key, str(output), Crypt.CRYPT14, max_worker=2,
+                              offset_cache=cache, stream=stream) == 0
+        assert output.read_bytes() == SQLITE_IMAGE
+        assert OffsetCache(cache.path).offsets[fingerprint] == {"iv": 50, "db": 150}
+
+    def test_known_offsets_are_not_cached(self, tmp_path):
+        cache = OffsetCache(str(tmp_path / "offsets.json"))
+        database, key = build_crypt14(67, 191)
+        decrypt_backup(database, key, crypt=Crypt.CRYPT14, dry_run=True, offset_cache=cache)
+        assert cache.offsets == {}
+        assert not os.path.exists(cache.path)
+
+    def test_candidates_order(self, tmp_path):
+        cache = OffsetCache(str(tmp_path / "offsets.json"))
+        cache.add("a", 10, 100)
+        cache.add("b", 20, 200)
+        cache.add("c", 10, 100)
+        assert cache.candidates("b") == [(20, 36, 200), (10, 26, 100)]
+        assert cache.candidates("unknown") == [(10, 26, 100), (20, 36, 200)]
+
+    def test_export_and_corrupted_file(self, tmp_path):
+        cache = OffsetCache(str(tmp_path / "offsets.json"))
+        cache.add("a", 10, 100)
+        exported = tmp_path / "exported.json"
+        cache.save(str(exported))
+        assert OffsetCache(str(exported)).offsets == {"a": {"iv": 10, "db": 100}}
+
+        exported.write_text("not json")
+        assert OffsetCache(str(exported)).offsets == {}
+
+
+class TestLoadKey:
+    def test_crypt14(self):
+        key = os.urandom(158)
+        assert android_crypt.load_key(key, Crypt.CRYPT14) == (key[126:], key[30:62])
+
+    def test_invalid_length(self):
+        with pytest.raises(android_crypt.InvalidKeyError):
+            android_crypt.load_key(os.urandom(157), Crypt.CRYPT14)
+
+    def test_crypt15_hex_key(self):
+        key = android_crypt.load_key(bytes(32), Crypt.CRYPT15)
+        assert key.signature is None
+        assert key.main_key == android_crypt._derive_main_enc_key(bytes(32))[0]
+
+    def test_concurrent_backups(self, tmp_path):
+        from argparse import Namespace
+        from Whatsapp_Chat_Exporter.__main__ import decrypt_android_backup
+
+        msgstore, key = build_crypt14(67, 191)
+        wa, _ = build_crypt14(67, 190, b"SQLite format 3\x00wa", key=key)
+        (tmp_path / "msgstore.db.crypt14").write_bytes(msgstore)
+        (tmp_path / "wa.db.crypt14").write_bytes(wa)
+        (tmp_path / "key").write_bytes(key)
+        args = Namespace(
+            key=str(tmp_path / "key"),
+            backup=str(tmp_path / "msgstore.db.crypt14"),
+            wab=str(tmp_path / "wa.db.crypt14"),
+            db=str(tmp_path / "msgstore.db"),
+            wa=str(tmp_path / "wa.db"),
+            showkey=False,
+            max_bruteforce_worker=2,
+            stream_decrypt=False,
+            decrypt_chunk_size=1024,
+            offset_cache=str(tmp_path / "offsets.json"),
+            in_memory=False,
+            export_offset_cache=None
+        )
+        assert decrypt_android_backup(args) == 0
+        assert (tmp_path / "msgstore.db").read_bytes() == SQLITE_IMAGE
+        assert (tmp_path / "wa.db").read_bytes() == b"SQLite format 3\x00wa"
+
+
+class TestBatchDecrypt:
+    def test_decrypt_and_skip(self, tmp_path):
+        key = os.urandom(158)
+        source = tmp_path / "backups"
+        source.mkdir()
+        backups = []
+        for day in ("01", "02"):
+            database, _ = build_crypt14(67, 191, key=key)
+            backup = source / f"msgstore-2024-01-{day}.1.db.crypt14"
+            backup.write_bytes(database)
+            backups.append(str(backup))
+        broken = source / "msgstore-2024-01-03.1.db.crypt14"
+        broken.write_bytes(os.urandom(300))
+        backups.append(str(broken))
+
+        keys = {Crypt.CRYPT14: android_crypt.load_key(key, Crypt.CRYPT14)}
+        output = tmp_path / "output"
+        output.mkdir()
+        results = android_crypt.decrypt_batch(backups, keys, str(output), max_worker=2)
+        assert [r.status for r in results] == ["decrypted", "decrypted", "failed"]
+        assert (output / "msgstore-2024-01-01.1.db").read_bytes() == SQLITE_IMAGE
+
+        results = android_crypt.decrypt_batch(backups[:2], keys, str(output), max_worker=2)
+        assert [r.status for r in results] == ["skipped", "skipped"]
+
+        # A modified output is decrypted again
+        (output / "msgstore-2024-01-02.1.db").write_bytes(b"")
+        results = android_crypt.decrypt_batch(backups[:2], keys, str(output), max_worker=2)
+        assert [r.status for r in results] == ["skipped", "decrypted"]
+        assert (output / "msgstore-2024-01-02.1.db").read_bytes() == SQLITE_IMAGE
+
+    def test_offsets_found_by_workers_are_cached(self, tmp_path):
+        key = os.urandom(158)
+        backups = []
+        for day in ("01", "02"):
+            database, _ = build_crypt14(50, 150, key=key)
+            backup = tmp_path / f"msgstore-2024-01-{day}.1.db.crypt14"
+            backup.write_bytes(database)
+            backups.append(str(backup))
+        keys = {Crypt.CRYPT14: android_crypt.load_key(key, Crypt.CRYPT14)}
+        output = tmp_path / "output"
+        output.mkdir()
+        cache = str(tmp_path / "offsets.json")
+        results = android_crypt.decrypt_batch(backups, keys, str(output), max_worker=2, offset_cache=cache)
+        assert [r.status for r in results] == ["decrypted", "decrypted"]
+        fingerprints = {OffsetCache.fingerprint(open(b, "rb").read()) for b in backups}
+        assert OffsetCache(cache).offsets == {f: {"iv": 50, "db": 150} for f in fingerprints}
+
+    @pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                        reason="The patch only reaches forked worker processes")
+    def test_unexpected_error_fails_one_backup(self, tmp_path, monkeypatch):
+        key = os.urandom(158)
+        backups = []
+        for day in ("01", "02"):
+            database, _ = build_crypt14(67, 191, key=key)
+            backup = tmp_path / f"msgstore-2024-01-{day}.1.db.crypt14"
+            backup.write_bytes(database)
+            backups.append(str(backup))
+        decrypt = android_crypt.decrypt_backup
+
+        def decrypt_backup(source, *args, **kwargs):
+            if source.endswith("01.1.db.crypt14"):
+                raise RuntimeError("Unexpected")
+            return decrypt(source, *args, **kwargs)
+
+        # Inherited by the forked worker processes
+        monkeypatch.setattr(android_crypt, "decrypt_backup", decrypt_backup)
+        keys = {Crypt.CRYPT14: android_crypt.load_key(key, Crypt.CRYPT14)}
+        results = android_crypt.decrypt_batch(backups, keys, str(tmp_path), max_worker=2)
+        assert [(r.status, r.error) for r in results] == [("failed", "Unexpected"), ("decrypted", None)]
+        assert os.path.isfile(tmp_path / android_crypt.BATCH_MANIFEST)
+
+    def test_missing_key(self, tmp_path):
+        backup = tmp_path / "msgstore.db.crypt12"
+        backup.write_bytes(os.urandom(300))
+        results = android_crypt.decrypt_batch([str(backup)], {}, str(tmp_path))
+        assert results[0].status == "failed"
+
+
+class TestInMemory:
+    def test_returns_database(self, tmp_path):
+        database, key = build_crypt14(67, 191)
+        assert decrypt_backup(database, key, crypt=Crypt.CRYPT14, in_memory=True) == SQLITE_IMAGE
+        assert os.listdir(tmp_path) == []
+
+    def test_stream_not_allowed(self):
+        database, key = build_crypt14(67, 191)
+        with pytest.raises(ValueError):
+            decrypt_backup(database, key, crypt=Crypt.CRYPT14, in_memory=True, stream=True)
+
+    def test_open_database(self, tmp_path):
+        import sqlite3
+        from Whatsapp_Chat_Exporter.__main__ import open_database
+        if not hasattr(sqlite3.Connection, "deserialize"):
+            pytest.skip("sqlite3.Connection.deserialize requires Python 3.11")
+
+        path = tmp_path / "plain.db"
+        with sqlite3.connect(path) as db:
+            db.execute("CREATE TABLE message (_id INTEGER PRIMARY KEY, text_data TEXT)")
+            db.execute("INSERT INTO message VALUES (1, 'hello')")
+        db.close()
+        database, key = build_crypt14(67, 191, path.read_bytes())
+        image = decrypt_backup(database, key, crypt=Crypt.CRYPT14, in_memory=True)
+        db = open_database("does-not-exist.db", image)
+        assert db.execute("SELECT text_data FROM message").fetchall() == [("hello",)]
+        db.close()
@@ -0,0 +1,527 @@
+import os
+import json
+import sqlite3
+import pytest
+from Whatsapp_Chat_Exporter import android_handler
+from Whatsapp_Chat_Exporter.data_model import ChatCollection, ChatStore, SpillingChatCollection, Timing
+from Whatsapp_Chat_Exporter.utility import SchemaProfile, estimate_row_count, ExportState, import_previous_export
+
+
+MSGSTORE_SCHEMA = """
+CREATE TABLE jid (_id INTEGER PRIMARY KEY, user TEXT, server TEXT, raw_string TEXT, type INTEGER);
+CREATE TABLE jid_map (lid_row_id INTEGER, jid_row_id INTEGER);
+CREATE TABLE chat (_id INTEGER PRIMARY KEY, jid_row_id INTEGER, hidden INTEGER DEFAULT 0, subject TEXT);
+CREATE TABLE message (
+    _id INTEGER PRIMARY KEY, chat_row_id INTEGER, from_me INTEGER, key_id TEXT, sender_jid_row_id INTEGER,
+    status INTEGER, broadcast INTEGER DEFAULT 0, timestamp INTEGER, received_timestamp INTEGER,
+    message_type INTEGER, text_data TEXT
+);
+CREATE TABLE message_quoted (message_row_id INTEGER PRIMARY KEY, key_id TEXT, text_data TEXT);
+CREATE TABLE message_location (message_row_id INTEGER PRIMARY KEY, latitude REAL, longitude REAL);
+CREATE TABLE message_media (
+    message_row_id INTEGER PRIMARY KEY, file_path TEXT, message_url TEXT, mime_type TEXT,
+    media_key BLOB, file_hash TEXT, raw_transcription_text TEXT
+);
+CREATE TABLE message_thumbnail (message_row_id INTEGER PRIMARY KEY, thumbnail BLOB);
+CREATE TABLE message_future (message_row_id INTEGER PRIMARY KEY, version INTEGER);
+CREATE TABLE missed_call_logs (_id INTEGER PRIMARY KEY, message_row_id INTEGER, video_call INTEGER);
+CREATE TABLE message_system (message_row_id INTEGER PRIMARY KEY, action_type INTEGER);
+CREATE TABLE message_system_group (message_row_id INTEGER PRIMARY KEY, is_me_joined INTEGER);
+CREATE TABLE message_system_number_change (
+    message_row_id INTEGER PRIMARY KEY, old_jid_row_id INTEGER, new_jid_row_id INTEGER
+);
+CREATE TABLE receipt_user (
+    _id INTEGER PRIMARY KEY, message_row_id INTEGER, receipt_timestamp INTEGER,
+    read_timestamp INTEGER, played_timestamp INTEGER
+);
+CREATE TABLE media_hash_thumbnail (media_hash TEXT, thumbnail BLOB);
+CREATE TABLE message_vcard (_id INTEGER PRIMARY KEY, message_row_id INTEGER, vcard TEXT);
+CREATE TABLE call_log (
+    _id INTEGER PRIMARY KEY, jid_row_id INTEGER, from_me INTEGER, call_id TEXT, timestamp INTEGER,
+    video_call INTEGER, duration INTEGER, call_result INTEGER, bytes_transferred INTEGER
+);
+CREATE TABLE message_add_on (
+    _id INTEGER PRIMARY KEY, chat_row_id INTEGER, from_me INTEGER, sender_jid_row_id INTEGER,
+    parent_message_row_id INTEGER
+);
+CREATE TABLE message_add_on_reaction (
+    message_add_on_row_id INTEGER PRIMARY KEY, reaction TEXT, sender_timestamp INTEGER
+);
+"""
+
+T = 1700000000000  # 2023-11-14 22:13:20 UTC
+
+
+def build_msgstore(path):
+    """Build a minimal msgstore.db of the new (message table) schema."""
+    db = sqlite3.connect(path)
+    db.executescript(MSGSTORE_SCHEMA)
+    db.executemany("INSERT INTO jid VALUES (?, ?, ?, ?, ?)", [
+        (1, "1111", "s.whatsapp.net", "1111@s.whatsapp.net", 0),
+        (2, "2222", "g.us", "2222@g.us", 1),
+        (3, "3333", "s.whatsapp.net", "3333@s.whatsapp.net", 0),
+        (4, "4444", "lid", "4444@lid", 17),
+        (5, "5555", "s.whatsapp.net", "5555@s.whatsapp.net", 0),
+    ])
+    db.execute("INSERT INTO jid_map VALUES (4, 5)")
+    db.executemany("INSERT INTO chat (_id, jid_row_id, subject) VALUES (?, ?, ?)", [
+        (1, 1, None),
+        (2, 2, "Friends"),
+        (3, 4, None),
+    ])
+    messages = [
+        # _id, chat, from_me, key_id, sender, status, timestamp, type, text
+        (1, 1, 0, "K1", 0, 0, T, 0, "Hello\nthere"),
+        (2, 1, 1, "K2", 0, 13, T + 60000, 0, "Hi"),
+        (3, 1, 1, "K3", 0, 13, T + 120000, 5, None),
+        (4, 1, 0, "K4", 0, 0, T + 180000, 15, None),
+        (5, 2, 0, "K5", 3, 0, T + 240000, 0, "Group message"),
+        (6, 2, 0, "K6", 3, 6, T + 300000, 7, "New name"),
+        (7, 2, 1, "K7", 0, 6, T + 360000, 7, None),
+        (8, 1, 0, "K8", 0, 0, T + 420000, 1, "Look at this"),
+        (9, 1, 0, "K9", 0, 0, T + 480000, 2, None),
+        (10, 1, 1, "K10", 0, 13, T + 540000, 20, None),
+        (11, 3, 0, "K11", 0, 0, T + 600000, 0, "Via lid"),
+        (12, 1, 0, "K12", 0, 0, T + 660000, 4, "Bob Card"),
+        (13, 1, 0, "K13", 0, 6, T + 720000, 0, None),
+    ]
+    db.executemany(
+        "INSERT INTO message (_id, chat_row_id, from_me, key_id, sender_jid_row_id, status, timestamp, "
+        "message_type, text_data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", messages
+    )
+    # Invalid UTF-8 and binary data
+    db.execute("INSERT INTO message (_id, chat_row_id, from_me, key_id, sender_jid_row_id, status, timestamp, "
+               f"message_type, text_data) VALUES (14, 1, 0, 'K14', 0, 0, {T + 780000}, 0, CAST(X'4869FF21' AS TEXT))")
+    db.execute("INSERT INTO message (_id, chat_row_id, from_me, key_id, sender_jid_row_id, status, timestamp, "
+               f"message_type, text_data) VALUES (15, 1, 0, 'K15', 0, 0, {T + 840000}, 0, X'00FF')")
+    db.execute("INSERT INTO message_quoted VALUES (2, 'K1', 'Hello there')")
+    db.execute("INSERT INTO message_location VALUES (3, 22.3, 114.2)")
+    db.execute("INSERT INTO message_system VALUES (6, 1)")
+    db.execute("INSERT INTO message_system VALUES (7, 4)")
+    db.execute("INSERT INTO missed_call_logs VALUES (1, 13, 1)")
+    db.execute(f"INSERT INTO receipt_user VALUES (1, 1, {T + 1000}, {T + 2000}, NULL)")
+    db.executemany("INSERT INTO message_media VALUES (?, ?, ?, ?, ?, ?, ?)", [
+        (8, "Media/WhatsApp Images/IMG-1.jpg", None, "image/jpeg", None, "AAEC", None),
+        (9, "Media/WhatsApp Voice Notes/PTT-1.opus", None, "audio/ogg", None, "AwQF", "Voice text"),
+        (10, "Media/WhatsApp Stickers/STK-1.webp", None, "image/webp", None, "BgcI", None),
+    ])
+    db.execute("INSERT INTO media_hash_thumbnail VALUES ('AAEC', X'89504E47')")
+    db.execute("INSERT INTO message_vcard VALUES (1, 12, 'BEGIN:VCARD\nFN:Bob\nEND:VCARD')")
+    db.executemany("INSERT INTO call_log VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        (1, 1, 1, "C1", T + 900000, 0, 65, 5, 2048),
+        (2, 3, 0, "C2", T + 960000, 1, 0, 2, 0),
+    ])
+    db.executemany("INSERT INTO message_add_on VALUES (?, ?, ?, ?, ?)", [
+        (1, 1, 1, 0, 1),
+        (2, 2, 0, 3, 5),
+    ])
+    db.executemany("INSERT INTO message_add_on_reaction VALUES (?, ?, ?)", [
+        (1, "\U0001F44D", T + 5000),
+        (2, "❤", T + 250000),
+    ])
+    db.commit()
+    return db
+
+
+@pytest.fixture
+def msgstore(tmp_path):
+    db = build_msgstore(tmp_path / "msgstore.db")
+    db.row_factory = sqlite3.Row
+    db.text_factory = lambda b: b.decode(encoding="utf-8", errors="replace")
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def media_folder(tmp_path):
+    folder = tmp_path / "WhatsApp"
+    (folder / "Media" / "WhatsApp Images").mkdir(parents=True)
+    (folder / "Media" / "WhatsApp Images" / "IMG-1.jpg").write_bytes(b"\xff\xd8")
+    return str(folder)
+
+
+def extract(db, media_folder, filter_chat=(None, None), filter_date=None, data=None):
+    """Run the Android extraction the same way as __main__.process_messages."""
+    data = ChatCollection() if data is None else data
+    data.set_system("schema", SchemaProfile.probe(db))
+    timing = Timing(0)
+    android_handler.messages(db, data, media_folder, timing, filter_date, filter_chat, False, False, False)
+    android_handler.calls(db, data, timing, filter_chat)
+    return data
+
+
+class TestMessages:
+    def test_chats(self, msgstore, media_folder):
+        data = extract(msgstore, media_folder)
+        assert set(data.keys()) == {
+            "1111@s.whatsapp.net", "2222@g.us", "5555@s.whatsapp.net", "000000000000000"
+        }
+        assert data["2222@g.us"].name == "Friends"
+        assert list(data["1111@s.whatsapp.net"].keys()) == [1, 2, 3, 4, 8, 9, 10, 12, 13, 14, 15]
+
+    def test_text_messages(self, msgstore, media_folder):
+        chat = extract(msgstore, media_folder)["1111@s.whatsapp.net"]
+        message = chat.get_message(1)
+        assert message.data == "Hello <br>there"
+        assert message.from_me is False
+        assert message.time == "22:13"
+        assert message.key_id == "K1"
+        assert message.received_timestamp == "2023/11/14 22:13"
+        assert message.read_timestamp == "2023/11/14 22:13"
+        assert message.reactions == {"You": "\U0001F44D"}
+
+        reply = chat.get_message(2)
+        assert reply.from_me is True
+        assert reply.reply == "K1"
+        assert reply.quoted_data == "Hello there"
+
+    def test_special_messages(self, msgstore, media_folder):
+        chat = extract(msgstore, media_folder)["1111@s.whatsapp.net"]
+        assert chat.get_message(3).data == "Location shared: (22.3, 114.2)"
+        assert chat.get_message(3).meta is True
+        assert chat.get_message(4).data == "Message deleted"
+        assert chat.get_message(13).data == "A video call was missed"
+        assert chat.get_message(14).data == "Hi�!"
+        assert chat.get_message(15).data.startswith("The message is binary data and its base64 is")
+        assert chat.get_message(15).safe is True
+
+    def test_group_messages(self, msgstore, media_folder):
+        data = extract(msgstore, media_folder)
+        group = data["2222@g.us"]
+        assert group.get_message(5).sender == "3333"
+        assert group.get_message(5).reactions == {"3333": "❤"}
+        assert group.get_message(6).data == '3333 changed the group name to "New name"'
+        assert group.get_message(6).meta is True
+        assert group.get_message(7).data == "You was added to the group"
+        assert data["5555@s.whatsapp.net"].get_message(11).data == "Via lid"
+
+    def test_chat_filter(self, msgstore, media_folder):
+        data = extract(msgstore, media_folder, filter_chat=(["2222"], None))
+        assert "1111@s.whatsapp.net" not in data
+        assert len(data["2222@g.us"]) == 3
+
+    def test_chat_filter_resolved(self, msgstore, media_folder):
+        # Group messages of the member and the chat of a LID mapped to the JID
+        data = extract(msgstore, media_folder, filter_chat=(["3333", "5555"], None))
+        assert list(data["2222@g.us"].keys()) == [5, 6]
+        assert data["2222@g.us"].get_message(5).reactions == {"3333": "❤"}
+        assert list(data["5555@s.whatsapp.net"].keys()) == [11]
+        assert "1111@s.whatsapp.net" not in data
+        assert list(data.get_system("chat_filter_ids").values())[0][0] == [
+            (frozenset(), frozenset({3})), (frozenset({3}), frozenset({4, 5}))
+        ]
+
+    def test_calls_filter(self, msgstore, media_folder):
+        assert len(extract(msgstore, media_folder, filter_chat=(["1111"], None))["000000000000000"]) == 1
+        assert "000000000000000" not in extract(msgstore, media_folder, filter_chat=(None, ["1111", "3333"]))
+
+    def test_reactions(self, msgstore, media_folder):
+        # Reactions in the chat of a LID, and a changed reaction
+        msgstore.executemany("INSERT INTO message_add_on VALUES (?, ?, ?, ?, ?)", [
+            (3, 3, 0, 4, 11), (4, 1, 1, 0, 1), (5, 2, 0, 3, 99)
+        ])
+        msgstore.executemany("INSERT INTO message_add_on_reaction VALUES (?, ?, ?)", [
+            (3, "\U0001F602", T + 700000), (4, "❤", T + 710000), (5, "❤", T + 720000)
+        ])
+        data = extract(msgstore, media_folder)
+        assert data["5555@s.whatsapp.net"].get_message(11).reactions == {"4444": "\U0001F602"}
+        assert data["1111@s.whatsapp.net"].get_message(1).reactions == {"You": "❤"}
+        assert data.get_system("last_reaction_id") == 5
+
+    def test_reactions_filtered(self, msgstore, media_folder, caplog):
+        with caplog.at_level("INFO"):
+            data = extract(msgstore, media_folder, filter_date=f"> {T + 200000}")
+        assert 1 not in data["1111@s.whatsapp.net"].keys()
+        assert data["2222@g.us"].get_message(5).reactions == {"3333": "❤"}
+        # The reaction to message 1 is not even read
+        assert any(r.getMessage().startswith("Processed 1 reactions") for r in caplog.records)
+
+
+class TestNameResolver:
+    def test_contact_names(self, msgstore, media_folder):
+        data = ChatCollection()
+        data.add_chat("3333@s.whatsapp.net", ChatStore("android", "Carol"))
+        group = extract(msgstore, media_folder, data=data)["2222@g.us"]
+        assert group.get_message(5).sender == "Carol"
+        assert group.get_message(5).reactions == {"Carol": "❤"}
+        assert group.get_message(6).data == 'Carol changed the group name to "New name"'
+
+    def test_fallback(self):
+        data = ChatCollection()
+        assert data.names.resolve("3333@s.whatsapp.net") == "3333"
+        assert data.names.fallback("3333@s.whatsapp.net") is data.names.fallback("3333@s.whatsapp.net")
+        assert data.names.resolve("status") is None
+        assert data.names.resolve(None) is None
+
+        # Chats added later are still found
+        data.add_chat("3333@s.whatsapp.net", ChatStore("android"))
+        assert data.names.resolve("3333@s.whatsapp.net") == "3333"
+        data["3333@s.whatsapp.net"].name = "Carol"
+        assert data.names.resolve("3333@s.whatsapp.net") == "Carol"
+
+
+class TestMedia:
+    def test_media(self, msgstore, media_folder):
+        chat = extract(msgstore, media_folder)["1111@s.whatsapp.net"]
+        image = chat.get_message(8)
+        assert image.media is True
+        assert image.data == f"{media_folder}/Media/WhatsApp Images/IMG-1.jpg"
+        assert image.mime == "image/jpeg"
+        assert image.caption == "Look at this"
+        assert image.thumb == f"{media_folder}/thumbnails/000102.png"
+        assert os.path.isfile(image.thumb)
+
+        voice = chat.get_message(9)
+        assert voice.caption == '"Voice text"'
+        assert voice.data == "The media is missing"
+
+        sticker = chat.get_message(10)
+        assert sticker.sticker is True
+        assert sticker.meta is True
+
+    def test_vcard(self, msgstore, media_folder):
+        message = extract(msgstore, media_folder)["1111@s.whatsapp.net"].get_message(12)
+        assert message.mime == "text/x-vcard"
+        assert "BobCard.vcf" in message.data
+        with open(os.path.join(media_folder, "vCards", "BobCard.vcf"), encoding="utf-8") as f:
+            assert f.read() == "BEGIN:VCARD\nFN:Bob\nEND:VCARD"
+
+
+class TestCalls:
+    def test_calls(self, msgstore, media_folder):
+        calls = extract(msgstore, media_folder)["000000000000000"]
+        assert calls.name == "WhatsApp Calls"
+        assert calls.get_message(1).data == (
+            "A voice call to 1111 was initiated and lasted for 1 minute 5 seconds with 2.0 KB data transferred."
+        )
+        assert calls.get_message(2).data == "A video call from 3333 was missed."
+
+
+class TestEstimate:
+    def test_estimate_row_count(self, msgstore):
+        assert estimate_row_count(msgstore, "message") == 15
+        assert estimate_row_count(msgstore, "message", skip=True) is None
+        assert estimate_row_count(msgstore, "no_such_table") is None
+
+    def test_estimate_from_stat(self, msgstore):
+        msgstore.execute("CREATE INDEX message_chat ON message (chat_row_id)")
+        msgstore.execute("DELETE FROM message WHERE _id > 10")
+        msgstore.execute("ANALYZE")
+        assert estimate_row_count(msgstore, "message") == 10
+
+    def test_exact_count_logged(self, msgstore, media_folder, caplog):
+        with caplog.at_level("INFO"):
+            extract(msgstore, media_folder, filter_chat=(["2222"], None))
+        assert any(r.getMessage().startswith("Processed 3 messages, 0 media and 0 vCards")
+                   for r in caplog.records)
+
+
+class TestOptimizeDatabase:
+    def test_working_copy(self, tmp_path, media_folder):
+        source = build_msgstore(tmp_path / "msgstore.db")
+        with open(tmp_path / "msgstore.db", "rb") as f:
+            original = f.read()
+
+        copy = android_handler.optimize_database(source, str(tmp_path / "copy.db"))
+        indexes = {row[0] for row in copy.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {"exporter_receipt_user", "exporter_jid_map", "exporter_message_system"} <= indexes
+        assert estimate_row_count(copy, "message") == 15
+
+        copy.row_factory = sqlite3.Row
+        source.row_factory = sqlite3.Row
+        optimized, plain = extract(copy, media_folder), extract(source, media_folder)
+        assert [m.data for m in optimized["1111@s.whatsapp.net"].values()] == \
+            [m.data for m in plain["1111@s.whatsapp.net"].values()]
+        copy.close()
+        source.close()
+
+        with open(tmp_path / "msgstore.db", "rb") as f:
+            assert f.read() == original
+
+    def test_in_place(self, msgstore):
+        assert android_handler.optimize_database(msgstore) is msgstore
+        assert msgstore.execute("SELECT count() FROM sqlite_stat1").fetchone()[0] > 0
+
+
+class TestDelta:
+    SETTINGS = {"device": "android", "filter_date": None}
+
+    def run(self, db, media_folder, json_file, state):
+        """Run a delta export the same way as __main__ with -j and --delta."""
+        data = ChatCollection()
+        if state.message_id is not None:
+            import_previous_export(json_file, data)
+            data.set_system("last_message_id", state.message_id)
+            data.set_system("last_reaction_id", state.reaction_id)
+        data.set_system("schema", SchemaProfile.probe(db))
+        timing = Timing(0)
+        android_handler.messages(db, data, media_folder, timing, None, (None, None), False, False, False)
+        android_handler.calls(db, data, timing, (None, None))
+        with open(json_file, "w") as f:
+            json.dump({jid: chat.to_json() for jid, chat in data.items()}, f)
+        state.update(data)
+        return data
+
+    def test_only_new_messages(self, msgstore, media_folder, tmp_path):
+        json_file = str(tmp_path / "result.json")
+        state = ExportState(self.SETTINGS)
+        self.run(msgstore, media_folder, json_file, state)
+        assert state.message_id == 15
+        assert state.chats["2222@g.us"] == {"id": 7, "timestamp": (T + 360000) / 1000}
+        assert state.reaction_id == 2
+
+        msgstore.execute("INSERT INTO message (_id, chat_row_id, from_me, key_id, sender_jid_row_id, status, "
+                         f"timestamp, message_type, text_data) VALUES (16, 2, 1, 'K16', 0, 13, {T + 900000}, 0, 'New')")
+        # A reaction to a message of the previous export
+        msgstore.execute("INSERT INTO message_add_on VALUES (3, 1, 0, 1, 2)")
+        msgstore.execute(f"INSERT INTO message_add_on_reaction VALUES (3, '\U0001F602', {T + 6000})")
+        # Messages below the watermark are not extracted again
+        msgstore.execute("UPDATE message SET text_data = 'Changed' WHERE _id = 1")
+
+        data = self.run(msgstore, media_folder, json_file, state)
+        chat = data["1111@s.whatsapp.net"]
+        assert chat.get_message(1).data == "Hello <br>there"
+        assert chat.get_message(2).reactions == {"1111": "\U0001F602"}
+        assert chat.get_message(8).media is True
+        assert list(data["2222@g.us"].keys()) == [5, 6, 7, 16]
+        assert data["2222@g.us"].get_message(16).data == "New"
+        assert state.chats["2222@g.us"]["id"] == 16
+        assert state.reaction_id == 3
+
+    def test_state_file(self, tmp_path):
+        state = ExportState(self.SETTINGS, {"1111@s.whatsapp.net": {"id": 3, "timestamp": 1}}, 2)
+        state.save(str(tmp_path))
+        loaded = ExportState.load(str(tmp_path), self.SETTINGS)
+        assert loaded.message_id == 3
+        assert loaded.reaction_id == 2
+        assert ExportState.load(str(tmp_path), dict(self.SETTINGS, filter_date="> 1")) is None
+        assert ExportState.load(str(tmp_path / "missing"), self.SETTINGS) is None
+
+
+class TestPartitions:
+    def test_chat_partitions(self, msgstore):
+        data = ChatCollection()
+        partitions = android_handler.chat_partitions(msgstore, data, 2)
+        assert len(partitions) == 2
+        assert sorted(key for partition in partitions for key in partition) == \
+            [row[0] for row in msgstore.execute("SELECT DISTINCT chat_row_id FROM message ORDER BY 1")]
+
+    def test_parallel_extraction(self, tmp_path, msgstore, media_folder):
+        from types import SimpleNamespace
+        from Whatsapp_Chat_Exporter.__main__ import extract_in_parallel
+
+        args = SimpleNamespace(
+            android=True, workers=3, media=media_folder, filter_date=None, filter_empty=False,
+            no_reply_ios=False, separate_media=False, fix_dot_files=False
+        )
+        data = ChatCollection()
+        data.set_system("schema", SchemaProfile.probe(msgstore))
+        extract_in_parallel(args, msgstore, str(tmp_path / "msgstore.db"), data, (None, None), Timing(0))
+        android_handler.calls(msgstore, data, Timing(0), (None, None))
+
+        expected = extract(msgstore, media_folder)
+        assert set(data.keys()) == set(expected.keys())
+        for chat_id, chat in expected.items():
+            assert [(k, m.data, m.reactions) for k, m in data[chat_id].items()] == \
+                [(k, m.data, m.reactions) for k, m in chat.items()]
+        assert data.get_system("last_reaction_id") == expected.get_system("last_reaction_id")
+
+    def test_worker_keeps_errors(self):
+        """Test that a worker process hides its progress bars but not its warnings and errors"""
+        import subprocess
+        import sys
+        code = (
+            "import logging, sys\n"
+            "from tqdm import tqdm\n"
+            "from Whatsapp_Chat_Exporter.__main__ import _init_worker\n"
+            "_init_worker()\n"
+            "for _ in tqdm(range(3), desc='Processing messages', leave=False): pass\n"
+            "logging.info('Processed')\n"
+            "logging.warning('Could not fetch reactions')\n"
+            "raise RuntimeError('Broken partition')\n"
+        )
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        assert "Processing messages" not in result.stderr
+        assert "Processed" not in result.stderr
+        assert "Could not fetch reactions" in result.stderr
+        assert "RuntimeError: Broken partition" in result.stderr
+
+
+class TestHtml:
+    def test_reply_to_earlier_page(self, tmp_path):
+        from Whatsapp_Chat_Exporter.data_model import Message
+        from Whatsapp_Chat_Exporter.utility import ROW_SIZE, Device
+
+        chat = ChatStore(Device.ANDROID, "Alice")
+        for id, data in ((1, "photo.jpg"), (2, "Hi"), (3, "Nice photo")):
+            message = Message(from_me=id == 3, timestamp=1700000000 + id, time=0, key_id=f"K{id}")
+            message.data = data
+            chat.add_message(id, message)
+        chat.get_message(1).media = True
+        chat.get_message(1).mime = "image/jpeg"
+        chat.get_message(3).reply = "K1"
+        chat.get_message(2).reply = "K9"
+        data = ChatCollection()
+        data.add_chat("1111@s.whatsapp.net", chat)
+
+        # The photo alone on the first page, the replies on the second
+        android_handler.create_html(data, str(tmp_path), maximum_size=ROW_SIZE + 150,
+                                    headline="Chat history with ??")
+        assert sorted(os.listdir(tmp_path)) == ["1111-Alice-1.html", "1111-Alice-2.html"]
+        with open(tmp_path / "1111-Alice-2.html", encoding="utf-8") as f:
+            page = f.read()
+        assert 'href="1111-Alice-1.html#K1"' in page
+        assert 'src="photo.jpg"' in page
+        assert 'href="#K9"' in page
+
+
+class TestSpilling:
+    def test_same_chats(self, msgstore, media_folder):
+        data = SpillingChatCollection(max_chats=1)
+        extract(msgstore, media_folder, (None, None), None, data)
+        assert data._store.execute("SELECT count(*) FROM message").fetchone()[0] > 0
+        assert data.to_dict() == extract(msgstore, media_folder, (None, None), None).to_dict()
+        data.close()
+
+
+class TestStreaming:
+    def args(self, tmp_path, media_folder, name, pretty_print_json=None):
+        from types import SimpleNamespace
+        return SimpleNamespace(
+            android=True, ios=False, workers=1, streaming=True, media=media_folder, filter_date=None,
+            filter_empty=False, no_reply_ios=False, separate_media=False, fix_dot_files=False,
+            no_html=False, output=str(tmp_path / name), template=None, embedded=False, offline=None,
+            size=None, no_avatar=False, telegram_theme=False, headline="Chat history with ??",
+            text_format=None, json=str(tmp_path / f"{name}.json"), import_json=False, json_per_chat=False,
+            telegram=False, avoid_encoding_json=False, pretty_print_json=pretty_print_json
+        )
+
+    @pytest.mark.parametrize("pretty_print_json", [None, 2])
+    def test_same_output(self, tmp_path, msgstore, media_folder, monkeypatch, pretty_print_json):
+        from Whatsapp_Chat_Exporter import __main__
+
+        # Small batches, so that the chats are written in several of them
+        monkeypatch.setattr(__main__, "STREAM_BATCH_SIZE", 4)
+        args = self.args(tmp_path, media_folder, "streamed", pretty_print_json)
+        data = ChatCollection()
+        data.set_system("schema", SchemaProfile.probe(msgstore))
+        __main__.stream_chats(args, msgstore, data, (None, None), Timing(0))
+        assert all(len(chat) == 0 for chat in data.values())
+
+        expected_args = self.args(tmp_path, media_folder, "full", pretty_print_json)
+        __main__.create_output_files(expected_args, extract(msgstore, media_folder))
+        with open(args.json) as streamed, open(expected_args.json) as full:
+            assert json.load(streamed) == json.load(full)
+        assert sorted(os.listdir(args.output)) == sorted(os.listdir(expected_args.output))
+
+    @pytest.mark.parametrize("indent", [None, 0, 2])
+    def test_json_stream(self, tmp_path, indent):
+        from Whatsapp_Chat_Exporter.__main__ import JsonStream
+
+        chats = {"1111@s.whatsapp.net": {"name": "Ünïcode", "messages": {"1": {"data": "Hi"}}}, "2222@g.us": {}}
+        for content in (chats, {}):
+            with JsonStream(str(tmp_path / "chats.json"), True, indent) as stream:
+                for chat_id, chat in content.items():
+                    stream.write(chat_id, chat)
+            with open(tmp_path / "chats.json") as f:
+                assert f.read() == json.dumps(content, indent=indent)
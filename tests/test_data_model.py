@@ -0,0 +1,254 @@
+import pickle
+import pytest
+from datetime import datetime
+from Whatsapp_Chat_Exporter.data_model import ChatStore, Message, SpillingChatCollection, Timing, TimeZone
+from Whatsapp_Chat_Exporter.utility import Device
+
+
+def make_message(**kwargs):
+    fields = dict(
+        from_me=1,
+        timestamp=1700000000000,
+        time=1700000000000,
+        key_id="3EB0A1",
+        received_timestamp=1700000001,
+        timezone_offset=Timing(0)
+    )
+    fields.update(kwargs)
+    return Message(**fields)
+
+
+class TestTiming:
+    @pytest.mark.parametrize("offset", [0, -12, 5, 14, 0.0, 5.5, -3.5, 8.0])
+    @pytest.mark.parametrize("timestamp", [
+        0, -1, 86399, 86400, 1700000000, 1700000000123, 1700000000123.5, 59.9999994,
+        59.9999995, 59.9999996, 1699999999.9999995, -0.0000004, -0.0000006, 978307200.25
+    ])
+    def test_matches_strftime(self, offset, timestamp):
+        timing = Timing(offset)
+        seconds = timestamp / 1000 if timestamp > 9999999999 else timestamp
+        for format in ("%H:%M", "%Y/%m/%d %H:%M", "%Y-%m-%dT%H:%M:%S"):
+            expected = datetime.fromtimestamp(seconds, TimeZone(offset)).strftime(format)
+            assert timing.format_timestamp(timestamp, format) == expected
+
+    @pytest.mark.parametrize("offset", [0.0, 5.5])
+    def test_float_offset_is_cached(self, offset):
+        timing = Timing(offset)
+        assert timing._offset_seconds == round(offset * 3600)
+        timing.format_timestamp(1700000000, "%Y/%m/%d %H:%M")
+        assert timing._days
+
+    def test_none(self):
+        assert Timing(0).format_timestamp(None, "%H:%M") is None
+
+    def test_shared_strings(self):
+        timing = Timing(0)
+        assert timing.format_timestamp(60, "%H:%M") is timing.format_timestamp(86460, "%H:%M")
+
+    def test_pickle(self):
+        timing = pickle.loads(pickle.dumps(Timing(8)))
+        assert timing.format_timestamp(1700000000, "%Y/%m/%d %H:%M") == "2023/11/15 06:13"
+
+
+class TestMessage:
+    def test_to_json(self):
+        message = make_message()
+        message.data = "Hello"
+        assert message.to_json() == {
+            "from_me": True, "timestamp": 1700000000.0, "time": "22:13", "media": False,
+            "key_id": "3EB0A1", "meta": False, "data": "Hello", "sender": None, "safe": False,
+            "mime": None, "message_type": None, "received_timestamp": "2023/11/14 22:13",
+            "read_timestamp": None, "reply": None, "quoted_data": None, "caption": None,
+            "thumb": None, "sticker": False, "reactions": {}
+        }
+
+    def test_round_trip(self):
+        message = make_message()
+        message.media = True
+        message.mime = "image/jpeg"
+        message.caption = "A caption"
+        message.add_reaction("You", "\U0001F44D")
+        converted = message.to_json()
+        restored = Message.from_json(converted)
+        assert restored.to_json() == converted
+        assert list(restored.to_json()) == list(converted)
+
+    def test_reactions_are_lazy(self):
+        message = make_message()
+        other = make_message()
+        assert message.reactions == {}
+        assert message._reactions is None
+        with pytest.raises(TypeError):
+            message.reactions["You"] = "x"
+        message.add_reaction("You", "x")
+        message.add_reaction("You", "y")
+        assert message.reactions == {"You": "y"}
+        assert other.reactions == {}
+        message.reactions = {}
+        assert message._reactions is None
+
+    def test_times_are_formatted_lazily(self):
+        message = make_message(read_timestamp=1700000061)
+        assert message._time is None
+        assert message._received_timestamp == 1700000001
+        assert message.time == "22:13"
+        assert message.read_timestamp == "2023/11/14 22:14"
+        assert message._read_timestamp == "2023/11/14 22:14"
+
+    def test_times_as_strings(self):
+        message = make_message(time="09:30", received_timestamp="2020/01/01 09:31", read_timestamp=[])
+        assert message.time == "09:30"
+        assert message.received_timestamp == "2020/01/01 09:31"
+        assert message.read_timestamp is None
+        with pytest.raises(TypeError):
+            make_message(time=None)
+
+    def test_no_instance_dict(self):
+        message = make_message()
+        assert not hasattr(message, "__dict__")
+        with pytest.raises(AttributeError):
+            message.unknown = True
+
+    def test_pickle(self):
+        message = make_message()
+        message.add_reaction("Alice", "❤")
+        assert pickle.loads(pickle.dumps(message)).to_json() == message.to_json()
+
+
+class TestChatStoreIndexes:
+    @pytest.fixture
+    def chat(self):
+        chat = ChatStore(Device.ANDROID)
+        for id, timestamp in ((1, 100), (2, 200), (3, 300), (4, 300), (5, 400)):
+            chat.add_message(id, make_message(timestamp=timestamp, key_id=f"K{id}"))
+        return chat
+
+    def ids(self, messages):
+        return [message.key_id for message in messages]
+
+    def test_messages_between(self, chat):
+        assert self.ids(chat.messages_between(200, 400)) == ["K2", "K3", "K4"]
+        assert self.ids(chat.messages_between(start=300)) == ["K3", "K4", "K5"]
+        assert self.ids(chat.messages_between(end=150)) == ["K1"]
+        assert chat.messages_between(500) == []
+
+    def test_add_and_delete(self, chat):
+        chat.messages_between()
+        chat.get_message_by_key_id("K1")
+        chat.add_message(6, make_message(timestamp=250, key_id="K6"))
+        chat.add_message(7, make_message(timestamp=500, key_id="K7"))
+        chat.delete_message(3)
+        chat.delete_message(99)
+        assert self.ids(chat.messages_between(200, 301)) == ["K2", "K6", "K4"]
+        assert self.ids(chat.messages_between()) == ["K1", "K2", "K6", "K4", "K5", "K7"]
+        assert chat.get_message_by_key_id("K6") is chat.get_message(6)
+        assert chat.get_message_by_key_id("K3") is None
+
+    def test_replace(self, chat):
+        chat.messages_between()
+        chat.get_message_by_key_id("K2")
+        chat.add_message(2, make_message(timestamp=450, key_id="K8"))
+        assert self.ids(chat.messages_between(400)) == ["K5", "K8"]
+        assert chat.get_message_by_key_id("K2") is None
+        assert chat.get_message_by_key_id("K8") is chat.get_message(2)
+
+    def test_merge_with(self, chat):
+        chat.messages_between()
+        other = ChatStore(Device.ANDROID)
+        other.add_message(9, make_message(timestamp=50, key_id="K9"))
+        chat.merge_with(other)
+        assert self.ids(chat.messages_between(end=150)) == ["K9", "K1"]
+        assert chat.get_message_by_key_id("K9") is chat.get_message(9)
+
+    def test_last_message(self, chat):
+        assert chat.get_last_message().key_id == "K5"
+        chat.clear_messages()
+        assert chat.messages_between() == []
+        with pytest.raises(IndexError):
+            chat.get_last_message()
+
+    def test_indexes_not_exported(self, chat):
+        chat.messages_between()
+        chat.get_message_by_key_id("K1")
+        assert not any(key.startswith("_") for key in chat.to_json())
+
+
+class TestSpillingChatCollection:
+    @pytest.fixture
+    def data(self):
+        data = SpillingChatCollection(max_chats=2)
+        timing = Timing(0)
+        for i in range(5):
+            chat = ChatStore(Device.ANDROID, f"Chat {i}")
+            chat.add_message(i, make_message(key_id=f"K{i}", timezone_offset=timing))
+            data.add_chat(f"{i}@s.whatsapp.net", chat)
+        yield data
+        data.close()
+
+    def spilled(self, data):
+        return sorted(row[0] for row in data._store.execute("SELECT DISTINCT chat_id FROM message"))
+
+    def test_spills_least_recently_used(self, data):
+        assert list(data._recent) == ["3@s.whatsapp.net", "4@s.whatsapp.net"]
+        assert self.spilled(data) == ["0@s.whatsapp.net", "1@s.whatsapp.net", "2@s.whatsapp.net"]
+        assert data._chats["0@s.whatsapp.net"]._messages == {}
+        assert len(data) == 5
+        assert "0@s.whatsapp.net" in data
+        assert "5@s.whatsapp.net" not in data
+        assert data.get_chat("5@s.whatsapp.net") is None
+        with pytest.raises(KeyError):
+            data["5@s.whatsapp.net"]
+
+    def test_names_do_not_read_messages(self, data):
+        assert data.names.resolve("0@s.whatsapp.net") == "Chat 0"
+        assert data.get_chat("1@s.whatsapp.net").name == "Chat 1"
+        assert "0@s.whatsapp.net" in self.spilled(data)
+        assert "1@s.whatsapp.net" in self.spilled(data)
+
+    def test_reads_back(self, data):
+        assert list(data.keys()) == [f"{i}@s.whatsapp.net" for i in range(5)]
+        assert [(chat.name, chat.get_message(i).key_id) for i, chat in enumerate(data.values())] == \
+            [(f"Chat {i}", f"K{i}") for i in range(5)]
+        assert len(data._recent) == 2
+        timings = {id(message._timing) for chat in data.values() for message in chat.values()}
+        assert len(timings) == 1
+
+    def test_add_to_spilled_chat(self, data):
+        chat = data["0@s.whatsapp.net"]
+        chat.add_message(9, make_message(key_id="K9"))
+        chat.add_message(0, make_message(key_id="K0b"))
+        data["1@s.whatsapp.net"]
+        data["2@s.whatsapp.net"]
+        assert data._store.execute(
+            "SELECT count() FROM message WHERE chat_id = '0@s.whatsapp.net'").fetchone()[0] == 3
+        assert data["0@s.whatsapp.net"] is chat
+        assert [message.key_id for message in chat.values()] == ["K0b", "K9"]
+        assert list(chat.keys()) == [0, 9]
+        assert "0@s.whatsapp.net" not in self.spilled(data)
+
+    def test_message_in_memory_is_not_read_back(self, data):
+        chat = data["0@s.whatsapp.net"]
+        chat.add_message(9, make_message(key_id="K9"))
+        chat.get_message(9).media = True
+        assert "0@s.whatsapp.net" in self.spilled(data)
+        assert chat.get_message(0).key_id == "K0"
+        assert "0@s.whatsapp.net" not in self.spilled(data)
+        assert chat.get_message(9).media
+
+    def test_remove_chat(self, data):
+        data.remove_chat("0@s.whatsapp.net")
+        data.remove_chat("4@s.whatsapp.net")
+        data.remove_chat("5@s.whatsapp.net")
+        assert list(data) == ["1@s.whatsapp.net", "2@s.whatsapp.net", "3@s.whatsapp.net"]
+        assert "0@s.whatsapp.net" not in self.spilled(data)
+        data.add_chat("1@s.whatsapp.net", ChatStore(Device.ANDROID, "Replaced"))
+        assert "1@s.whatsapp.net" not in self.spilled(data)
+        assert len(data["1@s.whatsapp.net"]) == 0
+
+    def test_to_dict(self, data):
+        assert list(data.to_dict()) == list(data.keys())
+        assert data.to_dict()["0@s.whatsapp.net"]["messages"][0]["key_id"] == "K0"
+        with pytest.raises(TypeError):
+            data.add_chat("6@s.whatsapp.net", {})
+        with pytest.raises(ValueError):
+            SpillingChatCollection(max_chats=0)
@@ -0,0 +1,49 @@
+import sqlite3
+import pytest
+from Whatsapp_Chat_Exporter import ios_handler
+from Whatsapp_Chat_Exporter.utility import get_partition_condition
+
+
+@pytest.fixture
+def chat_storage():
+    db = sqlite3.connect(":memory:")
+    db.executescript("""
+        CREATE TABLE ZWAMESSAGE (Z_PK INTEGER PRIMARY KEY, ZCHATSESSION INTEGER, ZSTANZAID TEXT, ZTEXT TEXT);
+        CREATE TABLE ZWAMEDIAITEM (Z_PK INTEGER PRIMARY KEY, ZMESSAGE INTEGER, ZTITLE TEXT);
+        INSERT INTO ZWAMESSAGE VALUES (1, 1, '3A000000000000001', 'First chat');
+        INSERT INTO ZWAMESSAGE VALUES (2, 1, '3A000000000000002', NULL);
+        INSERT INTO ZWAMESSAGE VALUES (3, 2, '3A000000000000003-suffix', 'Second chat');
+        INSERT INTO ZWAMESSAGE VALUES (4, 2, '3A000000000000004', NULL);
+        INSERT INTO ZWAMEDIAITEM VALUES (1, 2, 'A title');
+    """)
+    yield db
+    db.close()
+
+
+class TestQuotedTexts:
+    def test_whole_database(self, chat_storage):
+        """Test that every quotable message is read up front without a partition"""
+        quoted = ios_handler._QuotedTexts(chat_storage.cursor(), "")
+        assert quoted == {
+            "3A000000000000001": "First chat",
+            "3A000000000000002": "A title",
+            "3A000000000000003": "Second chat"
+        }
+        assert quoted.get("3A000000000000004") is None
+
+    def test_partition_does_not_load_other_chats(self, chat_storage):
+        """Test that a batch reads the quotes of its chats up front and those of other chats on demand"""
+        partition_filter = get_partition_condition("ZWAMESSAGE.ZCHATSESSION", [1])
+        quoted = ios_handler._QuotedTexts(chat_storage.cursor(), partition_filter)
+        assert quoted == {"3A000000000000001": "First chat", "3A000000000000002": "A title"}
+        # A private reply to a message in another chat
+        assert quoted.get("3A000000000000003") == "Second chat"
+        assert quoted.get("3A000000000000004") is None
+        assert quoted.get("3A000000000000009", "") == ""
+        assert quoted == {
+            "3A000000000000001": "First chat",
+            "3A000000000000002": "A title",
+            "3A000000000000003": "Second chat",
+            "3A000000000000004": None,
+            "3A000000000000009": None
+        }
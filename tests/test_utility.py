@@ -349,4 +349,133 @@ class TestGetChatCondition:
         assert result == "AND ( email LIKE '%test@example.com%')"
         
         result = get_chat_condition(["user-name"], True, ["username"])
-        assert result == "AND ( username LIKE '%user-name%')"
\ No newline at end of file
+        assert result == "AND ( username LIKE '%user-name%')"
+
+
+class TestGetChatIdCondition:
+    def test_no_filter(self):
+        """Test when filter is None"""
+        assert get_chat_id_condition(None, True, ["message.chat_row_id"]) == ""
+
+    def test_same_structure_as_like(self):
+        """Test that the conditions are combined as in get_chat_condition"""
+        ids = [(frozenset({2, 1}), frozenset({5})), (frozenset(), frozenset({7}))]
+        result = get_chat_id_condition(ids, True, ["chat", "sender"], "jid", "android")
+        assert result == ("AND ( chat IN (1, 2) OR (sender IN (5) AND jid.type == 1)"
+                          " OR chat IN (-1) OR (sender IN (7) AND jid.type == 1))")
+        result = get_chat_id_condition(ids[:1], False, ["chat", "sender"], "jid", "ios")
+        assert result == "AND ( chat NOT IN (1, 2) AND (sender NOT IN (5) AND jid IS NOT NULL))"
+
+    def test_resolve_chat_filter(self):
+        """Test that phone numbers are resolved once to the matching row ids"""
+        db = sqlite3.connect(":memory:")
+        db.execute("CREATE TABLE jid (_id INTEGER PRIMARY KEY, raw_string TEXT)")
+        db.executemany("INSERT INTO jid VALUES (?, ?)", [(1, "1234@s.whatsapp.net"), (2, "5678@g.us")])
+        data = ChatCollection()
+        query = ("SELECT _id FROM jid WHERE raw_string LIKE ?",)
+        resolved = resolve_chat_filter(db, data, (["1234", "9"], None), query)
+        assert resolved == ([(frozenset({1}),), (frozenset(),)], None)
+        db.execute("DELETE FROM jid")
+        assert resolve_chat_filter(db, data, (["1234", "9"], None), query) is resolved
+
+
+class TestSchemaProfile:
+    @pytest.fixture
+    def schema(self):
+        db = sqlite3.connect(":memory:")
+        db.execute("CREATE TABLE message (_id INTEGER PRIMARY KEY, text_data TEXT)")
+        db.execute("CREATE TABLE message_media (message_row_id INTEGER, raw_transcription_text TEXT)")
+        db.execute("CREATE VIEW messages AS SELECT _id, text_data AS data FROM message")
+        yield SchemaProfile.probe(db)
+        db.close()
+
+    def test_tables_and_columns(self, schema):
+        """Test that tables, views and their columns are probed"""
+        assert schema.has_table("message")
+        assert schema.has_table("messages")
+        assert not schema.has_table("jid_map")
+        assert schema.has_columns("messages", "_id", "data")
+        assert not schema.has_columns("message", "_id", "from_me")
+        assert not schema.has_columns("chat")
+
+    def test_supports(self, schema):
+        """Test the requirements of a query"""
+        assert schema.supports({"message": ("_id",), "message_media": ()})
+        assert not schema.supports({"message": ("_id",), "chat": ()})
+
+    def test_transcription_selection(self, schema):
+        """Test the transcription selection based on the schema"""
+        assert get_transcription_selection(schema) == "message_media.raw_transcription_text AS transcription_text"
+        assert get_transcription_selection(SchemaProfile({})) == "NULL AS transcription_text"
+
+
+class TestPartitions:
+    def test_balance_partitions(self):
+        """Test that chats are spread so that each partition has about the same number of messages"""
+        counts = [((1,), 100), ((2,), 60), ((3,), 50), ((4,), 10), ((5,), 5)]
+        partitions = balance_partitions(counts, 2)
+        assert partitions == [[1, 4, 5], [2, 3]]
+        assert sorted(key for partition in partitions for key in partition) == [1, 2, 3, 4, 5]
+
+    def test_fewer_chats_than_partitions(self):
+        """Test that empty partitions are dropped"""
+        assert balance_partitions([(("a@s.whatsapp.net",), 3)], 4) == [["a@s.whatsapp.net"]]
+        assert balance_partitions([], 4) == []
+
+    def test_group_chat_counts(self):
+        """Test that chats exported as the same chat stay in the same partition"""
+        counts = group_chat_counts([(1, 10, 5), (2, 20, 60), (3, 10, 50), (None, 30, 1)])
+        assert counts == [((1, 3), 55), ((2,), 60)]
+        assert balance_partitions(counts, 2) == [[2], [1, 3]]
+
+    def test_partition_condition(self):
+        """Test the SQL condition of a partition"""
+        assert get_partition_condition("message.chat_row_id", None) == ""
+        assert get_partition_condition("message.chat_row_id", [1, 2]) == "AND message.chat_row_id IN (1, 2)"
+        assert get_partition_condition("messages.key_remote_jid", ["a'b@g.us"]) == \
+            "AND messages.key_remote_jid IN ('a''b@g.us')"
+
+
+class TestFetchRows:
+    @pytest.fixture
+    def cursor(self):
+        db = sqlite3.connect(":memory:")
+        db.execute("CREATE TABLE message (_id INTEGER PRIMARY KEY, text_data TEXT)")
+        db.executemany("INSERT INTO message VALUES (?, ?)", [(i, f"ok{i}") for i in range(8)])
+        db.execute("UPDATE message SET text_data = CAST(X'6F6BFF' AS TEXT) WHERE _id = 4")
+        yield db.execute("SELECT _id, text_data FROM message ORDER BY _id")
+        db.close()
+
+    @pytest.mark.parametrize("batch_size", [3, 6, 100])
+    def test_undecodable_row_in_batch(self, cursor, batch_size):
+        """Test that a row with invalid UTF-8 is decoded leniently without losing the other rows"""
+        batches = list(fetch_rows(cursor, batch_size))
+        rows = [row for batch in batches for row in batch]
+        assert rows == [(i, "ok�" if i == 4 else f"ok{i}") for i in range(8)]
+        assert all(batch and None not in batch for batch in batches)
+        assert cursor.connection.text_factory is str
+
+    def test_lenient_before_311(self, cursor):
+        """Test that text is decoded leniently up front where the cursor cannot retry a row"""
+        with patch("Whatsapp_Chat_Exporter.utility.sys.version_info", (3, 10)):
+            rows = [row for batch in fetch_rows(cursor, 3) for row in batch]
+        assert rows == [(i, "ok�" if i == 4 else f"ok{i}") for i in range(8)]
+
+
+class TestWriteJsonAtomic:
+    def test_write(self, tmp_path):
+        """Test that the file is replaced with the new content"""
+        path = tmp_path / "state.json"
+        write_json_atomic(str(path), {"a": 1})
+        write_json_atomic(str(path), {"a": 2})
+        assert json.loads(path.read_text(encoding="utf-8")) == {"a": 2}
+        assert os.listdir(tmp_path) == ["state.json"]
+
+    def test_failure_keeps_previous_file(self, tmp_path):
+        """Test that a failing dump neither leaves a temporary file nor touches the previous file"""
+        path = tmp_path / "state.json"
+        write_json_atomic(str(path), {"a": 1})
+        with pytest.raises(TypeError):
+            write_json_atomic(str(path), {"a": object()})
+        assert json.loads(path.read_text(encoding="utf-8")) == {"a": 1}
+        assert os.listdir(tmp_path) == ["state.json"]